@@ -7,6 +7,9 @@ from enum import Enum
 from commons.communication_buffer import CommunicationBuffer
 from commons.protocol import AnnounceMessage, MessageType, ResultACKMessage
 
+# zlib level of the messages sent to the server, the flights have all the columns of the dataset and compress ~70%
+COMPRESSION_LEVEL = 1
+
 
 class ProtocolConnectionConfig:
     def __init__(self, server_ip, server_port, client_id):
@@ -51,7 +54,9 @@ class ProtocolConnection:
                 logging.debug("Connecting to server...")
                 self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                 self.sock.connect((self.config.server_ip, self.config.server_port))
-                self.buff = CommunicationBuffer(self.sock)
+                self.buff = CommunicationBuffer(
+                    self.sock, compression_level=COMPRESSION_LEVEL
+                )
                 self.__send_announce()
                 connected = True
             except Exception as e:
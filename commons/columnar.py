@@ -0,0 +1,240 @@
+import itertools
+from enum import Enum
+
+from commons.message_utils import MessageBytesReader, MessageBytesWriter
+
+
+class ColumnType(Enum):
+    STRING = 0
+    FLOAT64 = 1
+    DICTIONARY = 2
+
+
+# Max number of distinct values of a dictionary column, so its codes take at most 2 bytes
+MAX_DICTIONARY_SIZE = 2**16
+
+
+def encode_columns(rows, fields):
+    """
+    Encodes the fields of the rows in the columnar format:
+
+        0            4               6          N
+        | rows_count | columns_count | column_1 | ... | column_n |
+
+    Each column has the values of a field for all the rows:
+
+        0      1           5      N
+        | type | data_size | data |
+
+    - STRING: | offset_size (1) | offsets of the values ((rows_count + 1) * offset_size) | utf-8 values |
+    The offsets take 2 bytes if the values take less than 64KB, 4 bytes otherwise.
+    - FLOAT64: | values (rows_count * 8) |
+    - DICTIONARY: | dictionary_size (4) | dictionary (STRING data) | code_size (1) | codes (rows_count * code_size) |
+    Used for the string columns with repeated values, like the airport codes, each value is sent once
+    and the rows have its position in the dictionary.
+
+    The columns are in the order of the fields and they are read by position, like the fields of the text format.
+    A column is FLOAT64 only if the text of all its values stays the same after converting them to float,
+    so the rows serialized back to text do not change, and the values are decoded back to that text.
+    """
+    writer = MessageBytesWriter()
+    writer.write_int(len(rows), 4)
+    writer.write_int(len(fields), 2)
+
+    for field in fields:
+        values = [row[field] for row in rows]
+        floats = as_floats(values)
+        if floats is not None:
+            writer.write_int(ColumnType.FLOAT64.value, 1)
+            writer.write_int(8 * len(floats), 4)
+            writer.write_multiple_float(floats)
+            continue
+
+        values = [value if isinstance(value, str) else str(value) for value in values]
+        codes = as_codes(values)
+        if codes is not None:
+            dictionary, codes = codes
+            dictionary_data = encode_strings(dictionary)
+            code_size = 1 if len(dictionary) <= 2**8 else 2
+            writer.write_int(ColumnType.DICTIONARY.value, 1)
+            writer.write_int(4 + len(dictionary_data) + 1 + code_size * len(codes), 4)
+            writer.write_int(len(dictionary), 4)
+            writer.write(dictionary_data)
+            writer.write_int(code_size, 1)
+            writer.write_multiple_int(codes, code_size)
+            continue
+
+        data = encode_strings(values)
+        writer.write_int(ColumnType.STRING.value, 1)
+        writer.write_int(len(data), 4)
+        writer.write(data)
+
+    return writer.get_bytes()
+
+
+def encode_strings(values):
+    """
+    Returns the data of a STRING column with the values
+    """
+    text = "".join(values)
+    if text.isascii():
+        # Each character is a byte, so the lengths of the strings are the lengths of their bytes
+        encoded_text = text.encode("ascii")
+        lengths = map(len, values)
+    else:
+        encoded_values = [value.encode("utf-8") for value in values]
+        encoded_text = b"".join(encoded_values)
+        lengths = map(len, encoded_values)
+    offsets = [0, *itertools.accumulate(lengths)]
+    offset_size = 2 if len(encoded_text) < 2**16 else 4
+
+    writer = MessageBytesWriter()
+    writer.write_int(offset_size, 1)
+    writer.write_multiple_int(offsets, offset_size)
+    writer.write(encoded_text)
+    return writer.get_bytes()
+
+
+def as_codes(values):
+    """
+    Returns the dictionary of the values and the code of each value if at least half of them are repeated,
+    None otherwise
+    """
+    # {value: code}
+    dictionary = {}
+    max_size = min(len(values) // 2, MAX_DICTIONARY_SIZE)
+    codes = []
+    for value in values:
+        code = dictionary.get(value)
+        if code is None:
+            if len(dictionary) >= max_size:
+                return None
+            code = dictionary[value] = len(dictionary)
+        codes.append(code)
+    return list(dictionary), codes
+
+
+def as_floats(values):
+    """
+    Returns the values as floats if their text does not change, None otherwise
+    """
+    if values and isinstance(values[0], str) and not values[0][:1].isdigit():
+        # Most text columns are discarded by their first value
+        return None
+
+    floats = []
+    for value in values:
+        if isinstance(value, float):
+            floats.append(value)
+            continue
+        if not isinstance(value, str):
+            return None
+        try:
+            number = float(value)
+        except ValueError:
+            return None
+        if repr(number) != value:
+            return None
+        floats.append(number)
+    return floats
+
+
+def columnar_rows_count(payload):
+    """
+    Returns the number of rows of a columnar payload without decoding it
+    """
+    return MessageBytesReader(payload).read_int(4)
+
+
+class ColumnarPayload:
+    """
+    Payload in the columnar format, decoded lazily: a column is only decoded when it is accessed.
+
+    The values of all the columns are decoded as str, like the ones of the text format, so the processors
+    get the same rows whatever the format of the payload. A FLOAT64 column is decoded to the text its values
+    were encoded from.
+    """
+
+    def __init__(self, payload):
+        reader = MessageBytesReader(payload)
+        self.rows_count = reader.read_int(4)
+        columns_count = reader.read_int(2)
+
+        # [(ColumnType, data)] the data is a view of the payload, it is not copied
+        self.columns_data = []
+        for _ in range(columns_count):
+            column_type = ColumnType(reader.read_int(1))
+            size = reader.read_int(4)
+            self.columns_data.append((column_type, reader.read(size)))
+
+        # {column_index: values} of the columns already decoded
+        self.columns = {}
+
+    def column(self, index):
+        """
+        Returns the values of the column in the position
+        """
+        if index not in self.columns:
+            self.columns[index] = self.decode_column(*self.columns_data[index])
+        return self.columns[index]
+
+    def decode_column(self, column_type, data):
+        reader = MessageBytesReader(data)
+        if column_type == ColumnType.FLOAT64:
+            # The text of the values is the repr of their floats, see `as_floats`
+            return list(map(repr, reader.read_multiple_float(self.rows_count)))
+
+        if column_type == ColumnType.DICTIONARY:
+            dictionary_size = reader.read_int(4)
+            dictionary = self.decode_strings(reader, dictionary_size)
+            code_size = reader.read_int(1)
+            codes = reader.read_multiple_int(code_size, self.rows_count)
+            # The rows with the same value share the same str, so its hash is computed only once
+            return [dictionary[code] for code in codes]
+
+        return self.decode_strings(reader, self.rows_count)
+
+    def decode_strings(self, reader, count):
+        offset_size = reader.read_int(1)
+        offsets = reader.read_multiple_int(offset_size, count + 1)
+        values = reader.read(offsets[-1])
+        text = str(values, "utf-8")
+        if len(text) != len(values):
+            # The offsets are in bytes, so with multibyte characters each value is decoded by itself
+            return [
+                str(values[start:end], "utf-8")
+                for start, end in zip(offsets, offsets[1:])
+            ]
+        return [text[start:end] for start, end in zip(offsets, offsets[1:])]
+
+    def rows(self, fields):
+        """
+        Returns the rows as dicts with the given fields, only the columns of those fields are decoded
+        """
+        fields = fields[: len(self.columns_data)]
+        if not fields:
+            return [{} for _ in range(self.rows_count)]
+
+        columns = [self.column(index) for index in range(len(fields))]
+        return [dict(zip(fields, values)) for values in zip(*columns)]
+
+    def project(self, positions):
+        """
+        Returns a columnar payload with the columns in the positions, copying their bytes without decoding them
+        """
+        writer = MessageBytesWriter()
+        writer.write_int(self.rows_count, 4)
+        writer.write_int(len(positions), 2)
+        for position in positions:
+            column_type, data = self.columns_data[position]
+            writer.write_int(column_type.value, 1)
+            writer.write_int(len(data), 4)
+            writer.write(data)
+        return writer.get_bytes()
+
+    def lines(self, delimiter=","):
+        """
+        Returns the rows as lines of text, like the ones of the text format
+        """
+        columns = [self.column(index) for index in range(len(self.columns_data))]
+        return [delimiter.join(values) for values in zip(*columns)]
@@ -0,0 +1,202 @@
+import pytest
+
+from commons import columnar
+from commons.columnar import (
+    ColumnarPayload,
+    ColumnType,
+    columnar_rows_count,
+    encode_columns,
+)
+from commons.message_utils import MessageBytesReader
+
+FIELDS = ["legId", "startingAirport", "totalFare", "travelDuration"]
+
+
+def column_types(payload):
+    return [column_type for column_type, _ in ColumnarPayload(payload).columns_data]
+
+
+def round_trip(rows, fields):
+    return ColumnarPayload(encode_columns(rows, fields)).rows(fields)
+
+
+def test_rows_round_trip():
+    rows = [
+        {"legId": "a1", "startingAirport": "ATL", "totalFare": "120.5"},
+        {"legId": "b2", "startingAirport": "BOS", "totalFare": "99.0"},
+        {"legId": "c3", "startingAirport": "ATL", "totalFare": "3.25"},
+    ]
+    fields = ["legId", "startingAirport", "totalFare"]
+    payload = encode_columns(rows, fields)
+
+    assert columnar_rows_count(payload) == 3
+    assert column_types(payload) == [
+        ColumnType.STRING,
+        ColumnType.STRING,
+        ColumnType.FLOAT64,
+    ]
+    assert ColumnarPayload(payload).rows(fields) == rows
+
+
+def test_float_columns_are_decoded_as_text():
+    rows = [{"value": value} for value in ["1.5", "nan", "inf", "2.0", "-3.75"]]
+    payload = encode_columns(rows, ["value"])
+
+    assert column_types(payload) == [ColumnType.FLOAT64]
+    decoded = ColumnarPayload(payload).rows(["value"])
+    # Like the values of the text format
+    assert decoded == rows
+    assert all(isinstance(row["value"], str) for row in decoded)
+
+
+def test_floats_are_encoded_as_their_text():
+    rows = [{"value": 1.5}, {"value": 2.0}]
+    assert round_trip(rows, ["value"]) == [{"value": "1.5"}, {"value": "2.0"}]
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        # The text would change converted to float and back
+        ["1", "2"],
+        ["1.50", "2.0"],
+        ["1e16", "2.0"],
+        # Not numbers
+        ["1.5", ""],
+        ["1.5", "abc"],
+        ["nan", "1.5"],
+    ],
+)
+def test_columns_that_are_not_floats_keep_their_text(values):
+    rows = [{"value": value} for value in values]
+    payload = encode_columns(rows, ["value"])
+
+    assert ColumnType.FLOAT64 not in column_types(payload)
+    assert ColumnarPayload(payload).rows(["value"]) == rows
+
+
+def test_non_ascii_and_empty_strings():
+    rows = [
+        {"city": "São Paulo", "code": ""},
+        {"city": "", "code": "GRU"},
+        {"city": "Zürich 😀", "code": "ZRH"},
+        {"city": "Boston", "code": "BOS"},
+    ]
+    assert round_trip(rows, ["city", "code"]) == rows
+
+
+def test_long_strings_use_bigger_offsets():
+    rows = [{"value": str(index) * 7000} for index in range(10)]
+    assert round_trip(rows, ["value"]) == rows
+
+
+def test_empty_payload():
+    payload = encode_columns([], FIELDS)
+    assert columnar_rows_count(payload) == 0
+    assert ColumnarPayload(payload).rows(FIELDS) == []
+    assert ColumnarPayload(payload).lines() == []
+
+
+def test_rows_with_fewer_fields():
+    rows = [{"a": "x", "b": "1.5"}, {"a": "y", "b": "2.5"}]
+    payload = ColumnarPayload(encode_columns(rows, ["a", "b"]))
+
+    # The columns are read by position, only the ones of the fields are decoded
+    assert payload.rows(["first"]) == [{"first": "x"}, {"first": "y"}]
+    assert list(payload.columns) == [0]
+    assert payload.rows(["a", "b", "c"]) == rows
+    assert payload.rows([]) == [{}, {}]
+
+
+def test_project():
+    rows = [
+        {
+            "legId": "a1",
+            "startingAirport": "ATL",
+            "totalFare": "120.5",
+            "travelDuration": "PT1H",
+        },
+        {
+            "legId": "b2",
+            "startingAirport": "BOS",
+            "totalFare": "99.0",
+            "travelDuration": "",
+        },
+    ]
+    payload = ColumnarPayload(encode_columns(rows, FIELDS))
+
+    projected = ColumnarPayload(payload.project([2, 0]))
+    assert projected.rows(["totalFare", "legId"]) == [
+        {"totalFare": "120.5", "legId": "a1"},
+        {"totalFare": "99.0", "legId": "b2"},
+    ]
+    # The columns are copied without decoding them
+    assert payload.columns == {}
+
+
+def test_lines():
+    rows = [
+        {"code": "ATL", "fare": "120.5", "city": "Atlanta"},
+        {"code": "GRU", "fare": "nan", "city": "São Paulo"},
+    ]
+    payload = ColumnarPayload(encode_columns(rows, ["code", "fare", "city"]))
+
+    assert payload.lines() == ["ATL,120.5,Atlanta", "GRU,nan,São Paulo"]
+    assert payload.lines(";") == ["ATL;120.5;Atlanta", "GRU;nan;São Paulo"]
+
+
+def dictionary_code_size(payload):
+    columnar_payload = ColumnarPayload(payload)
+    column_type, data = columnar_payload.columns_data[0]
+    assert column_type == ColumnType.DICTIONARY
+    reader = MessageBytesReader(data)
+    columnar_payload.decode_strings(reader, reader.read_int(4))
+    return reader.read_int(1)
+
+
+def test_repeated_values_use_dictionary():
+    rows = [{"airport": airport} for airport in ["ATL", "BOS", "ATL", "ATL", "BOS"]]
+    payload = encode_columns(rows, ["airport"])
+
+    assert dictionary_code_size(payload) == 1
+    assert ColumnarPayload(payload).rows(["airport"]) == rows
+
+
+def test_values_mostly_distinct_do_not_use_dictionary():
+    rows = [{"airport": airport} for airport in ["ATL", "BOS", "JFK", "ATL"]]
+    payload = encode_columns(rows, ["airport"])
+
+    assert column_types(payload) == [ColumnType.STRING]
+    assert ColumnarPayload(payload).rows(["airport"]) == rows
+
+
+@pytest.mark.parametrize("dictionary_size, code_size", [(256, 1), (257, 2)])
+def test_dictionary_code_size(dictionary_size, code_size):
+    rows = [{"airport": f"A{index % dictionary_size}"} for index in range(1000)]
+    payload = encode_columns(rows, ["airport"])
+
+    assert dictionary_code_size(payload) == code_size
+    assert ColumnarPayload(payload).rows(["airport"]) == rows
+
+
+def test_dictionary_too_big_falls_back_to_strings(monkeypatch):
+    monkeypatch.setattr(columnar, "MAX_DICTIONARY_SIZE", 4)
+    rows = [{"airport": f"A{index % 5}"} for index in range(100)]
+    payload = encode_columns(rows, ["airport"])
+
+    assert column_types(payload) == [ColumnType.STRING]
+    assert ColumnarPayload(payload).rows(["airport"]) == rows
+
+    rows = [{"airport": f"A{index % 4}"} for index in range(100)]
+    assert column_types(encode_columns(rows, ["airport"])) == [ColumnType.DICTIONARY]
+
+
+def test_dictionary_max_size():
+    distinct = columnar.MAX_DICTIONARY_SIZE + 1
+    rows = [{"route": f"R{index % distinct}"} for index in range(2 * distinct)]
+    assert column_types(encode_columns(rows, ["route"])) == [ColumnType.STRING]
+
+    rows = [{"route": f"R{index % (distinct - 1)}"} for index in range(2 * distinct)]
+    payload = encode_columns(rows, ["route"])
+    assert dictionary_code_size(payload) == 2
+    assert ColumnarPayload(payload).rows(["route"]) == rows
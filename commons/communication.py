@@ -4,7 +4,13 @@ import pika
 import logging
 from commons.duplicate_catcher import DuplicateCatcher
 from commons.flight_parser import FlightParser
+from commons.logger import FsyncPolicy
+from commons.prefetch_controller import PrefetchController
+from commons.connection_pool import CONNECTION_POOL
+from commons.columnar import ColumnarPayload, encode_columns
 from commons.message import (
+    BundleMessage,
+    CompressedMessage,
     EOFResultMessage,
     Message,
     MessageType,
@@ -12,8 +18,13 @@ from commons.message import (
     EOFDiscoveryMessage,
     EOFAggregationMessage,
     EOFFinishMessage,
+    PayloadFormat,
 )
-from pika.exceptions import ConnectionWrongStateError
+
+# Max number of messages delivered and not acked for each receiver
+PREFETCH_COUNT = 10
+# Seconds between the deletions of the clients added with `delete_client_later`, while no messages arrive
+PENDING_DELETIONS_INTERVAL_S = 1
 
 
 class ACKType(Enum):
@@ -25,44 +36,92 @@ class CommunicationConnection:
     """
     Class to wrap the connection to the RabbitMQ server
 
-    It is not thread safe, so it should be used only by one thread
+    The channels are taken from the `ConnectionPool` of the process, so the receivers and senders of the same
+    thread share the connections to the server. The channels must be used only by the thread that created them.
 
     To use it, first call the `connect` method, then the `channel` method to get a channel to the RabbitMQ server
-    and finally the close method to `close` the connection sending all messages waiting on the buffer
+    and finally the close method to `close` the channels sending all messages waiting on the buffer
     """
 
     def __init__(self, rabbit_host):
         self.rabbit_host = rabbit_host
+        # [(channel, PooledConnection)]
+        self.channels = []
         # reduce log level for pika
         logging.getLogger("pika").setLevel(logging.WARNING)
 
     def connect(self):
         """
         Connects to the RabbitMQ server
+
+        The connection is taken from the pool when each channel is created, so there is nothing to do here
         """
-        self.connection = pika.BlockingConnection(
-            pika.ConnectionParameters(host=self.rabbit_host)
-        )
+        pass
 
-    def channel(self):
+    def channel(self, on_confirm=None, consumer=False):
         """
         Returns a channel to the RabbitMQ server
+
+        ### Optional parameters
+        - on_confirm : function
+            - If set, the publisher confirms are pipelined: `basic_publish` returns without waiting for the broker
+            and `on_confirm` is called with every Ack/Nack frame (which may confirm multiple delivery tags) as they arrive.
+            Use `wait_for` to process the confirms.
+        - consumer : bool
+            - If the channel will be used to consume, so it needs a connection without other consumers.
         """
-        channel = self.connection.channel()
+        channel, pooled = CONNECTION_POOL.acquire(self.rabbit_host, consumer)
+        self.channels.append((channel, pooled))
         # We need to confirm the delivery to ensure the messages are sent
-        channel.confirm_delivery()
+        if on_confirm:
+            # The BlockingChannel only supports waiting the confirm of each publish, so we enable
+            # the confirm mode in the underlying channel to receive the confirms asynchronously.
+            selected = []
+            channel._impl.confirm_delivery(
+                ack_nack_callback=on_confirm, callback=selected.append
+            )
+            self.wait_for(channel, lambda: selected)
+        else:
+            channel.confirm_delivery()
         return channel
 
+    def wait_for(self, channel, predicate):
+        """
+        Processes the I/O of the channel until the predicate returns True
+        """
+        channel._flush_output(predicate)
+
+    def call_later(self, channel, delay, callback):
+        """
+        Calls the callback after `delay` seconds, from the I/O loop of the channel's connection.
+        Returns the timer to be able to cancel it with `remove_timeout`.
+        """
+        return channel.connection.call_later(delay, callback)
+
+    def remove_timeout(self, channel, timer):
+        """
+        Cancels a timer created with `call_later`
+        """
+        channel.connection.remove_timeout(timer)
+
+    def close_channel(self, channel):
+        """
+        Closes one of the channels, the other channels of the connection are kept open
+        """
+        for index, (pooled_channel, pooled) in enumerate(self.channels):
+            if pooled_channel is channel:
+                del self.channels[index]
+                CONNECTION_POOL.release(channel, pooled)
+                return
+
     def close(self):
         """
-        Closes the connection sending all messages waiting on the buffer
+        Closes the channels sending all messages waiting on the buffer
         This should be called always to ensure all messages have been sent
         """
-        try:
-            self.connection.close()
-        except ConnectionWrongStateError:
-            # It means the connection is already closed
-            pass
+        for channel, pooled in self.channels:
+            CONNECTION_POOL.release(channel, pooled)
+        self.channels = []
 
 
 class Communication:
@@ -87,6 +146,9 @@ class Communication:
         # {client_id: [message_id]}
         self.possible_duplicates = self.log_guardian.get_possible_duplicates()
 
+        # Channel to the RabbitMQ server, opened when it is used for the first time
+        self.channel = None
+
     def close(self):
         """
         Closes the connection sending all messages waiting on the buffer
@@ -94,6 +156,14 @@ class Communication:
         """
         self.connection.close()
 
+    def close_channel(self):
+        """
+        Closes only the channel, the connection may be shared with other receivers and senders
+        """
+        if self.channel:
+            self.connection.close_channel(self.channel)
+            self.channel = None
+
 
 class CommunicationReceiverConfig:
     """
@@ -120,6 +190,25 @@ class CommunicationReceiverConfig:
     - load_balancer_send_multiply : int
         If this is set, it means that this communication is in a LoadBalancer, this is important because the LoadBalancer sends multiple messages from 1 message received.
         This is used to count the duplicates correctly. The number is the number of messages sent from 1 message, most likely the number of replicas of the next processor.
+    - ack_batch_size : int
+        The number of protocol messages persisted and acked together. If it is greater than 1, the messages are persisted
+        with one durable write for all the batch and acked with a single ack (multiple=True) after that.
+    - ack_batch_timeout_ms : int
+        The max time in milliseconds a message waits in an incomplete batch before the batch is persisted and acked.
+    - fsync_policy : FsyncPolicy
+        When the messages are persisted and acked, see FsyncPolicy. By default it is ALWAYS if ack_batch_size is 1
+        and BATCH otherwise. With INTERVAL the batch is persisted every ack_batch_timeout_ms.
+    - min_prefetch_count : int
+        The min prefetch window, used only if max_prefetch_count is set.
+    - max_prefetch_count : int
+        If this is set, the prefetch window is adjusted at runtime by a PrefetchController, from the processing latency
+        and the ack rate of the receiver. If not, the prefetch window is fixed.
+    - micro_batch_size : int
+        The max number of protocol deliveries of the same client processed together with one call to the input_callback.
+        Each message keeps its message_id, log records and ack, but they are all persisted in the same ack batch,
+        so the ack_batch_size is raised to at least this size. Only for stateless processors.
+    - micro_batch_timeout_ms : int
+        The max time in milliseconds a delivery waits in an incomplete micro batch before it is processed.
     """
 
     def __init__(
@@ -132,6 +221,14 @@ class CommunicationReceiverConfig:
         delimiter=",",
         use_duplicate_catcher=False,
         load_balancer_send_multiply=None,
+        ack_batch_size=1,
+        ack_batch_timeout_ms=100,
+        min_prefetch_count=1,
+        max_prefetch_count=None,
+        micro_batch_size=1,
+        micro_batch_timeout_ms=20,
+        fsync_policy=None,
+        delete_finished_clients=True,
     ):
         self.input = input
         self.replica_id = replica_id
@@ -141,6 +238,24 @@ class CommunicationReceiverConfig:
         self.delimiter = delimiter
         self.use_duplicate_catcher = use_duplicate_catcher
         self.load_balancer_send_multiply = load_balancer_send_multiply
+        # The messages of a micro batch are persisted together, so they must fit in an ack batch
+        self.ack_batch_size = max(ack_batch_size, micro_batch_size)
+        self.ack_batch_timeout_ms = ack_batch_timeout_ms
+        if fsync_policy is None:
+            fsync_policy = (
+                FsyncPolicy.ALWAYS if self.ack_batch_size == 1 else FsyncPolicy.BATCH
+            )
+        elif fsync_policy == FsyncPolicy.ALWAYS and self.ack_batch_size > 1:
+            raise ValueError(
+                "The ALWAYS fsync policy acks each message by itself, it can not be used with batches"
+            )
+        self.fsync_policy = fsync_policy
+        self.min_prefetch_count = min_prefetch_count
+        self.max_prefetch_count = max_prefetch_count
+        self.micro_batch_size = micro_batch_size
+        self.micro_batch_timeout_ms = micro_batch_timeout_ms
+        # If False, the data of the clients is deleted by other component, with `delete_client_later`
+        self.delete_finished_clients = delete_finished_clients
 
 
 class CommunicationReceiver(Communication):
@@ -160,6 +275,31 @@ class CommunicationReceiver(Communication):
         # {client_id: [DuplicateCatcher]}
         self.duplicate_catchers = {}
 
+        # Clients to delete, added by other threads and deleted before handling the next message
+        self.clients_to_delete = []
+        self.pending_deletions_timer = None
+        # Called with the client_id after the data of a client is deleted
+        self.delete_client_callback = None
+
+        # Delivery tag of the last message of the batch waiting to be persisted and acked
+        self.ack_batch_delivery_tag = None
+        self.ack_batch_count = 0
+        self.ack_batch_timer = None
+        if self.config.fsync_policy != FsyncPolicy.ALWAYS:
+            self.log_guardian.enable_group_commit()
+
+        # [(method, ProtocolMessage)] delivered and waiting to be processed together
+        self.micro_batch = []
+        self.micro_batch_timer = None
+
+        self.prefetch_controller = None
+        if self.config.max_prefetch_count:
+            # We need at least a batch of messages delivered to be able to ack them together
+            self.prefetch_controller = PrefetchController(
+                max(self.config.min_prefetch_count, self.config.ack_batch_size),
+                self.config.max_prefetch_count,
+            )
+
         if self.config.use_duplicate_catcher:
             # Restore duplicate catcher states only if we are using the duplicate catcher
             self.restore_duplicate_catchers()
@@ -179,7 +319,16 @@ class CommunicationReceiver(Communication):
                 duplicate_catcher.is_duplicate(int(message_id))
             self.duplicate_catchers[client_id] = duplicate_catcher
 
-    def bind(self, input_callback, eof_callback, sender=None, input_fields_order=None):
+    def bind(
+        self,
+        input_callback,
+        eof_callback,
+        sender=None,
+        input_fields_order=None,
+        decode_columnar=True,
+        lazy_rows=False,
+        delete_client_callback=None,
+    ):
         """
         Binds the receiver to the input queue or exchange
 
@@ -194,26 +343,51 @@ class CommunicationReceiver(Communication):
             - Sender to be used when the EOF is received. It sincronizes the EOF propagation, getting how many messages have been sent.
         - input_fields_order : list of str
             - List of the input fields in the order they will be received, used to parse the messages
+        - decode_columnar : bool
+            - If False, the payloads in the columnar format are passed to the input_callback as a ColumnarPayload,
+            without decoding their rows
+        - lazy_rows : bool
+            - If True, the rows of the text payloads are LazyRows, split only when a field is accessed and
+            serialized as the received line if they are forwarded. They are read only and not JSON serializable,
+            so they are not used by the statefull processors, which store the rows received.
+        - delete_client_callback : function
+            - Function to be called with the client_id when the data of a finished client is deleted, to delete the data
+            kept outside of the receiver, like its processor
         """
         # We connect here because if we connect in the __init__ it it can be closed by the connection for inactivity
         self.connection.connect()
-        self.channel = self.connection.channel()
+        self.channel = self.connection.channel(consumer=True)
         self.declare_input()
 
         self.input_callback = input_callback
         self.eof_callback = eof_callback
         self.sender = sender
         self.input_fields_order = input_fields_order
+        self.decode_columnar = decode_columnar
+        self.lazy_rows = lazy_rows
+        self.delete_client_callback = delete_client_callback
 
-        self.channel.basic_qos(prefetch_count=10)
+        self.channel.basic_qos(prefetch_count=self.get_prefetch_count())
         self.channel.basic_consume(
             queue=self.input_queue, on_message_callback=self.callback
         )
 
+    def get_prefetch_count(self):
+        """
+        Returns the current prefetch window of the receiver
+        """
+        if self.prefetch_controller:
+            return self.prefetch_controller.prefetch_count
+        # We need at least a batch of messages delivered to be able to ack them together
+        return max(PREFETCH_COUNT, self.config.ack_batch_size)
+
     def start(self):
         """
         Starts the receiver
         """
+        if not self.config.delete_finished_clients:
+            # The clients added by other threads are deleted even if no more messages arrive
+            self.delete_pending_clients_periodically()
         self.channel.start_consuming()
 
     def stop(self):
@@ -221,6 +395,10 @@ class CommunicationReceiver(Communication):
         Stops the receiver
         """
         logging.debug("Stopping receiver")
+        self.persist_ack_batch()
+        if self.pending_deletions_timer:
+            self.connection.remove_timeout(self.channel, self.pending_deletions_timer)
+            self.pending_deletions_timer = None
         self.channel.queue_delete(queue=self.input_queue)
         self.channel.stop_consuming()
 
@@ -228,74 +406,67 @@ class CommunicationReceiver(Communication):
         """
         Callback to be called when a message is received, it calls the input_callback function with the message as parameter
         """
+        self.measure_busy(self.handle_delivery, ch, method, body)
+
+    def measure_busy(self, function, *args):
+        """
+        Calls the function, registering the time it takes in the prefetch controller.
+        All the work from a delivery to its ack is done in the callback or in the timers of the batches.
+        """
+        start_time = time.time()
+        try:
+            return function(*args)
+        finally:
+            if self.prefetch_controller:
+                self.prefetch_controller.time_busy(time.time() - start_time)
+
+    def handle_delivery(self, ch, method, body):
         try:
             message = Message.from_bytes(body)
         except Exception as e:
             logging.exception(f"Error parsing message: {e}")
             return
 
-        if (
+        self.delete_pending_clients()
+
+        is_protocol = (
             message.message_type == MessageType.PROTOCOL
             or message.message_type == MessageType.PROTOCOL_RESULT
-        ):
-            # First we check if it is a duplicate if we are using the duplicate catcher
-            if self.config.use_duplicate_catcher:
-                if self.check_duplicate(message):
-                    logging.debug(
-                        f"Duplicate catcher detected duplicate message {message.message_id}, discarding it"
-                    )
+        )
+        if is_protocol and self.config.micro_batch_size > 1:
+            self.add_to_micro_batch(method, message)
+            return
 
-                    # It is a duplicate, so we send an NACK with requeue=False to delete the message
-                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-                    return
+        # The deliveries waiting in the micro batch were received before this one
+        self.process_micro_batch()
 
-            logging.debug("Received protocol message")
-            self.log_guardian.new_message_received(
-                message.message_id, message.client_id
-            )
+        if message.message_type == MessageType.BUNDLE:
+            self.handle_bundle(ch, method, message)
+            return
 
-            # TODO: Check if this is ok
-            # Check redeliver to see if it is a duplicate
-            # We need to add redelivered messages to the possible_duplicates, because
-            # another replica may have tried to send the ACK but it failed just after sending it,
-            # so the ack is lost and the message is redelivered.
-            if method.redelivered:
-                logging.debug(
-                    f"Message {message.message_id} has been redelivered, adding it to the possible_duplicates"
-                )
-                self.possible_duplicates[
-                    message.client_id
-                ] = self.possible_duplicates.get(message.client_id, []) + [
-                    message.message_id
-                ]
+        if is_protocol:
+            ack_type = self.receive_protocol(message, method.redelivered)
 
-            ack_type = self.handle_protocol(message)
+            if ack_type is None:
+                # It is a duplicate, so we send an NACK with requeue=False to delete the message
+                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+                return
 
             if ack_type == ACKType.NACK:
                 # We requeue the message with a nack
 
-                # TODO: Watch out if for some reason we are using the duplicate catcher, because we can not
-                #       requeue the message with a nack, because it can not be received again.
+                # The message was removed from the duplicate catcher, so it can be received again
                 ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
                 return
 
-            # We add 1 to the messages_received
-            self.messages_received[message.client_id] = (
-                self.messages_received.get(message.client_id, 0) + 1
-            )
-
-            self.log_guardian.store_messages_received(self.messages_received)
-            self.log_guardian.store_possible_duplicates(self.possible_duplicates)
-
-            if self.sender:
-                self.log_guardian.store_messages_sent(self.sender.messages_sent)
-
-            if self.config.use_duplicate_catcher:
-                self.log_guardian.store_new_message_for_duplicate_catcher()
-
-            self.log_guardian.finish_storing_message()
+            if self.config.fsync_policy != FsyncPolicy.ALWAYS:
+                self.add_to_ack_batch(method.delivery_tag)
+                return
+        else:
+            # The EOF handling depends on the messages received, so all of them must be persisted first
+            self.persist_ack_batch()
 
-        elif message.message_type == MessageType.EOF:
+        if message.message_type == MessageType.EOF:
             logging.debug("Received EOF")
             logging.debug("Received {}".format(body))
             ack_type = self.handle_eof(message)
@@ -324,6 +495,12 @@ class CommunicationReceiver(Communication):
             self.eof_callback(message)
             ack_type = ACKType.ACK
 
+        if self.sender:
+            # The EOF handling may have sent messages, they must be confirmed before the ack.
+            # They are not sent by a protocol message, so they are not logged as SENT.
+            self.sender.wait_for_confirms()
+            self.sender.discard_pending_sent()
+
         if ack_type == ACKType.NACK:
             ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
         else:
@@ -333,6 +510,284 @@ class CommunicationReceiver(Communication):
             if message.message_type == MessageType.PROTOCOL:
                 # We only commit the message if it is a protocol message, because the EOF messages are requeued
                 self.log_guardian.commit_message()
+                self.messages_acked(1)
+
+    def receive_protocol(self, message, redelivered):
+        """
+        Processes a protocol message and stores it as processed, without acking it.
+
+        Returns the ACKType to answer the delivery with, or None if the message is a duplicate.
+        """
+        # First we check if it is a duplicate if we are using the duplicate catcher
+        if self.config.use_duplicate_catcher:
+            if self.check_duplicate(message):
+                logging.debug(
+                    f"Duplicate catcher detected duplicate message {message.message_id}, discarding it"
+                )
+                return None
+
+        logging.debug("Received protocol message")
+        self.log_guardian.new_message_received(message.message_id, message.client_id)
+        if self.sender:
+            # Only the messages sent while handling this message are logged as SENT with it
+            self.sender.discard_pending_sent()
+
+        # TODO: Check if this is ok
+        # Check redeliver to see if it is a duplicate
+        # We need to add redelivered messages to the possible_duplicates, because
+        # another replica may have tried to send the ACK but it failed just after sending it,
+        # so the ack is lost and the message is redelivered.
+        if redelivered:
+            logging.debug(
+                f"Message {message.message_id} has been redelivered, adding it to the possible_duplicates"
+            )
+            self.possible_duplicates[
+                message.client_id
+            ] = self.possible_duplicates.get(message.client_id, []) + [
+                message.message_id
+            ]
+
+        ack_type = self.handle_protocol(message)
+
+        if ack_type == ACKType.NACK:
+            # The message is requeued, so it must not be a duplicate when it is received again
+            self.forget_duplicate(message)
+            return ack_type
+
+        if self.sender and self.config.fsync_policy != FsyncPolicy.ALWAYS:
+            # The messages sent are confirmed when the batch is persisted, before that
+            # the records are only kept in memory, so we can already log them as sent.
+            self.sender.log_pending_sent()
+        elif self.sender:
+            # The messages sent must be confirmed before storing the message as processed
+            self.sender.wait_for_confirms()
+            self.sender.log_pending_sent()
+
+        # We add 1 to the messages_received
+        self.messages_received[message.client_id] = (
+            self.messages_received.get(message.client_id, 0) + 1
+        )
+
+        self.log_guardian.store_messages_received(self.messages_received)
+        self.log_guardian.store_possible_duplicates(self.possible_duplicates)
+
+        if self.sender:
+            self.log_guardian.store_messages_sent(self.sender.messages_sent)
+
+        if self.config.use_duplicate_catcher:
+            self.log_guardian.store_new_message_for_duplicate_catcher()
+
+        self.log_guardian.finish_storing_message()
+
+        return ack_type
+
+    def handle_bundle(self, ch, method, bundle):
+        """
+        Handles a bundle of protocol messages coalesced by the sender.
+
+        Each message of the bundle is processed and stored like a single delivery, and the bundle is acked once
+        after all of them, with one commit for all the bundle.
+        """
+        for index, message in enumerate(bundle.messages):
+            payload = message.payload
+            ack_type = self.receive_protocol(message, method.redelivered)
+
+            if ack_type == ACKType.NACK:
+                # The payload was parsed by handle_protocol
+                message.payload = payload
+                if index == 0:
+                    # Nothing was processed, so we can requeue the whole bundle
+                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+                    return
+
+                # The messages already processed can not be requeued, so we send the rest
+                # again to our input queue and ack the bundle
+                self.requeue_bundle(
+                    BundleMessage(bundle.client_id, bundle.messages[index:])
+                )
+                break
+
+        if self.config.fsync_policy != FsyncPolicy.ALWAYS:
+            self.add_to_ack_batch(method.delivery_tag)
+            return
+
+        if self.sender:
+            self.sender.wait_for_confirms()
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        self.log_guardian.commit_message()
+        self.messages_acked(1)
+
+    def requeue_bundle(self, bundle):
+        """
+        Sends the bundle to the input queue of the receiver, to be processed again later
+        """
+        logging.debug(
+            f"Requeueing {len(bundle.messages)} messages of the bundle, not ready to process them"
+        )
+        self.send_requeue(bundle.to_bytes(), "", self.input_queue)
+
+    def add_to_micro_batch(self, method, message):
+        """
+        Adds the delivery to the micro batch. The micro batch is processed when it is full, when a delivery
+        of another client arrives or when the timeout of its first delivery expires.
+        """
+        if self.micro_batch and self.micro_batch[0][1].client_id != message.client_id:
+            self.process_micro_batch()
+
+        self.micro_batch.append((method, message))
+
+        if len(self.micro_batch) >= self.config.micro_batch_size:
+            self.process_micro_batch()
+        elif not self.micro_batch_timer:
+            self.micro_batch_timer = self.connection.call_later(
+                self.channel,
+                self.config.micro_batch_timeout_ms / 1000,
+                lambda: self.measure_busy(self.process_micro_batch),
+            )
+
+    def process_micro_batch(self):
+        """
+        Processes the deliveries of the micro batch with one call to the input_callback, as a BundleMessage.
+
+        Then each message is logged and stored as processed like a single delivery, with the SENT record only
+        if the input_callback sent messages with its message_id, and added to the ack batch.
+        """
+        if self.micro_batch_timer:
+            self.connection.remove_timeout(self.channel, self.micro_batch_timer)
+            self.micro_batch_timer = None
+
+        deliveries = []
+        for method, message in self.micro_batch:
+            if self.config.use_duplicate_catcher and self.check_duplicate(message):
+                logging.debug(
+                    f"Duplicate catcher detected duplicate message {message.message_id}, discarding it"
+                )
+                self.channel.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+                continue
+            deliveries.append((method, message))
+        self.micro_batch = []
+
+        if not deliveries:
+            return
+
+        client_id = deliveries[0][1].client_id
+        messages = [message for _, message in deliveries]
+        if self.sender:
+            # The SENT records must follow the START record of each message, so they are logged below
+            self.sender.discard_pending_sent()
+            self.sender.defer_sent_log = True
+        try:
+            ack_type = self.handle_protocol(BundleMessage(client_id, messages))
+        finally:
+            if self.sender:
+                self.sender.defer_sent_log = False
+
+        if ack_type == ACKType.NACK:
+            for method, message in deliveries:
+                self.forget_duplicate(message)
+                self.channel.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            return
+
+        # The messages sent are confirmed when the batch is persisted
+        sent_by_message_id = {}
+        messages_sent = {}
+        if self.sender:
+            sent_by_message_id = self.sender.pop_sent_by_message_id()
+            # The state stored with each message only counts the messages sent up to it
+            messages_sent = dict(self.sender.messages_sent)
+            messages_sent[client_id] = messages_sent.get(client_id, 0) - sum(
+                sent_by_message_id.values()
+            )
+
+        for method, message in deliveries:
+            self.log_guardian.new_message_received(message.message_id, client_id)
+
+            if method.redelivered:
+                logging.debug(
+                    f"Message {message.message_id} has been redelivered, adding it to the possible_duplicates"
+                )
+                self.possible_duplicates[client_id] = self.possible_duplicates.get(
+                    client_id, []
+                ) + [message.message_id]
+
+            if message.message_id in sent_by_message_id:
+                self.log_guardian.message_sent()
+                messages_sent[client_id] += sent_by_message_id[message.message_id]
+
+            self.messages_received[client_id] = (
+                self.messages_received.get(client_id, 0) + 1
+            )
+
+            self.log_guardian.store_messages_received(self.messages_received)
+            self.log_guardian.store_possible_duplicates(self.possible_duplicates)
+
+            if self.sender:
+                self.log_guardian.store_messages_sent(messages_sent)
+
+            if self.config.use_duplicate_catcher:
+                self.log_guardian.store_new_message_for_duplicate_catcher()
+
+            self.log_guardian.finish_storing_message()
+
+            self.add_to_ack_batch(method.delivery_tag)
+
+    def add_to_ack_batch(self, delivery_tag):
+        """
+        Adds the message to the batch of messages to persist and ack together.
+        The batch is persisted when it is full (only with the BATCH fsync policy) or when the timeout
+        of its first message expires.
+        """
+        self.ack_batch_delivery_tag = delivery_tag
+        self.ack_batch_count += 1
+
+        if (
+            self.config.fsync_policy == FsyncPolicy.BATCH
+            and self.ack_batch_count >= self.config.ack_batch_size
+        ):
+            self.persist_ack_batch()
+        elif not self.ack_batch_timer:
+            self.ack_batch_timer = self.connection.call_later(
+                self.channel,
+                self.config.ack_batch_timeout_ms / 1000,
+                lambda: self.measure_busy(self.persist_ack_batch),
+            )
+
+    def persist_ack_batch(self):
+        """
+        Persists the batch of messages with one durable write, acks all of them with a single ack and commits them.
+
+        If we crash before the commit, all the messages of the batch are restored as possible duplicates.
+        """
+        if self.ack_batch_timer:
+            self.connection.remove_timeout(self.channel, self.ack_batch_timer)
+            self.ack_batch_timer = None
+
+        if self.ack_batch_delivery_tag is None:
+            return
+
+        if self.sender:
+            # The messages sent must be confirmed before persisting the messages as processed
+            self.sender.wait_for_confirms()
+
+        self.log_guardian.persist_batch()
+        self.channel.basic_ack(delivery_tag=self.ack_batch_delivery_tag, multiple=True)
+        # The commit of the last message commits all the messages of the batch
+        self.log_guardian.commit_message()
+
+        self.messages_acked(self.ack_batch_count)
+        self.ack_batch_delivery_tag = None
+        self.ack_batch_count = 0
+
+    def messages_acked(self, count):
+        """
+        Registers the messages acked in the prefetch controller, and updates the prefetch window if needed
+        """
+        if not self.prefetch_controller:
+            return
+        self.prefetch_controller.messages_acked(count)
+        new_prefetch_count = self.prefetch_controller.adjust()
+        if new_prefetch_count:
+            self.channel.basic_qos(prefetch_count=new_prefetch_count)
 
     def check_duplicate(self, message):
         """
@@ -345,21 +800,27 @@ class CommunicationReceiver(Communication):
 
         return duplicate_catcher.is_duplicate(message.message_id)
 
+    def forget_duplicate(self, message):
+        """
+        Removes the message from the duplicate catcher, when it is requeued without being processed
+        """
+        if (
+            self.config.use_duplicate_catcher
+            and message.client_id in self.duplicate_catchers
+        ):
+            self.duplicate_catchers[message.client_id].forget(message.message_id)
+
     def handle_protocol(self, message):
         """
         Handles the protocol message, calling the input_callback function
         """
         start_time = time.time()
 
-        message.payload = message.payload.rstrip().split("\n")
-        if self.input_fields_order:
-            messages_parsed = [
-                self.parser.parse(message, self.input_fields_order)
-                for message in message.payload
-            ]
-            message.payload = messages_parsed
-
-        logging.debug("Received message_id {}".format(message.message_id))
+        if message.message_type == MessageType.BUNDLE:
+            for bundle_message in message.messages:
+                self.parse_payload(bundle_message)
+        else:
+            self.parse_payload(message)
 
         try:
             not_ready = self.input_callback(message)
@@ -370,9 +831,38 @@ class CommunicationReceiver(Communication):
         except Exception as e:
             logging.exception(f"Error processing message in input_callback: {e}")
 
-        logging.debug("Processed in {} seconds".format(time.time() - start_time))
+        latency = time.time() - start_time
+        logging.debug("Processed in {} seconds".format(latency))
         return ACKType.ACK
 
+    def parse_payload(self, message):
+        """
+        Splits the payload of the message in lines, and parses them if the input fields order is set
+        """
+        if message.payload_format == PayloadFormat.COLUMNAR:
+            # Only the columns of the input fields are decoded
+            payload = ColumnarPayload(message.payload)
+            if not self.decode_columnar:
+                message.payload = payload
+            elif self.input_fields_order:
+                message.payload = payload.rows(self.input_fields_order)
+            else:
+                message.payload = payload.lines()
+        else:
+            message.payload = message.payload.rstrip().split("\n")
+            if self.input_fields_order and self.lazy_rows:
+                message.payload = self.parser.parse_lazy(
+                    message.payload, self.input_fields_order
+                )
+            elif self.input_fields_order:
+                messages_parsed = [
+                    self.parser.parse(message, self.input_fields_order)
+                    for message in message.payload
+                ]
+                message.payload = messages_parsed
+
+        logging.debug("Received message_id {}".format(message.message_id))
+
     def handle_eof(self, message):
         # We convert the EOF to a EOFDiscoveryMessage to be able to handle it in the same way
         eof_message = EOFDiscoveryMessage(
@@ -556,12 +1046,53 @@ class CommunicationReceiver(Communication):
             # We are in a topic exchange, so we execute the eof_callback
             self.eof_callback(message.client_id)
 
-        # TODO: Here we should delete all the data related to the client_id and then save
-        #       Watch out that if there are multiple EOF at the same time, they may never end, see if we can solve it
-        #       Maybe if we search for the client_id when we receive a any EOF message and if it is not found we assume it is finished
+        if self.config.delete_finished_clients:
+            # This replica will not receive more messages of the client, and its EOF was already handled
+            self.delete_client(message.client_id)
 
         return ACKType.ACK
 
+    def delete_client(self, client_id):
+        """
+        Deletes all the data of a finished client: its counts of messages received and sent, its possible duplicates,
+        its duplicate catcher and its logs. Then the delete_client_callback is called with it.
+
+        The data is deleted from the state saved with the next messages too, so it does not grow with the clients.
+        """
+        logging.debug(f"Deleting the data of client {client_id}")
+        self.messages_received.pop(client_id, None)
+        self.possible_duplicates.pop(client_id, None)
+        self.duplicate_catchers.pop(client_id, None)
+        if self.sender:
+            self.sender.delete_client(client_id)
+        self.log_guardian.delete_client(client_id)
+
+        if self.delete_client_callback:
+            self.delete_client_callback(client_id)
+
+    def delete_client_later(self, client_id):
+        """
+        Deletes the data of the client before handling the next message, or after PENDING_DELETIONS_INTERVAL_S
+        seconds if no message arrives, from the thread of the receiver.
+        It can be called from other threads.
+        """
+        self.clients_to_delete.append(client_id)
+
+    def delete_pending_clients(self):
+        while self.clients_to_delete:
+            self.delete_client(self.clients_to_delete.pop())
+
+    def delete_pending_clients_periodically(self):
+        """
+        Deletes the pending clients now and every PENDING_DELETIONS_INTERVAL_S seconds, from the thread of the receiver
+        """
+        self.delete_pending_clients()
+        self.pending_deletions_timer = self.connection.call_later(
+            self.channel,
+            PENDING_DELETIONS_INTERVAL_S,
+            self.delete_pending_clients_periodically,
+        )
+
     def update_discovery_eof(self, message):
         """
         Updates the Discovery EOF message with the new data
@@ -727,11 +1258,49 @@ class CommunicationSenderConfig:
     ### Optional attributes
     - delimiter : str
         The delimiter used to parse the messages
+    - confirm_window : int
+        The max number of publishes waiting for the broker confirm. If it is 1, every publish waits for its confirm.
+        If it is greater, the publishes are pipelined and the confirms are resolved as they arrive, the sender only
+        blocks when the window is full or when `wait_for_confirms` is called (before acking the message received).
+    - coalesce_max_rows : int
+        If this is set, the protocol messages for the same client and destination are coalesced and sent together
+        in a BundleMessage when they reach this number of rows, `coalesce_max_bytes` bytes of payload or
+        after `coalesce_timeout_ms` milliseconds. Each message keeps its message_id inside the bundle.
+        The bundle is also sent when `wait_for_confirms` is called, so the messages are coalesced across the deliveries
+        received only if the receiver acks them in batches (BATCH or INTERVAL fsync policy).
+    - coalesce_max_bytes : int
+        The max payload bytes of a bundle, used only if coalesce_max_rows is set.
+    - coalesce_timeout_ms : int
+        The max time in milliseconds a message waits in a bundle before it is sent, used only if coalesce_max_rows is set.
+    - payload_format : PayloadFormat
+        The format of the payload of the protocol messages sent with output fields. With COLUMNAR the receivers decode
+        only the columns of their input fields, without splitting and parsing the text of each row.
+        The results (ProtocolResultMessage) are always sent as text.
+    - compression_level : int
+        If set, the messages are compressed with zlib with this level (1-9), except the small ones.
+        The receivers decompress them transparently, so it is enabled only in the senders of the stages
+        where the CPU cost pays off in network and broker disk I/O.
     """
 
-    def __init__(self, output, delimiter=","):
+    def __init__(
+        self,
+        output,
+        delimiter=",",
+        confirm_window=1,
+        coalesce_max_rows=None,
+        coalesce_max_bytes=65536,
+        coalesce_timeout_ms=100,
+        payload_format=PayloadFormat.TEXT,
+        compression_level=None,
+    ):
         self.output = output
         self.delimiter = delimiter
+        self.confirm_window = confirm_window
+        self.coalesce_max_rows = coalesce_max_rows
+        self.coalesce_max_bytes = coalesce_max_bytes
+        self.coalesce_timeout_ms = coalesce_timeout_ms
+        self.payload_format = payload_format
+        self.compression_level = compression_level
 
 
 class CommunicationSender(Communication):
@@ -746,11 +1315,32 @@ class CommunicationSender(Communication):
         # {client_id: messages_sent}
         self.messages_sent = self.log_guardian.get_messages_sent()
 
+        # {delivery_tag: (exchange, routing_key, body)}
+        self.unconfirmed = {}
+        self.nacked = []
+        self.last_delivery_tag = 0
+        self.sent_pending_confirm = False
+        # {message_id: messages sent} since the messages sent were last logged
+        self.sent_by_message_id = {}
+        # While set, the messages sent are not logged on confirm, the caller logs them with `pop_sent_by_message_id`
+        self.defer_sent_log = False
+
+        # {(exchange, routing_key, client_id): (BundleMessage, rows, payload_bytes)}
+        self.coalesced = {}
+        self.coalesce_timer = None
+
     def activate(self):
         if not self.active:
             # We connect here because if we connect in the __init__ it it can be closed by the connection for inactivity
             self.connection.connect()
-            self.channel = self.connection.channel()
+            # A new channel numbers its publishes from 1 again
+            self.unconfirmed = {}
+            self.nacked = []
+            self.last_delivery_tag = 0
+            if self.config.confirm_window > 1:
+                self.channel = self.connection.channel(on_confirm=self.on_confirm)
+            else:
+                self.channel = self.connection.channel()
             self.declare_output()
             self.active = True
 
@@ -758,22 +1348,39 @@ class CommunicationSender(Communication):
         """
         Sends a batch of messages to the output
         """
-        if output_fields_order:
-            messages_serialized = [
-                self.parser.serialize(message, output_fields_order)
-                for message in messages.payload
-            ]
-            messages.payload = messages_serialized
-        messages.payload = "\n".join(messages.payload)
+        if messages.payload_format == PayloadFormat.COLUMNAR:
+            # The payload is already encoded
+            pass
+        elif (
+            output_fields_order
+            and self.config.payload_format == PayloadFormat.COLUMNAR
+            and messages.message_type == MessageType.PROTOCOL
+        ):
+            messages.payload = encode_columns(messages.payload, output_fields_order)
+            messages.payload_format = PayloadFormat.COLUMNAR
+        else:
+            if output_fields_order:
+                messages_serialized = [
+                    self.parser.serialize(message, output_fields_order)
+                    for message in messages.payload
+                ]
+                messages.payload = messages_serialized
+            messages.payload = "\n".join(messages.payload)
 
         self.send(messages, routing_key)
 
         self.messages_sent[messages.client_id] = (
             self.messages_sent.get(messages.client_id, 0) + 1
         )
+        if self.defer_sent_log:
+            self.sent_by_message_id[messages.message_id] = (
+                self.sent_by_message_id.get(messages.message_id, 0) + 1
+            )
 
-        # Log the messages sent
-        self.log_guardian.message_sent()
+        # Log the messages sent, this is done only after the broker confirmed them
+        self.sent_pending_confirm = True
+        if self.config.confirm_window <= 1 and not self.config.coalesce_max_rows:
+            self.wait_for_confirms()
 
     def send(self, message, routing_key=""):
         """
@@ -783,14 +1390,160 @@ class CommunicationSender(Communication):
 
     def send_to(self, message, exchange, routing_key):
         self.activate()
+        if self.config.coalesce_max_rows and (
+            message.message_type == MessageType.PROTOCOL
+            or message.message_type == MessageType.PROTOCOL_RESULT
+        ):
+            self.coalesce(message, exchange, routing_key)
+            return
+
+        # The messages coalesced are sent first, to keep them before the EOF
+        self.flush_coalesced()
+        self.publish(
+            exchange,
+            routing_key,
+            CompressedMessage.compress(message, self.config.compression_level),
+        )
+
+    def coalesce(self, message, exchange, routing_key):
+        """
+        Adds the message to the bundle of its client and destination, and sends the bundle if it is full
+        """
+        key = (exchange, routing_key, message.client_id)
+        bundle, rows, payload_bytes = self.coalesced.get(
+            key, (BundleMessage(message.client_id, []), 0, 0)
+        )
+        bundle.messages.append(message)
+        rows += message.rows_count()
+        # The text payloads are measured encoded, as they are sent
+        payload = message.payload
+        payload_bytes += len(
+            payload.encode("utf-8") if isinstance(payload, str) else payload
+        )
+        self.coalesced[key] = (bundle, rows, payload_bytes)
+
+        if (
+            rows >= self.config.coalesce_max_rows
+            or payload_bytes >= self.config.coalesce_max_bytes
+        ):
+            self.flush_coalesced(key)
+        elif not self.coalesce_timer:
+            self.coalesce_timer = self.connection.call_later(
+                self.channel,
+                self.config.coalesce_timeout_ms / 1000,
+                self.flush_coalesced,
+            )
+
+    def flush_coalesced(self, key=None):
+        """
+        Sends the bundle of the key, or all the bundles if no key is given
+        """
+        keys = [key] if key else list(self.coalesced)
+        for key in keys:
+            bundle, _, _ = self.coalesced.pop(key)
+            exchange, routing_key, _ = key
+            # A single message is sent as it is, without the bundle
+            message = bundle.messages[0] if len(bundle.messages) == 1 else bundle
+            self.publish(
+                exchange,
+                routing_key,
+                CompressedMessage.compress(message, self.config.compression_level),
+            )
+
+        if not self.coalesced and self.coalesce_timer:
+            self.connection.remove_timeout(self.channel, self.coalesce_timer)
+            self.coalesce_timer = None
+
+    def publish(self, exchange, routing_key, body):
         self.channel.basic_publish(
             exchange=exchange,
             routing_key=routing_key,
-            body=message.to_bytes(),
+            body=body,
             properties=pika.BasicProperties(
                 delivery_mode=pika.DeliveryMode.Persistent,
             ),
         )
+        if self.config.confirm_window > 1:
+            # The delivery tags of a channel in confirm mode are consecutive, starting from 1
+            self.last_delivery_tag += 1
+            self.unconfirmed[self.last_delivery_tag] = (exchange, routing_key, body)
+            if len(self.unconfirmed) >= self.config.confirm_window:
+                self.wait_for_window(self.config.confirm_window - 1)
+
+    def on_confirm(self, method_frame):
+        """
+        Callback to be called when the broker confirms (Ack) or rejects (Nack) publishes.
+        If the `multiple` flag is set, it confirms all the delivery tags up to the one received.
+        """
+        method = method_frame.method
+        if method.multiple:
+            delivery_tags = [
+                tag for tag in self.unconfirmed if tag <= method.delivery_tag
+            ]
+        else:
+            delivery_tags = [method.delivery_tag]
+
+        nacked = isinstance(method, pika.spec.Basic.Nack)
+        for delivery_tag in delivery_tags:
+            publish = self.unconfirmed.pop(delivery_tag, None)
+            if nacked and publish:
+                # We can not publish from the callback, so we save it to publish it again later
+                logging.warning(
+                    f"Publish {delivery_tag} nacked by the broker, resending"
+                )
+                self.nacked.append(publish)
+
+    def wait_for_window(self, max_unconfirmed):
+        """
+        Blocks until there are at most `max_unconfirmed` publishes waiting for the broker confirm.
+        The nacked publishes are sent again.
+        """
+        while len(self.unconfirmed) > max_unconfirmed or self.nacked:
+            while self.nacked:
+                self.publish(*self.nacked.pop(0))
+            self.connection.wait_for(
+                self.channel,
+                lambda: len(self.unconfirmed) <= max_unconfirmed or self.nacked,
+            )
+
+    def wait_for_confirms(self):
+        """
+        Blocks until all the publishes have been confirmed by the broker.
+
+        This must be called before acking the message received, to ensure the messages sent are not lost.
+        The receiver logs them as sent with `log_pending_sent` only if they were sent by a protocol message.
+        """
+        self.flush_coalesced()
+        if self.unconfirmed or self.nacked:
+            self.wait_for_window(0)
+
+    def pop_sent_by_message_id(self):
+        """
+        Returns the messages sent by message_id since the messages sent were last logged,
+        to log them as sent by the caller
+        """
+        sent_by_message_id = self.sent_by_message_id
+        self.sent_by_message_id = {}
+        self.sent_pending_confirm = False
+        return sent_by_message_id
+
+    def log_pending_sent(self):
+        """
+        Logs the messages sent of the message being processed, if it sent any.
+        """
+        if self.defer_sent_log:
+            return
+        if self.sent_pending_confirm:
+            self.sent_pending_confirm = False
+            self.log_guardian.message_sent()
+
+    def discard_pending_sent(self):
+        """
+        Forgets the messages sent since the last ones logged, without logging them.
+        Used for the messages sent while handling an EOF, which are not part of a protocol message.
+        """
+        self.sent_pending_confirm = False
+        self.sent_by_message_id = {}
 
     def send_eof(
         self, client_id, routing_key="", messages_sent=None, possible_duplicates=None
@@ -828,6 +1581,24 @@ class CommunicationSender(Communication):
     def get_client_messages_sent(self, client_id):
         return self.messages_sent.get(client_id, 0)
 
+    def delete_client(self, client_id):
+        """
+        Deletes the counts of messages sent and the possible duplicates of a finished client.
+        They are logged by the receiver.
+        """
+        self.messages_sent.pop(client_id, None)
+        self.possible_duplicates.pop(client_id, None)
+
+    def close_channel(self):
+        """
+        Closes only the channel, after the messages sent are confirmed. It is opened again if the sender is used.
+        """
+        if self.active:
+            self.wait_for_confirms()
+            self.discard_pending_sent()
+        super().close_channel()
+        self.active = False
+
     def stop(self):
         """
         Stops the sender
@@ -0,0 +1,356 @@
+import asyncio
+import functools
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+import pika
+from pika.adapters.asyncio_connection import AsyncioConnection
+from pika.exceptions import AMQPConnectionError, ChannelClosed, NackError
+
+
+class AsyncioCommunicationConnection:
+    """
+    Class to wrap the connection to the RabbitMQ server using an asyncio event loop.
+
+    It has the same interface as `CommunicationConnection`, so it can be used by the receivers and senders without changes.
+
+    The network I/O (heartbeats, receiving the next deliveries, flushing the publishes and receiving the confirms)
+    runs in the event loop on a separate thread, so it overlaps with the processing of the current message.
+    The deliveries, confirms and timers are still handled in the thread that consumes, so the receivers and senders
+    do not need to be thread safe.
+
+    All the receivers and senders using it share the same connection, each one with its own channel.
+    """
+
+    def __init__(self, rabbit_host):
+        self.rabbit_host = rabbit_host
+        self.connection = None
+        self.loop = None
+        self.io_thread = None
+        self.channels = []
+        self.closing = False
+        self.closed = threading.Event()
+        # reduce log level for pika
+        logging.getLogger("pika").setLevel(logging.WARNING)
+
+    def connect(self):
+        """
+        Connects to the RabbitMQ server, if it is not connected yet
+        """
+        if self.connection:
+            return
+
+        self.loop = asyncio.new_event_loop()
+        self.io_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.io_thread.start()
+
+        opened = Future()
+
+        def on_open_error(_connection, error):
+            if not isinstance(error, Exception):
+                error = AMQPConnectionError(error)
+            opened.set_exception(error)
+
+        self.loop.call_soon_threadsafe(
+            lambda: AsyncioConnection(
+                pika.ConnectionParameters(host=self.rabbit_host),
+                on_open_callback=opened.set_result,
+                on_open_error_callback=on_open_error,
+                on_close_callback=self.on_connection_closed,
+                custom_ioloop=self.loop,
+            )
+        )
+        try:
+            self.connection = opened.result()
+        except Exception:
+            self.stop_loop()
+            raise
+
+    def channel(self, on_confirm=None, consumer=False):
+        """
+        Returns a channel to the RabbitMQ server
+
+        ### Optional parameters
+        - on_confirm : function
+            - If set, the publisher confirms are pipelined: `basic_publish` returns without waiting for the broker
+            and `on_confirm` is called with every Ack/Nack frame (which may confirm multiple delivery tags) as they arrive.
+            Use `wait_for` to process the confirms.
+        - consumer : bool
+            - If the channel will be used to consume. All the channels share the connection, so it is ignored.
+        """
+        opened = Future()
+        self.loop.call_soon_threadsafe(
+            functools.partial(
+                self.connection.channel, on_open_callback=opened.set_result
+            )
+        )
+        channel = AsyncioChannel(self, opened.result(), on_confirm)
+        self.channels.append(channel)
+        # We need to confirm the delivery to ensure the messages are sent
+        channel.rpc(
+            channel.impl.confirm_delivery, ack_nack_callback=channel.confirms.put
+        )
+        return channel
+
+    def wait_for(self, channel, predicate):
+        """
+        Processes the confirms of the channel until the predicate returns True
+        """
+        while not predicate():
+            channel.on_confirm(channel.get(channel.confirms))
+
+    def call_later(self, channel, delay, callback):
+        """
+        Calls the callback after `delay` seconds, from the thread consuming the channel.
+        If the channel does not consume, like the one of a sender, it is called from the thread consuming
+        other channel of the connection, which is the thread using the sender.
+        Returns the timer to be able to cancel it with `remove_timeout`.
+        """
+        timer = Timer(callback)
+        self.loop.call_soon_threadsafe(
+            lambda: timer.schedule(self.loop, delay, lambda: self.timer_events(channel))
+        )
+        return timer
+
+    def timer_events(self, channel):
+        """
+        Returns the queue of events where the timers of the channel are handled when they expire
+        """
+        if channel.consuming:
+            return channel.events
+        # The last one started consuming inside the callback of the others, so it is the one waiting for events
+        for consuming_channel in reversed(self.channels):
+            if consuming_channel.consuming:
+                return consuming_channel.events
+        return channel.events
+
+    def remove_timeout(self, channel, timer):
+        """
+        Cancels a timer created with `call_later`
+        """
+        timer.cancelled = True
+        self.loop.call_soon_threadsafe(timer.cancel)
+
+    def close_channel(self, channel):
+        """
+        Closes one of the channels, the connection is kept open for the others
+        """
+        if channel not in self.channels:
+            return
+        self.channels.remove(channel)
+        if self.run(lambda: channel.impl.is_open):
+            channel.call_soon(channel.impl.close)
+
+    def run(self, function, *args, **kwargs):
+        """
+        Calls the function in the event loop thread and returns its result
+        """
+        result = Future()
+
+        def call():
+            try:
+                result.set_result(function(*args, **kwargs))
+            except Exception as e:
+                result.set_exception(e)
+
+        self.loop.call_soon_threadsafe(call)
+        return result.result()
+
+    def on_connection_closed(self, _connection, reason):
+        if not self.closing:
+            logging.error(f"action: connection_closed | result: fail | error: {reason}")
+            for channel in self.channels:
+                channel.fail(reason)
+        self.closed.set()
+
+    def close(self):
+        """
+        Closes the connection sending all messages waiting on the buffer
+        This should be called always to ensure all messages have been sent
+        """
+        if not self.connection:
+            return
+
+        self.closing = True
+        if self.run(lambda: self.connection.is_open):
+            self.loop.call_soon_threadsafe(self.connection.close)
+            self.closed.wait()
+        self.connection = None
+        self.stop_loop()
+
+    def stop_loop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if threading.current_thread() is not self.io_thread:
+            self.io_thread.join()
+
+
+class AsyncioChannel:
+    """
+    Channel of an `AsyncioCommunicationConnection`, with the interface of pika's `BlockingChannel` used by the
+    receivers and senders.
+
+    The methods are executed in the event loop thread. The ones that wait for a response of the broker block until it
+    arrives, and the rest (publishes, acks and nacks) return immediately.
+    """
+
+    def __init__(self, connection, impl, on_confirm=None):
+        self.connection = connection
+        self.impl = impl
+        # The deliveries and timers, handled while consuming
+        self.events = queue.Queue()
+        # The Ack/Nack frames of the publishes, handled while waiting for the confirms
+        self.confirms = queue.Queue()
+        self.consuming = False
+        self.consumer_tags = []
+        self.pending_rpcs = []
+
+        # If the confirms are not pipelined, each publish waits for its confirm
+        self.pipelined = on_confirm is not None
+        self.on_confirm = on_confirm if self.pipelined else self.check_confirm
+
+        self.impl.add_on_close_callback(self.on_closed)
+
+    def rpc(self, method, *args, **kwargs):
+        """
+        Calls the method in the event loop thread, and waits until the broker responds to it.
+        Returns the response frame.
+        """
+        response = Future()
+        self.pending_rpcs.append(response)
+
+        def call():
+            try:
+                method(*args, callback=response.set_result, **kwargs)
+            except Exception as e:
+                response.set_exception(e)
+
+        self.connection.loop.call_soon_threadsafe(call)
+        try:
+            return response.result()
+        finally:
+            self.pending_rpcs.remove(response)
+
+    def call_soon(self, method, *args, **kwargs):
+        """
+        Calls the method in the event loop thread without waiting for it
+        """
+        self.connection.loop.call_soon_threadsafe(
+            functools.partial(method, *args, **kwargs)
+        )
+
+    def get(self, events):
+        """
+        Blocks until there is an event in the queue and returns it.
+        If the channel was closed, it raises the error that closed it.
+        """
+        event = events.get()
+        if isinstance(event, Exception):
+            # Leave it for the next one waiting
+            events.put(event)
+            raise event
+        return event
+
+    def basic_qos(self, **kwargs):
+        return self.rpc(self.impl.basic_qos, **kwargs)
+
+    def queue_declare(self, **kwargs):
+        return self.rpc(self.impl.queue_declare, **kwargs)
+
+    def queue_delete(self, **kwargs):
+        return self.rpc(self.impl.queue_delete, **kwargs)
+
+    def queue_bind(self, **kwargs):
+        return self.rpc(self.impl.queue_bind, **kwargs)
+
+    def exchange_declare(self, **kwargs):
+        return self.rpc(self.impl.exchange_declare, **kwargs)
+
+    def basic_ack(self, **kwargs):
+        self.call_soon(self.impl.basic_ack, **kwargs)
+
+    def basic_nack(self, **kwargs):
+        self.call_soon(self.impl.basic_nack, **kwargs)
+
+    def basic_publish(self, **kwargs):
+        """
+        Publishes the message.
+        If the confirms are not pipelined, it waits for the broker to confirm it like the `BlockingChannel`.
+        """
+        self.call_soon(self.impl.basic_publish, **kwargs)
+        if not self.pipelined:
+            self.check_confirm(self.get(self.confirms))
+
+    def check_confirm(self, method_frame):
+        if isinstance(method_frame.method, pika.spec.Basic.Nack):
+            raise NackError([])
+
+    def basic_consume(self, queue, on_message_callback, **kwargs):
+        def on_message(_impl, method, properties, body):
+            self.events.put(lambda: on_message_callback(self, method, properties, body))
+
+        consumer_tag = self.connection.run(
+            self.impl.basic_consume, queue, on_message, **kwargs
+        )
+        self.consumer_tags.append(consumer_tag)
+        return consumer_tag
+
+    def start_consuming(self):
+        """
+        Handles the deliveries and timers until `stop_consuming` is called
+        """
+        self.consuming = True
+        while self.consuming:
+            self.get(self.events)()
+
+    def stop_consuming(self):
+        """
+        Cancels the consumers. The deliveries not handled yet are requeued by the broker.
+        """
+        self.consuming = False
+        for consumer_tag in self.consumer_tags:
+            self.call_soon(self.impl.basic_cancel, consumer_tag)
+        self.consumer_tags = []
+        # Wake up the consuming thread in case it is waiting for a delivery
+        self.events.put(lambda: None)
+
+    def on_closed(self, _impl, reason):
+        if not isinstance(reason, Exception):
+            reason = ChannelClosed(-1, str(reason))
+        for response in self.pending_rpcs:
+            if not response.done():
+                response.set_exception(reason)
+        if not self.connection.closing:
+            self.fail(reason)
+
+    def fail(self, error):
+        """
+        Makes the thread using the channel raise the error the next time it waits for it
+        """
+        self.events.put(error)
+        self.confirms.put(error)
+
+
+class Timer:
+    """
+    Timer created by `AsyncioCommunicationConnection.call_later`.
+    When it expires, the callback is queued to be called by the thread consuming the channel.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.cancelled = False
+        self.handle = None
+
+    def schedule(self, loop, delay, obtain_events):
+        if not self.cancelled:
+            self.handle = loop.call_later(delay, lambda: obtain_events().put(self))
+
+    def cancel(self):
+        if self.handle:
+            self.handle.cancel()
+
+    def __call__(self):
+        if not self.cancelled:
+            self.callback()
@@ -2,45 +2,64 @@ import multiprocessing as mp
 import socket
 
 from commons.protocol import (
+    CompressedMessage,
     Message,
 )
 
 BUFFER_SIZE = 8192  # 8 KiB
-END_OF_MESSAGE = b"\r\n\r\n"
+# Each message is preceded by its size, the compressed messages can have any sequence of bytes
+# so they can not be delimited by a separator
+MESSAGE_SIZE_BYTES = 4
 
 
 class CommunicationBuffer:
     """
     Communication buffer for a socket.
+
+    If the compression_level is set, the messages sent are compressed with zlib with that level.
+    The messages received are decompressed if needed, so each peer decides if it compresses.
     """
 
-    def __init__(self, sock, timeout=None):
+    def __init__(self, sock, timeout=None, compression_level=None):
         self.sock = sock
         if timeout:
             self.sock.settimeout(timeout)
         else:
             self.sock.setblocking(True)
-        self.buffer = b""
+        self.buffer = bytearray()
         self.lock = mp.Lock()
+        self.compression_level = compression_level
 
     def get_message(self):
         """
         Get a message from the socket.
         """
-        while END_OF_MESSAGE not in self.buffer:
-            data = self.sock.recv(BUFFER_SIZE)
+        size = int.from_bytes(self.receive(MESSAGE_SIZE_BYTES), byteorder="big")
+        return Message.from_bytes(self.receive(size))
+
+    def receive(self, size):
+        """
+        Returns the next `size` bytes received from the socket.
+        """
+        while len(self.buffer) < size:
+            data = self.sock.recv(max(BUFFER_SIZE, size - len(self.buffer)))
             if not data:  # socket is closed
                 raise PeerDisconnected
             self.buffer += data
-        line, sep, self.buffer = self.buffer.partition(END_OF_MESSAGE)
-        return Message.from_bytes(line)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
 
     def send_message(self, message: Message):
         """
         Send a message through the socket.
         """
+        message_bytes = CompressedMessage.compress(message, self.compression_level)
         with self.lock:
-            self.sock.sendall(message.to_bytes() + END_OF_MESSAGE)
+            self.sock.sendall(
+                len(message_bytes).to_bytes(MESSAGE_SIZE_BYTES, byteorder="big")
+                + message_bytes
+            )
 
     def stop(self):
         """
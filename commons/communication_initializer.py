@@ -1,4 +1,7 @@
 from commons.communication import CommunicationConnection
+from commons.communication_asyncio import AsyncioCommunicationConnection
+from commons.communication_memory import MemoryCommunicationConnection
+from commons.message import PayloadFormat
 
 from commons.communication import (
     CommunicationReceiverExchange,
@@ -11,11 +14,33 @@ from commons.communication import (
     CommunicationSenderConfig,
 )
 
+# The backends of the connection, selected with the `communication_backend` config input of the mains
+BACKENDS = ["BLOCKING", "ASYNCIO", "MEMORY"]
+DEFAULT_BACKEND = "BLOCKING"
+
 
 class CommunicationInitializer:
-    def __init__(self, rabbit_host, log_guardian):
+    """
+    Initializes the receivers and senders, all using the same connection
+
+    ### Optional parameters
+    - backend : str
+        - "BLOCKING" (default): the connection I/O is done by the thread processing the messages.
+        - "ASYNCIO": the connection I/O is done by an asyncio event loop in another thread, overlapping with the processing.
+        - "MEMORY": the messages go through an in memory broker instead of RabbitMQ, shared by all the initializers
+        of the process with the same `rabbit_host`. Used to run the processors in threads of a single process.
+    """
+
+    def __init__(self, rabbit_host, log_guardian, backend=DEFAULT_BACKEND):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown communication backend: {backend}")
         self.rabbit_host = rabbit_host
-        self.connection = CommunicationConnection(self.rabbit_host)
+        if backend == "ASYNCIO":
+            self.connection = AsyncioCommunicationConnection(self.rabbit_host)
+        elif backend == "MEMORY":
+            self.connection = MemoryCommunicationConnection(self.rabbit_host)
+        else:
+            self.connection = CommunicationConnection(self.rabbit_host)
         self.log_guardian = log_guardian
 
     def initialize_receiver(
@@ -29,6 +54,14 @@ class CommunicationInitializer:
         delimiter=",",
         use_duplicate_catcher=False,
         load_balancer_send_multiply=None,
+        ack_batch_size=1,
+        ack_batch_timeout_ms=100,
+        min_prefetch_count=1,
+        max_prefetch_count=None,
+        micro_batch_size=1,
+        micro_batch_timeout_ms=20,
+        fsync_policy=None,
+        delete_finished_clients=True,
     ):
         """
         Initialize the receiver based on the input type
@@ -42,6 +75,14 @@ class CommunicationInitializer:
             delimiter=delimiter,
             use_duplicate_catcher=use_duplicate_catcher,
             load_balancer_send_multiply=load_balancer_send_multiply,
+            ack_batch_size=ack_batch_size,
+            ack_batch_timeout_ms=ack_batch_timeout_ms,
+            min_prefetch_count=min_prefetch_count,
+            max_prefetch_count=max_prefetch_count,
+            micro_batch_size=micro_batch_size,
+            micro_batch_timeout_ms=micro_batch_timeout_ms,
+            fsync_policy=fsync_policy,
+            delete_finished_clients=delete_finished_clients,
         )
         if input_type == "QUEUE":
             communication_receiver = CommunicationReceiverQueue(
@@ -53,12 +94,30 @@ class CommunicationInitializer:
             )
         return communication_receiver
 
-    def initialize_sender(self, output, output_type, delimiter=","):
+    def initialize_sender(
+        self,
+        output,
+        output_type,
+        delimiter=",",
+        confirm_window=1,
+        coalesce_max_rows=None,
+        coalesce_max_bytes=65536,
+        coalesce_timeout_ms=100,
+        payload_format=PayloadFormat.TEXT,
+        compression_level=None,
+    ):
         """
         Initialize the sender based on the output type
         """
         communication_sender_config = CommunicationSenderConfig(
-            output, delimiter=delimiter
+            output,
+            delimiter=delimiter,
+            confirm_window=confirm_window,
+            coalesce_max_rows=coalesce_max_rows,
+            coalesce_max_bytes=coalesce_max_bytes,
+            coalesce_timeout_ms=coalesce_timeout_ms,
+            payload_format=payload_format,
+            compression_level=compression_level,
         )
         if output_type == "QUEUE":
             communication_sender = CommunicationSenderQueue(
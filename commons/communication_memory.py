@@ -0,0 +1,386 @@
+import heapq
+import itertools
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+import pika
+from pika.exceptions import ChannelClosedByBroker
+
+# {name: MemoryBroker}, so the connections created with the same host share the broker
+BROKERS = {}
+BROKERS_LOCK = threading.Lock()
+
+
+def get_broker(name):
+    """
+    Returns the broker registered with the name, creating it if it does not exist
+    """
+    with BROKERS_LOCK:
+        if name not in BROKERS:
+            BROKERS[name] = MemoryBroker()
+        return BROKERS[name]
+
+
+class MemoryBroker:
+    """
+    In memory replacement of the RabbitMQ server, to run the processors in threads of the same process.
+
+    It supports durable queues, fanout and topic exchanges, ack/nack with requeue and the redelivered flag.
+    The messages are kept only in memory, so they are lost if the process dies.
+    """
+
+    def __init__(self):
+        # All the state is protected by this condition, notified when there are new messages to consume
+        self.condition = threading.Condition()
+        # {queue_name: deque of MemoryMessage}
+        self.queues = {}
+        # {exchange_name: exchange_type}
+        self.exchanges = {}
+        # {exchange_name: [(queue_name, routing_key)]}
+        self.bindings = {}
+
+    def queue_declare(self, queue):
+        with self.condition:
+            self.queues.setdefault(queue, deque())
+
+    def queue_delete(self, queue):
+        with self.condition:
+            self.queues.pop(queue, None)
+            for bindings in self.bindings.values():
+                bindings[:] = [binding for binding in bindings if binding[0] != queue]
+
+    def exchange_declare(self, exchange, exchange_type):
+        with self.condition:
+            self.exchanges.setdefault(exchange, exchange_type)
+            self.bindings.setdefault(exchange, [])
+
+    def queue_bind(self, queue, exchange, routing_key):
+        with self.condition:
+            if queue not in self.queues or exchange not in self.exchanges:
+                raise ChannelClosedByBroker(404, f"NOT_FOUND - {exchange} or {queue}")
+            if (queue, routing_key) not in self.bindings[exchange]:
+                self.bindings[exchange].append((queue, routing_key))
+
+    def publish(self, exchange, routing_key, body):
+        """
+        Routes the message to the queues.
+        Like RabbitMQ, the messages that are not routed to any queue are dropped.
+        """
+        with self.condition:
+            if exchange == "":
+                queues = [routing_key] if routing_key in self.queues else []
+            elif exchange not in self.exchanges:
+                raise ChannelClosedByBroker(404, f"NOT_FOUND - no exchange {exchange}")
+            elif self.exchanges[exchange] == "fanout":
+                queues = [queue for queue, _ in self.bindings[exchange]]
+            else:
+                queues = [
+                    queue
+                    for queue, binding_key in self.bindings[exchange]
+                    if topic_matches(binding_key, routing_key)
+                ]
+
+            for queue in dict.fromkeys(queues):
+                self.queues[queue].append(MemoryMessage(exchange, routing_key, body))
+            if queues:
+                self.condition.notify_all()
+
+    def get(self, channel, timeout):
+        """
+        Returns the next message of a queue consumed by the channel, or None if there is none before the timeout.
+        """
+        with self.condition:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while channel.consuming:
+                if channel.has_capacity():
+                    for queue in channel.consumed_queues:
+                        messages = self.queues.get(queue)
+                        if messages:
+                            return queue, messages.popleft()
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+            return None
+
+    def requeue(self, queue, messages):
+        """
+        Returns the messages to the front of the queue, marked as redelivered
+        """
+        with self.condition:
+            if queue not in self.queues:
+                return
+            for message in reversed(messages):
+                message.redelivered = True
+                self.queues[queue].appendleft(message)
+            self.condition.notify_all()
+
+    def notify(self):
+        with self.condition:
+            self.condition.notify_all()
+
+
+class MemoryMessage:
+    def __init__(self, exchange, routing_key, body):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.body = body
+        self.redelivered = False
+
+
+def topic_matches(binding_key, routing_key):
+    """
+    Returns if the routing key matches the binding key of a topic exchange,
+    where `*` matches one word and `#` zero or more words
+    """
+    pattern = re.escape(binding_key).replace(r"\*", r"[^.]+").replace(r"\#", r".*")
+    return re.fullmatch(pattern, routing_key) is not None
+
+
+class MemoryCommunicationConnection:
+    """
+    Class to wrap the connection to a `MemoryBroker`, with the same interface as `CommunicationConnection`.
+
+    The `rabbit_host` is used as the name of the broker, so all the connections of the process created with the
+    same host exchange messages with each other.
+    """
+
+    def __init__(self, rabbit_host):
+        self.rabbit_host = rabbit_host
+        self.broker = get_broker(rabbit_host)
+        self.channels = []
+
+    def connect(self):
+        """
+        Connects to the broker
+        """
+        pass
+
+    def channel(self, on_confirm=None, consumer=False):
+        """
+        Returns a channel to the broker
+
+        ### Optional parameters
+        - on_confirm : function
+            - If set, the publisher confirms are pipelined: `on_confirm` is called with the Ack frames of the
+            publishes when `wait_for` is called.
+        - consumer : bool
+            - If the channel will be used to consume. It is ignored, the broker is shared by all the channels.
+        """
+        channel = MemoryChannel(self.broker, on_confirm)
+        self.channels.append(channel)
+        return channel
+
+    def wait_for(self, channel, predicate):
+        """
+        Processes the confirms of the channel until the predicate returns True
+        """
+        while not predicate() and channel.confirms:
+            channel.on_confirm(channel.confirms.popleft())
+
+    def call_later(self, channel, delay, callback):
+        """
+        Calls the callback after `delay` seconds, from the thread consuming the channel.
+        If the channel does not consume, like the one of a sender, it is called from the thread consuming
+        other channel of the connection, which is the thread using the sender.
+        Returns the timer to be able to cancel it with `remove_timeout`.
+        """
+        if not channel.consuming:
+            # The last one started consuming inside the callback of the others, so it is the one waiting
+            channel = next(
+                (other for other in reversed(self.channels) if other.consuming),
+                channel,
+            )
+        return channel.add_timer(delay, callback)
+
+    def remove_timeout(self, channel, timer):
+        """
+        Cancels a timer created with `call_later`
+        """
+        timer.cancelled = True
+
+    def close_channel(self, channel):
+        """
+        Closes one of the channels, the messages not acked by it are requeued
+        """
+        if channel in self.channels:
+            self.channels.remove(channel)
+            channel.close()
+
+    def close(self):
+        """
+        Closes all the channels, the messages not acked are requeued
+        """
+        for channel in self.channels:
+            channel.close()
+        self.channels = []
+
+
+class MemoryChannel:
+    """
+    Channel of a `MemoryCommunicationConnection`, with the interface of pika's `BlockingChannel` used by the
+    receivers and senders.
+
+    The publishes are confirmed as soon as they are routed, and the deliveries and timers are handled by the
+    thread calling `start_consuming`.
+    """
+
+    def __init__(self, broker, on_confirm=None):
+        self.broker = broker
+        self.on_confirm = on_confirm
+        self.prefetch_count = 0
+        self.consuming = False
+        # {queue_name: on_message_callback}
+        self.consumers = {}
+        self.consumed_queues = []
+        # {delivery_tag: (queue_name, MemoryMessage)}
+        self.unacked = {}
+        self.last_delivery_tag = 0
+        self.last_publish_tag = 0
+        # The Ack frames waiting to be processed by `wait_for`
+        self.confirms = deque()
+        # Heap of MemoryTimer
+        self.timers = []
+        self.timers_counter = itertools.count()
+
+    def basic_qos(self, prefetch_count=0, **kwargs):
+        with self.broker.condition:
+            self.prefetch_count = prefetch_count
+            self.broker.condition.notify_all()
+
+    def has_capacity(self):
+        return self.prefetch_count == 0 or len(self.unacked) < self.prefetch_count
+
+    def queue_declare(self, queue, **kwargs):
+        self.broker.queue_declare(queue)
+        return pika.frame.Method(0, pika.spec.Queue.DeclareOk(queue=queue))
+
+    def queue_delete(self, queue, **kwargs):
+        self.broker.queue_delete(queue)
+
+    def exchange_declare(self, exchange, exchange_type="direct", **kwargs):
+        # The type can be a pika.exchange_type.ExchangeType
+        self.broker.exchange_declare(
+            exchange, getattr(exchange_type, "value", exchange_type)
+        )
+
+    def queue_bind(self, queue, exchange, routing_key=None, **kwargs):
+        self.broker.queue_bind(queue, exchange, routing_key or "")
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, **kwargs):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.broker.publish(exchange, routing_key, body)
+        self.last_publish_tag += 1
+        if self.on_confirm:
+            self.confirms.append(
+                pika.frame.Method(0, pika.spec.Basic.Ack(self.last_publish_tag))
+            )
+
+    def basic_consume(self, queue, on_message_callback, **kwargs):
+        self.consumers[queue] = on_message_callback
+        self.consumed_queues = list(self.consumers)
+        return queue
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        with self.broker.condition:
+            self.pop_unacked(delivery_tag, multiple)
+            self.broker.condition.notify_all()
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        with self.broker.condition:
+            messages = self.pop_unacked(delivery_tag, multiple)
+            if requeue:
+                self.requeue(messages)
+            self.broker.condition.notify_all()
+
+    def pop_unacked(self, delivery_tag, multiple):
+        if multiple:
+            delivery_tags = [tag for tag in self.unacked if tag <= delivery_tag]
+        else:
+            delivery_tags = [delivery_tag]
+        return [self.unacked.pop(tag) for tag in delivery_tags if tag in self.unacked]
+
+    def requeue(self, messages):
+        by_queue = {}
+        for queue, message in messages:
+            by_queue.setdefault(queue, []).append(message)
+        for queue, queue_messages in by_queue.items():
+            self.broker.requeue(queue, queue_messages)
+
+    def add_timer(self, delay, callback):
+        timer = MemoryTimer(
+            time.monotonic() + delay, next(self.timers_counter), callback
+        )
+        heapq.heappush(self.timers, timer)
+        self.broker.notify()
+        return timer
+
+    def run_timers(self):
+        """
+        Calls the expired timers, and returns the seconds until the next one expires
+        """
+        while self.timers:
+            timer = self.timers[0]
+            if timer.cancelled:
+                heapq.heappop(self.timers)
+                continue
+            remaining = timer.deadline - time.monotonic()
+            if remaining > 0:
+                return remaining
+            heapq.heappop(self.timers)
+            timer.callback()
+        return None
+
+    def start_consuming(self):
+        """
+        Handles the deliveries and timers until `stop_consuming` is called
+        """
+        self.consuming = True
+        while self.consuming:
+            timeout = self.run_timers()
+            delivery = self.broker.get(self, timeout)
+            if not delivery:
+                continue
+
+            queue, message = delivery
+            self.last_delivery_tag += 1
+            self.unacked[self.last_delivery_tag] = (queue, message)
+            method = pika.spec.Basic.Deliver(
+                consumer_tag=queue,
+                delivery_tag=self.last_delivery_tag,
+                redelivered=message.redelivered,
+                exchange=message.exchange,
+                routing_key=message.routing_key,
+            )
+            self.consumers[queue](self, method, pika.BasicProperties(), message.body)
+
+    def stop_consuming(self):
+        self.consuming = False
+        self.broker.notify()
+
+    def close(self):
+        """
+        Stops consuming and requeues the messages not acked, like the broker does when a channel is closed
+        """
+        self.consuming = False
+        with self.broker.condition:
+            messages = list(self.unacked.values())
+            self.unacked = {}
+            self.requeue(messages)
+            self.broker.condition.notify_all()
+        logging.debug(f"action: memory_channel_close | requeued: {len(messages)}")
+
+
+class MemoryTimer:
+    def __init__(self, deadline, order, callback):
+        self.deadline = deadline
+        self.order = order
+        self.callback = callback
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.deadline, self.order) < (other.deadline, other.order)
@@ -0,0 +1,243 @@
+import itertools
+
+import pytest
+from pika.exceptions import ChannelClosedByBroker
+
+from commons.communication_memory import (
+    MemoryCommunicationConnection,
+    get_broker,
+    topic_matches,
+)
+
+# Each test uses its own broker
+BROKER_IDS = itertools.count()
+# Max seconds a test consumes, so a missing delivery fails instead of blocking
+CONSUME_TIMEOUT_S = 5
+
+
+@pytest.fixture
+def connection():
+    return MemoryCommunicationConnection(f"memory_test_{next(BROKER_IDS)}")
+
+
+def consume(connection, channel, queue, count):
+    """
+    Consumes deliveries of the queue with the channel until `count` are received, or the timeout expires.
+    Returns the deliveries as (method, body), without acking them.
+    """
+    deliveries = []
+
+    def callback(ch, method, properties, body):
+        deliveries.append((method, body))
+        if len(deliveries) >= count:
+            ch.stop_consuming()
+
+    channel.basic_consume(queue=queue, on_message_callback=callback)
+    timer = connection.call_later(channel, CONSUME_TIMEOUT_S, channel.stop_consuming)
+    channel.start_consuming()
+    connection.remove_timeout(channel, timer)
+    return deliveries
+
+
+def bodies(deliveries):
+    return [body for _, body in deliveries]
+
+
+def queued(connection, queue):
+    return [
+        message.body for message in get_broker(connection.rabbit_host).queues[queue]
+    ]
+
+
+def test_brokers_are_shared_by_name(connection):
+    other = MemoryCommunicationConnection(connection.rabbit_host)
+    assert other.broker is connection.broker
+
+
+def test_ack(connection):
+    channel = connection.channel()
+    channel.queue_declare(queue="queue")
+    for body in [b"1", b"2", b"3"]:
+        channel.basic_publish(exchange="", routing_key="queue", body=body)
+
+    deliveries = consume(connection, channel, "queue", 3)
+    assert bodies(deliveries) == [b"1", b"2", b"3"]
+    assert [method.delivery_tag for method, _ in deliveries] == [1, 2, 3]
+    assert not any(method.redelivered for method, _ in deliveries)
+
+    channel.basic_ack(delivery_tag=1)
+    channel.basic_ack(delivery_tag=3)
+    assert list(channel.unacked) == [2]
+    channel.basic_ack(delivery_tag=2, multiple=True)
+    assert channel.unacked == {}
+    assert queued(connection, "queue") == []
+
+
+def test_nack_requeues_as_redelivered(connection):
+    channel = connection.channel()
+    channel.queue_declare(queue="queue")
+    for body in [b"1", b"2", b"3"]:
+        channel.basic_publish(exchange="", routing_key="queue", body=body)
+
+    consume(connection, channel, "queue", 3)
+    channel.basic_nack(delivery_tag=2, multiple=True, requeue=True)
+    channel.basic_nack(delivery_tag=3, requeue=False)
+    # The messages requeued go back to the front of the queue, in order
+    assert queued(connection, "queue") == [b"1", b"2"]
+
+    deliveries = consume(connection, channel, "queue", 2)
+    assert bodies(deliveries) == [b"1", b"2"]
+    assert all(method.redelivered for method, _ in deliveries)
+
+
+def test_close_channel_requeues_unacked(connection):
+    channel = connection.channel()
+    channel.queue_declare(queue="queue")
+    for body in [b"1", b"2"]:
+        channel.basic_publish(exchange="", routing_key="queue", body=body)
+    consume(connection, channel, "queue", 2)
+    channel.basic_ack(delivery_tag=1)
+
+    connection.close_channel(channel)
+    assert queued(connection, "queue") == [b"2"]
+    other = connection.channel()
+    deliveries = consume(connection, other, "queue", 1)
+    assert bodies(deliveries) == [b"2"]
+    assert deliveries[0][0].redelivered
+
+
+def test_prefetch_count(connection):
+    channel = connection.channel()
+    channel.queue_declare(queue="queue")
+    channel.basic_qos(prefetch_count=2)
+    for body in [b"1", b"2", b"3"]:
+        channel.basic_publish(exchange="", routing_key="queue", body=body)
+
+    # Only 2 are delivered until one of them is acked
+    connection.call_later(channel, 0.1, channel.stop_consuming)
+    deliveries = consume(connection, channel, "queue", 3)
+    assert bodies(deliveries) == [b"1", b"2"]
+
+    channel.basic_ack(delivery_tag=1)
+    assert bodies(consume(connection, channel, "queue", 1)) == [b"3"]
+
+
+def test_fanout_exchange(connection):
+    channel = connection.channel()
+    channel.exchange_declare(exchange="exchange", exchange_type="fanout")
+    for queue in ["queue_1", "queue_2"]:
+        channel.queue_declare(queue=queue)
+        channel.queue_bind(queue=queue, exchange="exchange")
+
+    channel.basic_publish(exchange="exchange", routing_key="", body=b"1")
+    channel.basic_publish(exchange="exchange", routing_key="any", body=b"2")
+    assert queued(connection, "queue_1") == [b"1", b"2"]
+    assert queued(connection, "queue_2") == [b"1", b"2"]
+
+
+def test_topic_exchange(connection):
+    channel = connection.channel()
+    channel.exchange_declare(exchange="exchange", exchange_type="topic")
+    bindings = {"one_word": "flights.*", "any_words": "#.ATL", "exact": "flights.ATL"}
+    for queue, routing_key in bindings.items():
+        channel.queue_declare(queue=queue)
+        channel.queue_bind(queue=queue, exchange="exchange", routing_key=routing_key)
+
+    for routing_key in ["flights.ATL", "flights.BOS", "airports.ATL", "flights.x.ATL"]:
+        channel.basic_publish(
+            exchange="exchange", routing_key=routing_key, body=routing_key.encode()
+        )
+    assert queued(connection, "one_word") == [b"flights.ATL", b"flights.BOS"]
+    assert queued(connection, "any_words") == [
+        b"flights.ATL",
+        b"airports.ATL",
+        b"flights.x.ATL",
+    ]
+    assert queued(connection, "exact") == [b"flights.ATL"]
+
+
+@pytest.mark.parametrize(
+    "binding_key, routing_key, matches",
+    [
+        ("a.*", "a.b", True),
+        ("a.*", "a", False),
+        ("a.*", "a.b.c", False),
+        ("a.#", "a.b.c", True),
+        ("#", "a.b", True),
+        ("*.b", "a.b", True),
+        ("a.b", "a.c", False),
+        ("a+b", "a+b", True),
+    ],
+)
+def test_topic_matches(binding_key, routing_key, matches):
+    assert topic_matches(binding_key, routing_key) == matches
+
+
+def test_unrouted_messages_are_dropped(connection):
+    channel = connection.channel()
+    channel.queue_declare(queue="queue")
+    channel.basic_publish(exchange="", routing_key="missing", body=b"1")
+    assert queued(connection, "queue") == []
+
+    with pytest.raises(ChannelClosedByBroker):
+        channel.basic_publish(exchange="missing", routing_key="", body=b"1")
+    with pytest.raises(ChannelClosedByBroker):
+        channel.queue_bind(queue="queue", exchange="missing")
+
+
+def test_queue_delete(connection):
+    channel = connection.channel()
+    channel.exchange_declare(exchange="exchange", exchange_type="fanout")
+    channel.queue_declare(queue="queue")
+    channel.queue_bind(queue="queue", exchange="exchange")
+    channel.basic_publish(exchange="", routing_key="queue", body=b"1")
+
+    channel.queue_delete(queue="queue")
+    assert "queue" not in get_broker(connection.rabbit_host).queues
+    assert get_broker(connection.rabbit_host).bindings["exchange"] == []
+
+
+def test_wait_for_confirms(connection):
+    confirms = []
+    channel = connection.channel(on_confirm=confirms.append)
+    channel.queue_declare(queue="queue")
+    for body in [b"1", b"2", b"3"]:
+        channel.basic_publish(exchange="", routing_key="queue", body=body)
+    assert confirms == []
+
+    connection.wait_for(channel, lambda: len(confirms) >= 2)
+    assert [confirm.method.delivery_tag for confirm in confirms] == [1, 2]
+    # It returns when there are no more confirms, even if the predicate is False
+    connection.wait_for(channel, lambda: False)
+    assert [confirm.method.delivery_tag for confirm in confirms] == [1, 2, 3]
+
+
+def test_timers(connection):
+    channel = connection.channel()
+    channel.queue_declare(queue="queue")
+    calls = []
+    connection.call_later(channel, 0.05, lambda: calls.append("second"))
+    connection.call_later(channel, 0, lambda: calls.append("first"))
+    cancelled = connection.call_later(channel, 0, lambda: calls.append("cancelled"))
+    connection.remove_timeout(channel, cancelled)
+    connection.call_later(channel, 0.1, channel.stop_consuming)
+
+    consume(connection, channel, "queue", 1)
+    assert calls == ["first", "second"]
+
+
+def test_timers_of_channel_not_consuming(connection):
+    consumer = connection.channel()
+    consumer.queue_declare(queue="queue")
+    publisher = connection.channel()
+    calls = []
+
+    def publish():
+        # The timer of the publisher is called by the thread consuming the other channel
+        calls.append("publish")
+        connection.call_later(publisher, 0, lambda: calls.append("timer"))
+        connection.call_later(consumer, 0.05, consumer.stop_consuming)
+
+    connection.call_later(consumer, 0, publish)
+    consume(connection, consumer, "queue", 1)
+    assert calls == ["publish", "timer"]
@@ -0,0 +1,325 @@
+import itertools
+import threading
+import time
+
+import pytest
+
+from commons.communication import CommunicationReceiverConfig
+from commons.communication_initializer import CommunicationInitializer, DEFAULT_BACKEND
+from commons.communication_memory import MemoryCommunicationConnection, get_broker
+from commons.config_initializer import initialize_config
+from commons.log_guardian import LogGuardian
+from commons.logger import FsyncPolicy
+from commons.message import Message, MessageType, ProtocolMessage
+
+# Each test uses its own in memory broker
+BROKER_IDS = itertools.count()
+WAIT_TIMEOUT_S = 5
+
+
+@pytest.fixture(autouse=True)
+def log_directory(tmp_path, monkeypatch):
+    # The logs are written in the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def broker():
+    return f"communication_test_{next(BROKER_IDS)}"
+
+
+def new_initializer(broker, no_log=True):
+    return CommunicationInitializer(
+        broker, LogGuardian(no_log=no_log), backend="MEMORY"
+    )
+
+
+def queued_messages(broker, queue):
+    return [
+        Message.from_bytes(message.body) for message in get_broker(broker).queues[queue]
+    ]
+
+
+def wait_until(predicate):
+    deadline = time.monotonic() + WAIT_TIMEOUT_S
+    while not predicate():
+        assert time.monotonic() < deadline, "Timeout waiting for the condition"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def start_receiver():
+    """
+    Returns a function that binds the receiver, appending the messages received to the list, and starts it
+    in a thread. The receivers are stopped at the end of the test, before the working directory is restored.
+    """
+    started = []
+
+    def start(receiver, received, **kwargs):
+        kwargs.setdefault("input_callback", received.append)
+        kwargs.setdefault("eof_callback", lambda client_id: None)
+        receiver.bind(**kwargs)
+        thread = threading.Thread(target=receiver.start, daemon=True)
+        thread.start()
+        started.append((receiver, thread))
+
+    yield start
+    for receiver, thread in started:
+        receiver.channel.stop_consuming()
+        thread.join(WAIT_TIMEOUT_S)
+
+
+def send_messages(broker, queue, message_ids, client_id=1):
+    source = new_initializer(broker).initialize_sender(queue, "QUEUE")
+    for message_id in message_ids:
+        source.send_all(ProtocolMessage(client_id, message_id, [f"row {message_id}"]))
+
+
+def test_communication_backend_config(monkeypatch, broker):
+    config_inputs = {"rabbit_host": str, "communication_backend": str}
+    defaults = {"communication_backend": DEFAULT_BACKEND}
+    monkeypatch.setenv("RABBIT_HOST", broker)
+    assert initialize_config(config_inputs, defaults)["communication_backend"] == (
+        "BLOCKING"
+    )
+
+    monkeypatch.setenv("COMMUNICATION_BACKEND", "MEMORY")
+    config_params = initialize_config(config_inputs, defaults)
+    initializer = CommunicationInitializer(
+        config_params["rabbit_host"],
+        LogGuardian(no_log=True),
+        backend=config_params["communication_backend"],
+    )
+    assert isinstance(initializer.connection, MemoryCommunicationConnection)
+
+    with pytest.raises(ValueError):
+        CommunicationInitializer(broker, LogGuardian(no_log=True), backend="UNKNOWN")
+
+
+def test_sender_reopens_channel_with_confirms(broker):
+    sender = new_initializer(broker).initialize_sender(
+        "output", "QUEUE", confirm_window=4
+    )
+
+    sender.send(ProtocolMessage(1, 1, "a"))
+    sender.close_channel()
+    sender.send(ProtocolMessage(1, 2, "b"))
+    assert list(sender.unconfirmed) == [1]
+
+    sender.wait_for_confirms()
+    assert sender.unconfirmed == {}
+    assert [message.message_id for message in queued_messages(broker, "output")] == [
+        1,
+        2,
+    ]
+
+
+def test_fsync_policy_default():
+    assert CommunicationReceiverConfig("input", 1, 1).fsync_policy == FsyncPolicy.ALWAYS
+    assert (
+        CommunicationReceiverConfig("input", 1, 1, ack_batch_size=10).fsync_policy
+        == FsyncPolicy.BATCH
+    )
+    with pytest.raises(ValueError):
+        CommunicationReceiverConfig(
+            "input", 1, 1, ack_batch_size=10, fsync_policy=FsyncPolicy.ALWAYS
+        )
+
+
+def test_fsync_policy_always_acks_each_message(broker, start_receiver):
+    receiver = new_initializer(broker, no_log=False).initialize_receiver(
+        "input", "QUEUE", 1, 1
+    )
+    received = []
+    start_receiver(receiver, received)
+
+    send_messages(broker, "input", [1, 2])
+    wait_until(lambda: len(received) == 2)
+    wait_until(lambda: not receiver.channel.unacked)
+    assert receiver.log_guardian.storer.logger.restore()[0]["messages_received"] == {
+        1: 2
+    }
+
+
+def test_fsync_policy_batch_acks_full_batches(broker, start_receiver):
+    receiver = new_initializer(broker, no_log=False).initialize_receiver(
+        "input", "QUEUE", 1, 1, ack_batch_size=3, ack_batch_timeout_ms=60000
+    )
+    received = []
+    start_receiver(receiver, received)
+
+    send_messages(broker, "input", [1, 2, 3, 4])
+    wait_until(lambda: len(received) == 4)
+    # The first three are persisted and acked together, the last one waits for its batch
+    wait_until(lambda: len(receiver.channel.unacked) == 1)
+    assert receiver.ack_batch_count == 1
+
+
+def test_fsync_policy_interval_acks_on_timeout(broker, start_receiver):
+    receiver = new_initializer(broker, no_log=False).initialize_receiver(
+        "input",
+        "QUEUE",
+        1,
+        1,
+        ack_batch_size=2,
+        ack_batch_timeout_ms=300,
+        fsync_policy=FsyncPolicy.INTERVAL,
+    )
+    received = []
+    start_receiver(receiver, received)
+
+    send_messages(broker, "input", [1, 2, 3])
+    wait_until(lambda: len(received) == 3)
+    # The batch is bigger than ack_batch_size, it is only persisted when the timeout expires
+    assert len(receiver.channel.unacked) == 3
+    wait_until(lambda: not receiver.channel.unacked)
+    assert receiver.ack_batch_count == 0
+
+
+def test_receiver_deletes_pending_clients_without_messages(broker, start_receiver):
+    receiver = new_initializer(broker).initialize_receiver(
+        "input", "QUEUE", 1, 1, delete_finished_clients=False
+    )
+    deleted = []
+    start_receiver(receiver, [], delete_client_callback=deleted.append)
+
+    receiver.messages_received[7] = 3
+    receiver.delete_client_later(7)
+    wait_until(lambda: deleted == [7])
+    assert 7 not in receiver.messages_received
+
+
+def test_sender_confirm_window(broker):
+    sender = new_initializer(broker).initialize_sender(
+        "output", "QUEUE", confirm_window=3
+    )
+    unconfirmed = []
+    publish = sender.publish
+
+    def publish_and_count(*args):
+        publish(*args)
+        unconfirmed.append(len(sender.unconfirmed))
+
+    sender.publish = publish_and_count
+    for message_id in range(5):
+        sender.send_all(ProtocolMessage(1, message_id, [f"row {message_id}"]))
+
+    # The sender blocks when the window is full, until a confirm arrives
+    assert max(unconfirmed) == 2
+    sender.wait_for_confirms()
+    assert sender.unconfirmed == {}
+    assert sender.messages_sent == {1: 5}
+    assert [message.message_id for message in queued_messages(broker, "output")] == [
+        0,
+        1,
+        2,
+        3,
+        4,
+    ]
+
+
+def test_sender_coalesces_into_bundles(broker):
+    sender = new_initializer(broker).initialize_sender(
+        "output", "QUEUE", coalesce_max_rows=3
+    )
+    for message_id in range(4):
+        sender.send_all(ProtocolMessage(1, message_id, ["a", "b"]))
+    sender.send_all(ProtocolMessage(2, 0, ["c"]))
+    sender.wait_for_confirms()
+
+    queued = queued_messages(broker, "output")
+    assert [message.message_type for message in queued] == [
+        MessageType.BUNDLE,
+        MessageType.BUNDLE,
+        MessageType.PROTOCOL,
+    ]
+    assert [message.message_id for message in queued[0].messages] == [0, 1]
+    assert [message.message_id for message in queued[1].messages] == [2, 3]
+    assert (queued[2].client_id, queued[2].payload) == (2, "c")
+
+
+def test_receiver_handles_bundles(broker, start_receiver):
+    receiver = new_initializer(broker, no_log=False).initialize_receiver(
+        "input", "QUEUE", 1, 1
+    )
+    received = []
+    start_receiver(receiver, received)
+
+    sender = new_initializer(broker).initialize_sender(
+        "input", "QUEUE", coalesce_max_rows=100
+    )
+    for message_id in range(3):
+        sender.send_all(ProtocolMessage(1, message_id, [f"row {message_id}"]))
+    sender.wait_for_confirms()
+
+    # Each message of the bundle is received and counted by itself
+    wait_until(lambda: len(received) == 3)
+    assert [message.message_id for message in received] == [0, 1, 2]
+    assert [message.payload for message in received] == [
+        ["row 0"],
+        ["row 1"],
+        ["row 2"],
+    ]
+    wait_until(lambda: not receiver.channel.unacked)
+    assert receiver.messages_received == {1: 3}
+
+
+def test_receiver_micro_batches(broker, start_receiver):
+    receiver = new_initializer(broker, no_log=False).initialize_receiver(
+        "input", "QUEUE", 1, 1, micro_batch_size=3, micro_batch_timeout_ms=200
+    )
+    received = []
+    start_receiver(receiver, received)
+
+    send_messages(broker, "input", [1, 2, 3, 4])
+    send_messages(broker, "input", [1], client_id=2)
+
+    # The micro batch is processed when it is full, and when a message of other client arrives.
+    # The last one waits for the timeout.
+    wait_until(lambda: len(received) == 3)
+    assert [message.message_type for message in received] == [MessageType.BUNDLE] * 3
+    assert [
+        [message.message_id for message in bundle.messages] for bundle in received
+    ] == [[1, 2, 3], [4], [1]]
+    wait_until(lambda: not receiver.channel.unacked)
+    assert receiver.messages_received == {1: 4, 2: 1}
+
+
+def test_receiver_requeues_messages_not_ready(broker, start_receiver):
+    receiver = new_initializer(broker, no_log=False).initialize_receiver(
+        "input", "QUEUE", 1, 1
+    )
+    received = []
+
+    def not_ready_once(message):
+        received.append(message.message_id)
+        return len(received) == 1
+
+    start_receiver(receiver, [], input_callback=not_ready_once)
+
+    send_messages(broker, "input", [1, 2])
+    wait_until(lambda: len(received) == 3)
+    # The message is redelivered, so it may be a duplicate of a message sent before
+    assert received == [1, 1, 2]
+    assert receiver.possible_duplicates == {1: [1]}
+    wait_until(lambda: not receiver.channel.unacked)
+    assert receiver.messages_received == {1: 2}
+
+
+def test_sender_coalesces_by_encoded_bytes(broker):
+    sender = new_initializer(broker).initialize_sender(
+        "output", "QUEUE", coalesce_max_rows=100, coalesce_max_bytes=10
+    )
+    # 3 characters, but 6 bytes encoded, so the second message fills the bundle
+    for message_id in range(3):
+        sender.send_all(ProtocolMessage(1, message_id, ["ñññ"]))
+    assert len(queued_messages(broker, "output")) == 1
+
+    sender.wait_for_confirms()
+    queued = queued_messages(broker, "output")
+    assert [message.message_type for message in queued] == [
+        MessageType.BUNDLE,
+        MessageType.PROTOCOL,
+    ]
+    assert [message.payload for message in queued[0].messages] == ["ñññ", "ñññ"]
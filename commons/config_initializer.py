@@ -2,7 +2,7 @@ import os
 from configparser import ConfigParser
 
 
-def initialize_config(config_inputs):
+def initialize_config(config_inputs, defaults=None):
     """Parse env variables or config file to find program config params
 
     Function that search and parse program configuration parameters in the
@@ -16,15 +16,21 @@ def initialize_config(config_inputs):
         - config_params (dict): Dictionary with default config parameters.
             - Keys are the parameter names and values are the type of the parameter (int, str, bool)
                 - Example: `{"server_port": int, "logging_level": str, "connection_timeout": int}`
+        - defaults (dict): Values of the optional config parameters, used if they are not found.
+            - Example: `{"communication_backend": "BLOCKING"}`
     """
 
     config = ConfigParser(os.environ)
     # If config.ini does not exists original config object is not modified
     config.read("config.ini")
 
+    defaults = defaults or {}
     config_params = {}
     try:
         for key, value in config_inputs.items():
+            if key in defaults and key.upper() not in config["DEFAULT"]:
+                config_params[key] = value(defaults[key])
+                continue
             config_params[key] = value(
                 os.getenv(key.upper(), config["DEFAULT"][key.upper()])
             )
@@ -1,8 +1,61 @@
 import logging
+import math
+import multiprocessing
 import signal
-from commons.message import ProtocolMessage, ProtocolResultMessage
+from commons.columnar import ColumnarPayload
+from commons.flight_parser import LazyRow, project_lazy_rows
+from commons.message import (
+    MessageType,
+    PayloadFormat,
+    ProtocolMessage,
+    ProtocolResultMessage,
+)
 from commons.processor import ResponseType
 
+# Min number of messages sent to each worker, for smaller payloads the IPC costs more than the processing
+WORKER_MIN_MESSAGES = 32
+
+# Processors of the worker process, {client_id: Processor}
+worker_processors = {}
+# Max processors kept by each worker process. They are stateless, so the ones of the clients
+# that were not used recently are dropped instead of deleting them when their clients finish.
+WORKER_MAX_PROCESSORS = 16
+worker_processor_name = None
+worker_processor_config = None
+
+
+def create_processor(processor_name, processor_config, client_id):
+    if processor_config:
+        return processor_name(processor_config, client_id)
+    return processor_name(client_id)
+
+
+def initialize_worker(processor_name, processor_config):
+    """
+    Initializes a process of the workers pool of a Connection
+    """
+    global worker_processor_name, worker_processor_config
+    worker_processor_name = processor_name
+    worker_processor_config = processor_config
+    # The shutdown is handled by the Connection in the main process
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def process_in_worker(client_id, messages):
+    """
+    Processes the messages in a worker process, returning the responses in the same order
+    """
+    processor = worker_processors.pop(client_id, None)
+    if processor is None:
+        processor = create_processor(
+            worker_processor_name, worker_processor_config, client_id
+        )
+        if len(worker_processors) >= WORKER_MAX_PROCESSORS:
+            # The dict is in the order they were used, so the first one is the least recently used
+            del worker_processors[next(iter(worker_processors))]
+    worker_processors[client_id] = processor
+    return [processor.process(message) for message in messages]
+
 
 class ConnectionConfig:
     def __init__(
@@ -15,6 +68,7 @@ class ConnectionConfig:
         has_statefull_processor=False,
         result_tag_id=None,
         send_eof_default_sent_value=None,
+        workers=1,
     ):
         self.replica_id = replica_id
         self.input_fields = input_fields
@@ -26,6 +80,8 @@ class ConnectionConfig:
         self.send_eof_default_sent_value = (
             send_eof_default_sent_value  # only used for avg_max processor
         )
+        # Number of processes used to process the messages, only for stateless processors
+        self.workers = workers
 
 
 class Connection:
@@ -47,7 +103,32 @@ class Connection:
 
         self.processors = {}
 
+        # Positions in the input fields of the output fields, if the processor is a projection of them
+        self.projected_positions = None
+        self.projected_fields = processor_name.projected_fields(processor_config)
+        if (
+            self.projected_fields
+            and not self.config.has_statefull_processor
+            and set(self.projected_fields) <= set(self.config.input_fields)
+        ):
+            self.projected_positions = [
+                self.config.input_fields.index(field) for field in self.projected_fields
+            ]
+
+        self.workers_pool = None
+        if self.config.workers > 1 and not self.config.has_statefull_processor:
+            # The processors are stateless, so the messages can be processed in any process.
+            # The receiving, acks and logs are still done by this process, in the order of delivery.
+            self.workers_pool = multiprocessing.Pool(
+                self.config.workers,
+                initializer=initialize_worker,
+                initargs=(processor_name, processor_config),
+            )
+
         if self.config.has_statefull_processor:
+            # The logs of the messages received are compacted into snapshots of the processors
+            self.log_guardian.set_snapshot_processor(self.snapshot_processor)
+
             # If we have a statefull processor, we need to restore all the processors.
             clients_ids = self.log_guardian.obtain_all_active_connection_clients()
             for client_id in clients_ids:
@@ -63,20 +144,35 @@ class Connection:
             eof_callback=self.handle_eof,
             sender=self.communication_sender,
             input_fields_order=self.config.input_fields,
+            # The projections are forwarded without decoding the rows
+            decode_columnar=self.projected_positions is None,
+            # The statefull processors store the rows, so they need them as dicts
+            lazy_rows=not self.config.has_statefull_processor,
+            delete_client_callback=self.delete_processor,
         )
         self.communication_receiver.start()
 
     def get_processor(self, client_id):
         if client_id not in self.processors:
-            processor = (
-                self.processor_name(self.processor_config, client_id)
-                if self.processor_config
-                else self.processor_name(client_id)
+            self.processors[client_id] = create_processor(
+                self.processor_name, self.processor_config, client_id
             )
-            self.processors[client_id] = processor
         return self.processors[client_id]
 
+    def delete_processor(self, client_id):
+        """
+        Deletes the processor of a finished client, its data was deleted by the receiver
+        """
+        processor = self.processors.pop(client_id, None)
+        if processor is not None:
+            processor.delete()
+
     def restore_statefull_processor(self, client_id, processor):
+        snapshot = self.log_guardian.search_for_processor_snapshot(client_id)
+        if snapshot is not None:
+            processor.restore(snapshot)
+
+        # Only the messages received after the snapshot
         all_messages = self.log_guardian.search_for_all_connection_messages(client_id)
 
         for message_batch in all_messages:
@@ -84,52 +180,184 @@ class Connection:
                 # A statefull processor should not return a response, so we don't need to do anything with it.
                 processor.process(message)
 
+    def snapshot_processor(self, client_id):
+        """
+        Returns the snapshot of the processor of the client, None if it has no processor or no snapshot
+        """
+        processor = self.processors.get(client_id)
+        if processor is None:
+            return None
+        return processor.snapshot()
+
     def process(self, messages):
-        send_eof = False
+        if messages.message_type == MessageType.BUNDLE:
+            return self.process_bundle(messages)
+
+        if isinstance(messages.payload, ColumnarPayload):
+            self.send_projection(
+                messages.payload, messages.client_id, messages.message_id
+            )
+            return False
+
+        if (
+            self.projected_positions is not None
+            and messages.payload
+            and isinstance(messages.payload[0], LazyRow)
+        ):
+            # The output fields are taken from the lines, without building the rows of all the input fields
+            self.send_processed(
+                project_lazy_rows(
+                    messages.payload,
+                    self.projected_positions,
+                    self.projected_fields,
+                ),
+                messages.client_id,
+                messages.message_id,
+            )
+            return False
 
         if self.config.has_statefull_processor:
             # If we have a statefull processor, we also need to save the messages to disk to be able to recover them
             self.save_messages(messages)
 
-        processor = self.get_processor(messages.client_id)
+        processed_messages, send_eof = self.collect_responses(
+            self.process_payload(messages)
+        )
+        if processed_messages is None:
+            # If the message is not ready, it means that we need to wait for more messages.
+            # So we need to requeue the message, sending a nack.
+            return True
+
+        self.send_processed(processed_messages, messages.client_id, messages.message_id)
+        if send_eof:
+            self.send_eof_response(messages.client_id)
+        return False
+
+    def process_bundle(self, bundle):
+        """
+        Processes the messages of a micro batch of the receiver.
+
+        The payloads are processed together, so the workers pool gets bigger chunks, and the responses are
+        sent separately with the message_id of the message they come from.
+        """
+        if self.projected_positions is not None:
+            for message in bundle.messages:
+                self.process(message)
+            return False
+
+        if self.config.has_statefull_processor:
+            for message in bundle.messages:
+                self.save_messages(message)
+
+        payload = [row for message in bundle.messages for row in message.payload]
+        responses = list(
+            self.process_payload(ProtocolMessage(bundle.client_id, None, payload))
+        )
+
+        processed_by_message = []
+        send_eof = False
+        start = 0
+        for message in bundle.messages:
+            end = start + len(message.payload)
+            processed_messages, message_send_eof = self.collect_responses(
+                responses[start:end]
+            )
+            if processed_messages is None:
+                # The whole micro batch is requeued, nothing has been sent yet
+                return True
+            processed_by_message.append((processed_messages, message.message_id))
+            send_eof = send_eof or message_send_eof
+            start = end
+
+        for processed_messages, message_id in processed_by_message:
+            self.send_processed(processed_messages, bundle.client_id, message_id)
+        if send_eof:
+            self.send_eof_response(bundle.client_id)
+        return False
+
+    def collect_responses(self, responses):
+        """
+        Returns the messages to send from the responses of the processor, and if the EOF must be sent after them.
+        The messages are None if a response is NOT_READY.
+        """
+        send_eof = False
         processed_messages = []
-        for message in messages.payload:
-            processed_message = processor.process(message)
+        for processed_message in responses:
             if processed_message:
                 if processed_message.type == ResponseType.SINGLE:
                     processed_messages.append(processed_message.payload)
                 elif processed_message.type == ResponseType.MULTIPLE:
                     processed_messages.extend(processed_message.payload)
                 elif processed_message.type == ResponseType.NOT_READY:
-                    # If the message is not ready, it means that we need to wait for more messages.
-                    # So we need to requeue the message, sending a nack.
-                    return True
+                    return None, False
                 elif processed_message.type == ResponseType.SEND_EOF:
                     # If the message is SEND_EOF, it means that we need to send the EOF message
                     # after sending the processed messages.
                     processed_messages.append(processed_message.payload)
                     send_eof = True
+        return processed_messages, send_eof
 
-        if processed_messages:
-            if self.config.is_topic:
-                self.send_messages_topic(
-                    processed_messages, messages.client_id, messages.message_id
-                )
-            else:
-                self.send_messages(
-                    processed_messages, messages.client_id, messages.message_id
+    def send_projection(self, payload, client_id, message_id):
+        """
+        Sends the output fields of the rows received in the columnar format, copying their columns
+        """
+        if not payload.rows_count:
+            return
+
+        projected_payload = payload.project(self.projected_positions)
+        if (
+            self.communication_sender.config.payload_format == PayloadFormat.COLUMNAR
+            and not self.config.result_tag_id
+            and not self.config.is_topic
+        ):
+            self.communication_sender.send_all(
+                ProtocolMessage(
+                    client_id, message_id, projected_payload, PayloadFormat.COLUMNAR
                 )
-            # Log the messages sent
-            self.log_guardian.message_sent()
-        if send_eof:
-            logging.debug(
-                f"Send EOF response received from processor with client_id {messages.client_id}, sending EOF"
-            )
-            self.communication_sender.send_eof(
-                messages.client_id,
-                messages_sent=self.config.send_eof_default_sent_value,
             )
-        return False
+            return
+
+        rows = ColumnarPayload(projected_payload).rows(self.config.output_fields)
+        self.send_processed(rows, client_id, message_id)
+
+    def send_processed(self, processed_messages, client_id, message_id):
+        if not processed_messages:
+            return
+        if self.config.is_topic:
+            self.send_messages_topic(processed_messages, client_id, message_id)
+        else:
+            self.send_messages(processed_messages, client_id, message_id)
+
+    def send_eof_response(self, client_id):
+        logging.debug(
+            f"Send EOF response received from processor with client_id {client_id}, sending EOF"
+        )
+        self.communication_sender.send_eof(
+            client_id,
+            messages_sent=self.config.send_eof_default_sent_value,
+        )
+
+    def process_payload(self, messages):
+        """
+        Returns the responses of the processor for each message of the payload, in the same order.
+
+        If there is a workers pool, the payload is split between the workers.
+        """
+        payload = messages.payload
+        if not self.workers_pool or len(payload) < 2 * WORKER_MIN_MESSAGES:
+            processor = self.get_processor(messages.client_id)
+            # It is a generator, so we stop processing if a message is not ready
+            return (processor.process(message) for message in payload)
+
+        chunk_size = max(
+            WORKER_MIN_MESSAGES, math.ceil(len(payload) / self.config.workers)
+        )
+        chunks = [
+            (messages.client_id, payload[i : i + chunk_size])
+            for i in range(0, len(payload), chunk_size)
+        ]
+        responses = self.workers_pool.starmap(process_in_worker, chunks)
+        return [response for chunk in responses for response in chunk]
 
     def save_messages(self, messages):
         self.log_guardian.store_new_connection_message(messages.payload)
@@ -227,4 +455,6 @@ class Connection:
             self.communication_receiver.close()
         if self.communication_sender:
             self.communication_sender.close()
+        if self.workers_pool:
+            self.workers_pool.terminate()
         logging.info("action: shutdown | result: success")
@@ -0,0 +1,112 @@
+import logging
+import os
+import threading
+
+import pika
+from pika.exceptions import ChannelWrongStateError, ConnectionWrongStateError
+
+
+class PooledConnection:
+    """
+    Connection to the RabbitMQ server shared by the channels of a thread
+    """
+
+    def __init__(self, key, connection):
+        self.key = key
+        self.connection = connection
+        self.channels = []
+
+    def has_consumer(self):
+        """
+        Returns if one of the channels of the connection has active consumers
+        """
+        return any(
+            channel.is_open and channel.consumer_tags for channel in self.channels
+        )
+
+
+class ConnectionPool:
+    """
+    Pool of the connections to the RabbitMQ server of the process, from which the `CommunicationConnection`s
+    take their channels.
+
+    pika's BlockingConnection is not thread safe and a process can not use the connections of its parent,
+    so each thread of each process has its own connections. The channels of a thread are multiplexed over them:
+    - The publishing channels share the first connection of the thread.
+    - A consuming channel needs a connection without active consumers, because a receiver can start consuming
+    inside the callback of another one (like the Grouper does), and pika does not dispatch the deliveries of
+    a connection from inside one of its callbacks.
+
+    A connection is closed when all its channels are released.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # {(pid, thread_id, rabbit_host): [PooledConnection]}
+        self.connections = {}
+
+    def acquire(self, rabbit_host, consumer=False):
+        """
+        Returns a new channel and the PooledConnection it belongs to
+        """
+        key = (os.getpid(), threading.get_ident(), rabbit_host)
+        with self.lock:
+            connections = [
+                pooled
+                for pooled in self.connections.get(key, [])
+                if pooled.connection.is_open
+            ]
+            self.connections[key] = connections
+
+        pooled = next(
+            (
+                pooled
+                for pooled in connections
+                if not consumer or not pooled.has_consumer()
+            ),
+            None,
+        )
+        if not pooled:
+            pooled = PooledConnection(
+                key,
+                pika.BlockingConnection(pika.ConnectionParameters(host=rabbit_host)),
+            )
+            with self.lock:
+                self.connections[key].append(pooled)
+            logging.debug(
+                f"action: pool_connect | connections: {len(self.connections[key])}"
+            )
+
+        channel = pooled.connection.channel()
+        pooled.channels.append(channel)
+        return channel, pooled
+
+    def release(self, channel, pooled):
+        """
+        Closes the channel, and the connection if it has no channels left
+        """
+        try:
+            if channel.is_open:
+                channel.close()
+        except (ChannelWrongStateError, ConnectionWrongStateError):
+            # It means the channel or the connection is already closed
+            pass
+
+        with self.lock:
+            if channel in pooled.channels:
+                pooled.channels.remove(channel)
+            if pooled.channels:
+                return
+            connections = self.connections.get(pooled.key, [])
+            if pooled in connections:
+                connections.remove(pooled)
+
+        try:
+            pooled.connection.close()
+        except ConnectionWrongStateError:
+            # It means the connection is already closed
+            pass
+
+
+# Pool shared by all the CommunicationConnections of the process
+CONNECTION_POOL = ConnectionPool()
@@ -16,5 +16,11 @@ class DuplicateCatcher:
 
         return False
 
+    def forget(self, message_id):
+        """
+        Removes the message from the set of messages, so it is not a duplicate when it is received again
+        """
+        self.messages_id.discard(message_id)
+
     def get_state(self):
         return list(self.messages_id)
@@ -1,3 +1,7 @@
+import operator
+from collections.abc import Mapping
+
+
 class FlightParser:
     def __init__(self, delimeter):
         self.delimeter = delimeter
@@ -8,8 +12,85 @@ class FlightParser:
         """
         return dict(zip(input_fields, message_string.split(self.delimeter)))
 
+    def parse_lazy(self, message_strings, input_fields):
+        """
+        Return a LazyRow for each message, they are split only when a field is accessed
+        """
+        positions = {field: position for position, field in enumerate(input_fields)}
+        return [
+            LazyRow(message_string, input_fields, positions, self.delimeter)
+            for message_string in message_strings
+        ]
+
     def serialize(self, message_dict, output_fields):
         """
         Serialize the message and return a string with the output fields
         """
+        if isinstance(message_dict, LazyRow):
+            line = message_dict.line_with(output_fields)
+            if line is not None:
+                return line
         return ",".join([str(message_dict[key]) for key in output_fields])
+
+
+class LazyRow(Mapping):
+    """
+    Read only row of a text payload, with the interface of the dict returned by `FlightParser.parse`.
+    The line is split only when a field is accessed, and the row is serialized as the same line
+    if it is sent with its input fields, so the rows forwarded as they are received are never split.
+    """
+
+    __slots__ = ("line", "fields", "positions", "delimiter", "values")
+
+    def __init__(self, line, fields, positions, delimiter):
+        self.line = line
+        self.fields = fields
+        self.positions = positions
+        self.delimiter = delimiter
+        self.values = None
+
+    def __getitem__(self, field):
+        if self.values is None:
+            self.values = self.line.split(self.delimiter)
+        position = self.positions[field]
+        if position >= len(self.values):
+            # Like the dict, the fields without value in the line are missing
+            raise KeyError(field)
+        return self.values[position]
+
+    def __iter__(self):
+        if self.values is None:
+            self.values = self.line.split(self.delimiter)
+        return iter(self.fields[: len(self.values)])
+
+    def __len__(self):
+        if self.values is None:
+            self.values = self.line.split(self.delimiter)
+        return min(len(self.positions), len(self.values))
+
+    def line_with(self, fields):
+        """
+        Returns the line if it is the serialization of the row with the fields, None otherwise
+        """
+        if (
+            self.delimiter == ","
+            and fields == self.fields
+            and self.line.count(",") == len(fields) - 1
+        ):
+            return self.line
+        return None
+
+
+def project_lazy_rows(rows, positions, fields):
+    """
+    Returns dicts with the fields of the values in the positions of the lines of the rows.
+    Each line is split once and the values are taken in C, without accessing the fields of the LazyRows.
+    """
+    if len(positions) == 1:
+        position = positions[0]
+        return [{fields[0]: row.line.split(row.delimiter)[position]} for row in rows]
+
+    get_values = operator.itemgetter(*positions)
+    return [
+        dict(zip(fields, get_values(row.line.split(row.delimiter)))) for row in rows
+    ]
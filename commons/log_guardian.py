@@ -8,8 +8,16 @@ class LogGuardian:
         # no_log is only only by the server.
 
         self.restorer = Restorer(log_suffix) if not no_log else None
-        self.storer = LogStorer(log_suffix) if not no_log else None
         self.searcher = LogSearcher(log_suffix) if not no_log else None
+        self.storer = (
+            LogStorer(
+                log_suffix,
+                processed_index=self.searcher.processed_index,
+                logged_state=self.restorer.get_logged_state(),
+            )
+            if not no_log
+            else None
+        )
 
     def get_messages_received(self):
         if not self.restorer:
@@ -73,6 +81,26 @@ class LogGuardian:
             return
         self.storer.commit_message()
 
+    def enable_group_commit(self):
+        if not self.storer:
+            return
+        self.storer.enable_group_commit()
+
+    def set_snapshot_processor(self, snapshot_processor):
+        if not self.storer:
+            return
+        self.storer.set_snapshot_processor(snapshot_processor)
+
+    def persist_batch(self):
+        if not self.storer:
+            return
+        self.storer.persist_batch()
+
+    def delete_client(self, client_id):
+        if not self.storer:
+            return
+        self.storer.delete_client(client_id)
+
     # ------------------------------SEARCHER------------------------------
 
     def search_for_duplicate_messages(self, client_id, ids_to_search):
@@ -85,6 +113,11 @@ class LogGuardian:
             return []
         return self.searcher.search_for_all_connection_messages(client_id)
 
+    def search_for_processor_snapshot(self, client_id):
+        if not self.storer:
+            return None
+        return self.searcher.search_for_processor_snapshot(client_id)
+
     def obtain_all_active_connection_clients(self):
         if not self.storer:
             return []
@@ -0,0 +1,344 @@
+import struct
+import zlib
+from enum import Enum
+
+from commons.message_utils import MessageBytesReader, MessageBytesWriter
+
+
+class RecordType(Enum):
+    START = 1
+    SENT = 2
+    SAVE = 3
+    COMMIT = 4
+    CHECKPOINT = 5
+    # Changes of the state of the client of the shard saved with a message of other client
+    STATE = 6
+
+
+RECORD_TYPES = {record_type.value: record_type for record_type in RecordType}
+
+# | payload_size(4) | type(1) | client_id(8) | message_id(8) |
+HEADER = struct.Struct(">IBQQ")
+# | crc32(4) | payload_size(4) |
+TRAILER = struct.Struct(">II")
+# | key | clients_count | of each key of the state, and | client_id | count | of the counts of each client
+KEY_HEADER = struct.Struct(">BI")
+CLIENT_COUNT = struct.Struct(">QQ")
+# The keys of the state saved with each message, in the order they are written
+STATE_KEYS = ["messages_received", "messages_sent", "possible_duplicates"]
+
+
+class CorruptedRecordError(Exception):
+    pass
+
+
+class LogRecord:
+    """
+    Record of the communication log:
+
+        0              4      5           13           21         21 + N  25 + N         29 + N
+        | payload_size | type | client_id | message_id | payload  | crc32 | payload_size |
+
+    The CRC32 covers the header and the payload, so a record written partially in a crash is detected
+    by its checksum, or because the file ends before it. The payload size is repeated at the end
+    so the log can be read from the last record.
+    """
+
+    __slots__ = ("type", "client_id", "message_id", "payload")
+
+    def __init__(self, record_type, client_id, message_id, payload=b""):
+        self.type = record_type
+        self.client_id = client_id
+        self.message_id = message_id
+        self.payload = payload
+
+    def to_bytes(self):
+        record = (
+            HEADER.pack(
+                len(self.payload), self.type.value, self.client_id, self.message_id
+            )
+            + self.payload
+        )
+        return record + TRAILER.pack(zlib.crc32(record), len(self.payload))
+
+    def state(self):
+        """
+        Returns the state saved by a CHECKPOINT record
+        """
+        reader = MessageBytesReader(self.payload)
+        return decode_state(reader.read(reader.read_int(4)))
+
+    def state_delta(self):
+        """
+        Returns the StateDelta saved by a SAVE or STATE record
+        """
+        return StateDelta.from_bytes(self.payload)
+
+    def processed(self):
+        """
+        Returns the messages processed before a CHECKPOINT record, as {client_id: (processed_ids, sent_ids)}
+        """
+        reader = MessageBytesReader(self.payload)
+        reader.read(reader.read_int(4))
+        processed = {}
+        for _ in range(reader.read_int(4)):
+            client_id = reader.read_int(8)
+            processed[client_id] = (reader.read_id_runs(), reader.read_id_runs())
+        return processed
+
+
+def read_records(data):
+    """
+    Reads the records of the bytes of a communication log, which may be a mmap.
+
+    Returns a tuple with the records and the size of the bytes they take. The records after the first
+    incomplete or corrupted one are not read, so the valid log ends at that size.
+    """
+    records = []
+    offset = 0
+    while offset < len(data):
+        try:
+            record, offset = read_record(data, offset)
+        except CorruptedRecordError:
+            break
+        records.append(record)
+    return records, offset
+
+
+def read_records_reversed(data, end=None):
+    """
+    Generator of the records of the bytes of a communication log, which may be a mmap, from the last one
+    to the first one. Only the records before the end are read, if it is given.
+    Raises CorruptedRecordError when it reaches a record that is incomplete or corrupted.
+
+    The records are read in the loop instead of with `read_record`, the restore reads all the records
+    of the log since the last checkpoint and most of them have no payload.
+    """
+    end = len(data) if end is None else end
+    minimum_size = HEADER.size + TRAILER.size
+    while end > 0:
+        if end < minimum_size:
+            raise CorruptedRecordError("The log is smaller than a record")
+        trailer_start = end - TRAILER.size
+        crc, trailer_payload_size = TRAILER.unpack_from(data, trailer_start)
+        start = trailer_start - trailer_payload_size - HEADER.size
+        if start < 0:
+            raise CorruptedRecordError("The record starts before the log")
+
+        record_bytes = data[start:trailer_start]
+        payload_size, type_value, client_id, message_id = HEADER.unpack_from(
+            record_bytes
+        )
+        if (
+            payload_size != trailer_payload_size
+            or type_value not in RECORD_TYPES
+            or zlib.crc32(record_bytes) != crc
+        ):
+            raise CorruptedRecordError("The checksum of the record does not match")
+        yield LogRecord(
+            RECORD_TYPES[type_value], client_id, message_id, record_bytes[HEADER.size :]
+        )
+        end = start
+
+
+def read_record(data, offset):
+    """
+    Reads the record that starts at the offset of the data.
+    Returns a tuple with the record and the offset where it ends.
+    """
+    if offset + HEADER.size + TRAILER.size > len(data):
+        raise CorruptedRecordError("The record is incomplete")
+    payload_size, type_value, client_id, message_id = HEADER.unpack_from(data, offset)
+    payload_end = offset + HEADER.size + payload_size
+    if payload_end + TRAILER.size > len(data) or type_value not in RECORD_TYPES:
+        raise CorruptedRecordError("The record is incomplete")
+    crc, trailer_payload_size = TRAILER.unpack_from(data, payload_end)
+    if (
+        trailer_payload_size != payload_size
+        or zlib.crc32(data[offset:payload_end]) != crc
+    ):
+        raise CorruptedRecordError("The checksum of the record does not match")
+
+    record = LogRecord(
+        RECORD_TYPES[type_value],
+        client_id,
+        message_id,
+        data[offset + HEADER.size : payload_end],
+    )
+    return record, payload_end + TRAILER.size
+
+
+class StateDelta:
+    """
+    Changes of the state of the communication saved with a message. Only the values of the clients
+    that changed since the previous message are saved, so the size of a SAVE record does not grow
+    with the number of clients.
+
+    - changes: {key: {client_id: value}} the new values, with the keys of the state.
+    - removed: {key: [client_id]} the clients removed from the state.
+    - full: if True the changes are the whole state, and the previous ones are discarded.
+    """
+
+    def __init__(self, changes, removed=None, full=False):
+        self.changes = changes
+        self.removed = removed or {}
+        self.full = full
+
+    def between(previous_state, state):
+        """
+        Returns the StateDelta from the previous state to the state, the whole state if the previous one is None
+        """
+        if previous_state is None:
+            return StateDelta(
+                {key: dict(values) for key, values in state.items()}, full=True
+            )
+
+        changes = {}
+        removed = {}
+        for key, values in state.items():
+            previous_values = previous_state.get(key, {})
+            changed_values = {
+                client_id: value
+                for client_id, value in values.items()
+                # The lists of ids are replaced when they change, so most of them are the same object
+                if client_id not in previous_values
+                or (
+                    previous_values[client_id] is not value
+                    and previous_values[client_id] != value
+                )
+            }
+            if changed_values:
+                changes[key] = changed_values
+            removed_clients = previous_values.keys() - values.keys()
+            if removed_clients:
+                removed[key] = sorted(removed_clients)
+        return StateDelta(changes, removed)
+
+    def apply(self, state):
+        """
+        Applies the changes to the state, in place
+        """
+        if self.full:
+            state.clear()
+        for key, values in self.changes.items():
+            state.setdefault(key, {}).update(values)
+        for key, client_ids in self.removed.items():
+            for client_id in client_ids:
+                state.get(key, {}).pop(client_id, None)
+
+    def by_client(self):
+        """
+        Splits the changes into a StateDelta for each client, {client_id: StateDelta}, to save them
+        in the shard of the communication log of each client
+        """
+        state_deltas = {}
+        for key, values in self.changes.items():
+            for client_id, value in values.items():
+                state_delta = state_deltas.setdefault(
+                    client_id, StateDelta({}, full=self.full)
+                )
+                state_delta.changes.setdefault(key, {})[client_id] = value
+        for key, client_ids in self.removed.items():
+            for client_id in client_ids:
+                state_delta = state_deltas.setdefault(
+                    client_id, StateDelta({}, full=self.full)
+                )
+                state_delta.removed.setdefault(key, []).append(client_id)
+        return state_deltas
+
+    def to_bytes(self):
+        """
+        | full(1) | changes_size(4) | changes | key | removed_count(4) | client_id(8) | ... |
+
+        The changes are encoded like a state, and the removed clients of each key are written after them.
+        """
+        writer = MessageBytesWriter()
+        writer.write_int(1 if self.full else 0, 1)
+        changes = encode_state(self.changes)
+        writer.write_int(len(changes), 4)
+        writer.write(changes)
+        for key, client_ids in self.removed.items():
+            writer.write(KEY_HEADER.pack(STATE_KEYS.index(key), len(client_ids)))
+            writer.write_multiple_int(client_ids, 8)
+        return writer.get_bytes()
+
+    def from_bytes(bytes):
+        reader = MessageBytesReader(bytes)
+        full = reader.read_int(1) == 1
+        changes = decode_state(reader.read(reader.read_int(4)))
+        removed = {}
+        while reader.offset < len(reader.buffer):
+            key = STATE_KEYS[reader.read_int(1)]
+            removed[key] = reader.read_multiple_int(8, reader.read_int(4))
+        return StateDelta(changes, removed, full)
+
+
+def encode_state(state):
+    """
+    Encodes the state of the communication saved with each message:
+
+        | key | clients_count | client_id | value | ... |
+
+    for each of its STATE_KEYS. The value of a client is the count of messages for messages_received
+    and messages_sent, and | ids_count | id | ... | for possible_duplicates, which are a few ids.
+    """
+    parts = []
+    for key_index, key in enumerate(STATE_KEYS):
+        values = state.get(key)
+        if values is None:
+            continue
+        parts.append(KEY_HEADER.pack(key_index, len(values)))
+        if key == "possible_duplicates":
+            for client_id, ids in values.items():
+                parts.append(
+                    struct.pack(f">QI{len(ids)}Q", int(client_id), len(ids), *ids)
+                )
+        else:
+            for client_id, count in values.items():
+                parts.append(CLIENT_COUNT.pack(int(client_id), count))
+    return b"".join(parts)
+
+
+def decode_state(payload):
+    """
+    Decodes a state written with `encode_state`, with the client ids as ints
+    """
+    reader = MessageBytesReader(payload)
+    state = {}
+    while reader.offset < len(reader.buffer):
+        key = STATE_KEYS[reader.read_int(1)]
+        clients_count = reader.read_int(4)
+        if key == "possible_duplicates":
+            values = {}
+            for _ in range(clients_count):
+                client_id = reader.read_int(8)
+                values[client_id] = reader.read_multiple_int(8, reader.read_int(4))
+        else:
+            # The counts are unpacked at once, they are most of the state
+            values = dict(
+                CLIENT_COUNT.iter_unpack(reader.read(clients_count * CLIENT_COUNT.size))
+            )
+        state[key] = values
+    return state
+
+
+def encode_checkpoint(state, processed):
+    """
+    Encodes the payload of a CHECKPOINT record:
+
+        | state_size(4) | state | clients_count(4) | client_id(8) | processed_ids | sent_ids | ... |
+
+    The state is the last one saved, and processed has the ids of the messages saved before the checkpoint
+    as {client_id: (processed_ids, sent_ids)}, the ids of the messages also logged as SENT are in sent_ids.
+    The ids are written as runs, with the repeated ids of the messages saved more than once.
+    """
+    writer = MessageBytesWriter()
+    state_bytes = encode_state(state)
+    writer.write_int(len(state_bytes), 4)
+    writer.write(state_bytes)
+    writer.write_int(len(processed), 4)
+    for client_id, (processed_ids, sent_ids) in processed.items():
+        writer.write_int(client_id, 8)
+        writer.write_id_runs(processed_ids)
+        writer.write_id_runs(sent_ids)
+    return writer.get_bytes()
@@ -29,16 +29,50 @@ class ProcessedMessage:
         return hash((self.message_id, self.sent))
 
 
+class ProcessedIndex:
+    """
+    Index of the messages saved in the communication log, to search the duplicates without reading the log.
+    It is built from the log when the process starts and the LogStorer adds the messages when they are saved.
+    """
+
+    def __init__(self, processed=None):
+        # {client_id: {message_id: [sent]}} with a flag for each time the message was saved
+        self.messages = {}
+        for client_id, (processed_ids, sent_ids) in (processed or {}).items():
+            for message_id in processed_ids:
+                self.add(client_id, message_id, False)
+            for message_id in sent_ids:
+                self.add(client_id, message_id, True)
+
+    def add(self, client_id, message_id, sent):
+        self.messages.setdefault(client_id, {}).setdefault(message_id, []).append(sent)
+
+    def remove(self, client_id):
+        self.messages.pop(client_id, None)
+
+    def search(self, client_id, ids_to_search):
+        """
+        Returns a ProcessedMessage for each time the messages with the ids were saved
+        """
+        client_messages = self.messages.get(client_id, {})
+        return [
+            ProcessedMessage(message_id, sent)
+            for message_id in ids_to_search
+            for sent in client_messages.get(message_id, ())
+        ]
+
+
 class LogSearcher:
     def __init__(self, suffix=""):
         self.logger = Logger(suffix)
+        self.processed_index = ProcessedIndex(self.logger.obtain_processed_messages())
 
     def search_for_duplicate_messages(self, client_id, ids_to_search):
         """
-        Searches for duplicate messages in the log file.
+        Searches for duplicate messages in the index of the messages saved in the log file.
+        Each id is searched once, even if it is repeated in ids_to_search.
         """
-        messages = self.logger.search_processed(client_id, ids_to_search)
-        return [ProcessedMessage.from_str(message) for message in messages]
+        return self.processed_index.search(client_id, set(ids_to_search))
 
     def search_for_all_connection_messages(self, client_id):
         """
@@ -46,6 +80,12 @@ class LogSearcher:
         """
         return self.logger.obtain_all_connection_messages(client_id)
 
+    def search_for_processor_snapshot(self, client_id):
+        """
+        Searches for the snapshot of the processor of the client, the connection messages are the ones after it.
+        """
+        return self.logger.obtain_processor_snapshot(client_id)
+
     def obtain_all_active_connection_clients(self):
         """
         Obtains all the active connection clients from the log file.
@@ -1,26 +1,74 @@
+from commons.log_record import StateDelta
 from commons.logger import Logger
 
+# Messages committed between checkpoints of the logs, the restore reads at most the records of these messages
+CHECKPOINT_INTERVAL = 5000
+
 
 class LogStorer:
-    def __init__(self, suffix=""):
+    def __init__(
+        self,
+        suffix="",
+        checkpoint_interval=CHECKPOINT_INTERVAL,
+        processed_index=None,
+        logged_state=None,
+    ):
         self.logger = Logger(suffix)
         self.current_client_id = None
         self.current_message_id = None
+        self.current_message_sent = False
         self.current_state = {}
         self.connection_messages_state = []
         self.new_message_for_duplicate_catcher = False
 
+        # If True, the messages are persisted in batches by `persist_batch`
+        self.group_commit = False
+        # [(message_id, client_id, sent, state_deltas, connection_messages_state, new_message_for_duplicate_catcher)]
+        self.batch = []
+        # {client_id: message_id} the last message of each client started since the last commit
+        self.uncommitted_messages = {}
+        # The ProcessedIndex where the messages are added when they are saved, if any
+        self.processed_index = processed_index
+
+        # The state as saved in the log, only the changes from it are saved with each message.
+        # It is the state restored from the log, or None until the first message is saved,
+        # which saves the whole state.
+        self.logged_state = logged_state
+
+        # Called with a client_id at each checkpoint, returns the snapshot of its processor or None
+        self.snapshot_processor = None
+
+        self.checkpoint_interval = checkpoint_interval
+        # Messages saved since the last checkpoint
+        self.messages_since_checkpoint = 0
+
+    def enable_group_commit(self):
+        self.group_commit = True
+
+    def set_snapshot_processor(self, snapshot_processor):
+        self.snapshot_processor = snapshot_processor
+
     def new_message_received(self, message_id, client_id):
         self.current_state = {}
         self.connection_messages_state = []
         self.new_message_for_duplicate_catcher = False
         self.current_message_id = message_id
         self.current_client_id = client_id
+        self.current_message_sent = False
+        self.uncommitted_messages[client_id] = message_id
 
-        self.logger.start(message_id, client_id)
+        self.logger.start(message_id, client_id, sync=not self.group_commit)
 
     def message_sent(self):
-        self.logger.sent(self.current_message_id, self.current_client_id)
+        if self.current_message_id is None:
+            # No message was received yet, there is nothing to log the messages sent with
+            return
+        self.current_message_sent = True
+        self.logger.sent(
+            self.current_message_id,
+            self.current_client_id,
+            sync=not self.group_commit,
+        )
 
     def store_messages_received(self, messages_received):
         self.current_state["messages_received"] = messages_received
@@ -38,6 +86,31 @@ class LogStorer:
         self.connection_messages_state = message
 
     def finish_storing_message(self):
+        self.messages_since_checkpoint += 1
+
+        # The delta has its own dicts, so it is not changed by the next messages
+        state_delta = StateDelta.between(self.logged_state, self.current_state)
+        if self.logged_state is None:
+            self.logged_state = {}
+        state_delta.apply(self.logged_state)
+        # Each client has its own shard of the communication log, the changes of the state of other
+        # clients are saved in theirs. The SAVE record of the message is written even without changes.
+        state_deltas = state_delta.by_client()
+        state_deltas.setdefault(self.current_client_id, StateDelta({}))
+
+        if self.group_commit:
+            self.batch.append(
+                (
+                    self.current_message_id,
+                    self.current_client_id,
+                    self.current_message_sent,
+                    state_deltas,
+                    self.connection_messages_state,
+                    self.new_message_for_duplicate_catcher,
+                )
+            )
+            return
+
         if self.connection_messages_state:
             self.logger.save_connection(
                 self.current_message_id,
@@ -51,11 +124,87 @@ class LogStorer:
                 self.current_client_id,
             )
 
+        self.__save_state_deltas(
+            self.current_message_id, self.current_client_id, state_deltas, sync=True
+        )
+        if self.processed_index:
+            self.processed_index.add(
+                self.current_client_id,
+                self.current_message_id,
+                self.current_message_sent,
+            )
+
+    def persist_batch(self):
+        """
+        Persists all the messages of the batch with one write and fsync per log file.
+
+        The START records are persisted before the connection and duplicate catcher records, and those
+        before the SAVE records. This way the restore can always find the messages that did not finish saving.
+        If the batch has none of those records, the START and SAVE records are persisted with the same fsync.
+        """
+        if any(
+            connection_messages or new_message_for_duplicate_catcher
+            for _, _, _, _, connection_messages, new_message_for_duplicate_catcher in self.batch
+        ):
+            self.logger.flush()
+
+            for (
+                message_id,
+                client_id,
+                _,
+                _,
+                connection_messages,
+                new_message_for_duplicate_catcher,
+            ) in self.batch:
+                if connection_messages:
+                    self.logger.save_connection(
+                        message_id, client_id, connection_messages, sync=False
+                    )
+                if new_message_for_duplicate_catcher:
+                    self.logger.save_duplicate_catcher(
+                        message_id, client_id, sync=False
+                    )
+            self.logger.flush()
+
+        for message_id, client_id, _, state_deltas, _, _ in self.batch:
+            self.__save_state_deltas(message_id, client_id, state_deltas, sync=False)
+        self.logger.flush()
+
+        if self.processed_index:
+            for message_id, client_id, sent, _, _, _ in self.batch:
+                self.processed_index.add(client_id, message_id, sent)
+        self.batch = []
+
+    def __save_state_deltas(self, message_id, client_id, state_deltas, sync):
+        # The SAVE record of the message is the last one, it marks the message as saved
+        for delta_client_id, state_delta in state_deltas.items():
+            if delta_client_id != client_id:
+                self.logger.save_state(message_id, delta_client_id, state_delta, sync)
         self.logger.save_communication(
-            self.current_message_id,
-            self.current_client_id,
-            self.current_state,
+            message_id, client_id, state_deltas[client_id], sync
         )
 
     def commit_message(self):
-        self.logger.commit(self.current_message_id, self.current_client_id)
+        # With group commit the COMMIT is persisted with the next batch. If it is lost in a crash,
+        # the messages of the batch are only restored as possible duplicates, they were already saved.
+        # Each shard of the batch gets the COMMIT of the last message of its client.
+        for client_id, message_id in self.uncommitted_messages.items():
+            self.logger.commit(message_id, client_id, sync=not self.group_commit)
+        self.uncommitted_messages = {}
+
+        if self.messages_since_checkpoint >= self.checkpoint_interval:
+            # All the messages saved are committed, so the logs can be compacted
+            self.logger.checkpoint(self.snapshot_processor)
+            self.messages_since_checkpoint = 0
+
+    def delete_client(self, client_id):
+        """
+        Deletes the logs of a client that finished. Its state must be removed from the state stored
+        with the next messages too, the state logged of the client is forgotten.
+        """
+        self.logger.delete_client(client_id)
+        self.uncommitted_messages.pop(client_id, None)
+        for values in (self.logged_state or {}).values():
+            values.pop(client_id, None)
+        if self.processed_index:
+            self.processed_index.remove(client_id)
@@ -1,288 +1,606 @@
 import json
 import logging
+import mmap
 import multiprocessing as mp
 import os
+from collections import Counter
+from contextlib import contextmanager
 from enum import Enum
 
+from commons.log_record import (
+    CorruptedRecordError,
+    LogRecord,
+    RecordType,
+    encode_checkpoint,
+    read_records,
+    read_records_reversed,
+)
 
-class RestoreType(Enum):
-    COMMIT = 0
-    SAVE_DONE = 1
-    SENT = 2
 
+class FsyncPolicy(Enum):
+    """
+    When the records of the messages received are synced to disk. A message is always acked after the fsync
+    that covers its records.
+
+    - ALWAYS: every record is written and synced when it is logged, and each message is acked by itself.
+    - BATCH: the records of a batch of messages are synced together when the batch is full or when its first
+    message waited the batch timeout, with one fsync per log file, and the batch is acked with a single ack.
+    - INTERVAL: like BATCH, but the batch is only synced when the timeout expires, whatever its size.
+    The batches are bounded by the prefetch window, so it must be big enough for the messages of an interval.
+    """
 
-class LoggerToken:
-    START = "START"
-    SENT = "SENT"
-    SAVE_BEGIN = "SAVE BEGIN"
-    SAVE_DONE = "SAVE DONE"
-    COMMIT = "COMMIT"
+    ALWAYS = 0
+    BATCH = 1
+    INTERVAL = 2
 
 
 CONNECTION_LOG_FILE_PATH = "connection_log.txt"
-COMMUNICATION_LOG_FILE_PATH = "communication_log.txt"
+COMMUNICATION_LOG_FILE_PATH = "communication_log.bin"
 DUPLICATE_CATCHER_LOG_FILE_PATH = "duplicate_catcher_log.txt"
+# Ids of the clients with a shard of the communication log, a line for each one
+MANIFEST_FILE_PATH = "communication_manifest.txt"
+# Snapshot of the statefull processor of a client, with the generation of the snapshot
+SNAPSHOT_FILE_PATH = "snapshot.bin"
+SNAPSHOT_GENERATION_SIZE = 8
+# Id of the first line of a connection log compacted into a snapshot, the line is "snapshot/{generation}"
+SNAPSHOT_LINE_ID = b"snapshot"
 
 
 class Logger:
     """
     Logger used for durability and recovery.
+
+    The communication log is a sequence of binary LogRecords, the connection and duplicate catcher logs
+    are text files with a line for each message. The communication log is sharded by client: the records
+    of the messages of each client are in its own file, listed in a manifest, so each client is restored
+    and searched by itself, and the shard of a finished client is deleted without reading it.
+
+    Every record is written and synced to disk when it is logged, unless it is logged with `sync=False`.
+    In that case it is kept in memory until `flush` is called, which writes all the pending records of a file
+    with a single write and fsync (group commit).
+
+    Each log file is opened once with O_APPEND and kept open, the records are written with `os.write`
+    and synced with `fdatasync`, the file size is the only metadata the restore needs.
     """
 
     def __init__(self, suffix=""):
         self.suffix = suffix
-        self.communication_log_file_path = f"{COMMUNICATION_LOG_FILE_PATH}{self.suffix}"
+        self.manifest_file_path = f"{MANIFEST_FILE_PATH}{self.suffix}"
         self.lock = mp.Lock()
 
-    def start(self, message_id, client_id):
+        # {file_path: [record]} records waiting to be written to disk
+        self.pending = {}
+        # {file_path: fd} descriptors of the log files written by this logger
+        self.descriptors = {}
+        # Clients with a shard of the communication log, as listed in the manifest
+        self.shards = read_manifest(self.manifest_file_path)
+        # Clients whose shards were written since the last checkpoint
+        self.shards_to_checkpoint = set()
+        # Clients whose connection logs were written since the last checkpoint
+        self.connections_to_snapshot = set()
+
+    def shard_file_path(self, client_id):
         """
-        Logs the start of a message in the log file.
+        Returns the path of the shard of the communication log of the client
         """
-        with self.lock:
-            with open(self.communication_log_file_path, "a") as f:
-                f.write(f"{LoggerToken.START} {message_id} / {client_id}\n")
+        return f"{client_id}_{COMMUNICATION_LOG_FILE_PATH}{self.suffix}"
 
-                # Flush the file to disk
-                f.flush()
-                os.fsync(f.fileno())
+    def start(self, message_id, client_id, sync=True):
+        """
+        Logs the start of a message in the log file.
+        """
+        self.__append_to_shard(LogRecord(RecordType.START, client_id, message_id), sync)
 
-    def sent(self, message_id, client_id):
+    def sent(self, message_id, client_id, sync=True):
         """
         Logs a message as sent in the log file.
         """
-        with self.lock:
-            with open(self.communication_log_file_path, "a") as f:
-                f.write(f"{LoggerToken.SENT} {message_id} / {client_id}\n")
-
-                # Flush the file to disk
-                f.flush()
-                os.fsync(f.fileno())
+        self.__append_to_shard(LogRecord(RecordType.SENT, client_id, message_id), sync)
 
-    def save_communication(self, message_id, client_id, message):
+    def save_communication(self, message_id, client_id, state_delta, sync=True):
         """
-        Saves a message in the log file.
+        Saves the StateDelta of a message in the log file.
         """
-        with self.lock:
-            with open(self.communication_log_file_path, "a") as f:
-                f.write(f"{LoggerToken.SAVE_BEGIN} {message_id} / {client_id}\n")
-                f.write(f"{json.dumps(message)}\n")
-                f.write(f"{LoggerToken.SAVE_DONE} {message_id} / {client_id}\n")
+        self.__append_to_shard(
+            LogRecord(RecordType.SAVE, client_id, message_id, state_delta.to_bytes()),
+            sync,
+        )
 
-                # Flush the file to disk
-                f.flush()
-                os.fsync(f.fileno())
+    def save_state(self, message_id, client_id, state_delta, sync=True):
+        """
+        Saves the StateDelta of a client changed by a message of other client in the log file of the client.
+        """
+        self.__append_to_shard(
+            LogRecord(RecordType.STATE, client_id, message_id, state_delta.to_bytes()),
+            sync,
+        )
 
-    def save_connection(self, message_id, client_id, messages):
+    def save_connection(self, message_id, client_id, messages, sync=True):
         """
         Appends a message to the connection log file.
         """
-        with self.lock:
-            file_path = f"{client_id}_{CONNECTION_LOG_FILE_PATH}{self.suffix}"
-            with open(file_path, "a") as f:
-                f.write(f"{message_id}/{json.dumps(messages)}\n")
-
-                # Flush the file to disk
-                f.flush()
-                os.fsync(f.fileno())
+        file_path = f"{client_id}_{CONNECTION_LOG_FILE_PATH}{self.suffix}"
+        self.connections_to_snapshot.add(client_id)
+        self.__append(
+            file_path, f"{message_id}/{json.dumps(messages)}\n".encode("utf-8"), sync
+        )
 
-    def save_duplicate_catcher(self, message_id, client_id):
+    def save_duplicate_catcher(self, message_id, client_id, sync=True):
         """
         Saves a message to the duplicate catcher log file.
         """
+        file_path = f"{client_id}_{DUPLICATE_CATCHER_LOG_FILE_PATH}{self.suffix}"
+        self.__append(file_path, f"{message_id}\n".encode("utf-8"), sync)
+
+    def commit(self, message_id, client_id, sync=True):
+        """
+        Logs a message as committed in the log file.
+        """
+        self.__append_to_shard(
+            LogRecord(RecordType.COMMIT, client_id, message_id), sync
+        )
+
+    def flush(self):
+        """
+        Writes all the pending records to disk, with one write and fsync per file.
+        """
         with self.lock:
-            file_path = f"{client_id}_{DUPLICATE_CATCHER_LOG_FILE_PATH}{self.suffix}"
-            with open(file_path, "a") as f:
-                f.write(f"{message_id}\n")
+            for file_path in list(self.pending):
+                self.__write_pending(file_path)
 
-                # Flush the file to disk
-                f.flush()
-                os.fsync(f.fileno())
+    def __append(self, file_path, record, sync):
+        with self.lock:
+            # The record is added after the pending ones of the file to keep the order
+            self.pending.setdefault(file_path, []).append(record)
+            if sync:
+                self.__write_pending(file_path)
+
+    def __append_to_shard(self, record, sync):
+        # The record is encoded first, so a record that can not be encoded does not list its shard
+        record_bytes = record.to_bytes()
+        with self.lock:
+            if record.client_id not in self.shards:
+                # The shard is listed in the manifest before its first record is written
+                self.shards.add(record.client_id)
+                self.pending.setdefault(self.manifest_file_path, []).append(
+                    f"{record.client_id}\n".encode("utf-8")
+                )
+                self.__write_pending(self.manifest_file_path)
+            self.shards_to_checkpoint.add(record.client_id)
+        self.__append(self.shard_file_path(record.client_id), record_bytes, sync)
 
-    def commit(self, message_id, client_id):
+    def delete_client(self, client_id):
         """
-        Logs a message as committed in the log file.
+        Deletes the logs of a client that finished: its shard of the communication log, its connection
+        and duplicate catcher logs and the snapshot of its processor. The shard is removed from the manifest before its file is deleted,
+        so the files left by a crash are deleted by `delete_orphan_shards`. The logs are not read.
+        """
+        file_paths = [
+            self.shard_file_path(client_id),
+            f"{client_id}_{CONNECTION_LOG_FILE_PATH}{self.suffix}",
+            f"{client_id}_{DUPLICATE_CATCHER_LOG_FILE_PATH}{self.suffix}",
+            f"{client_id}_{SNAPSHOT_FILE_PATH}{self.suffix}",
+        ]
+        with self.lock:
+            for file_path in file_paths:
+                self.pending.pop(file_path, None)
+                self.__close_descriptor(file_path)
+
+            if client_id in self.shards:
+                self.shards.remove(client_id)
+                self.shards_to_checkpoint.discard(client_id)
+                self.__close_descriptor(self.manifest_file_path)
+                replace_file(self.manifest_file_path, encode_manifest(self.shards))
+
+            for file_path in file_paths:
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+        logging.debug(f"Deleted the logs of client {client_id}")
+
+    def delete_orphan_shards(self):
+        """
+        Deletes the logs of the clients that are not in the manifest, left by a crash while deleting them.
+        """
+        with self.lock:
+            for file_name in os.listdir():
+                for log_file_path in [
+                    COMMUNICATION_LOG_FILE_PATH,
+                    CONNECTION_LOG_FILE_PATH,
+                    DUPLICATE_CATCHER_LOG_FILE_PATH,
+                    SNAPSHOT_FILE_PATH,
+                ]:
+                    if not file_name.endswith(f"_{log_file_path}{self.suffix}"):
+                        continue
+                    client_id = int(file_name.split("_")[0])
+                    if client_id not in self.shards:
+                        logging.debug(f"Deleting the orphan log file {file_name}")
+                        os.remove(file_name)
+
+    def close(self):
+        """
+        Closes the log files, the pending records are not written.
         """
         with self.lock:
-            with open(self.communication_log_file_path, "a") as f:
-                f.write(f"{LoggerToken.COMMIT} {message_id} / {client_id}\n")
+            for file_path in list(self.descriptors):
+                self.__close_descriptor(file_path)
+
+    def __write_pending(self, file_path):
+        records = self.pending.pop(file_path, None)
+        if not records:
+            return
+        fd = self.__descriptor(file_path)
+        data = memoryview(b"".join(records))
+        while data:
+            # A write to a regular file may be partial, for example if it is interrupted by a signal
+            written = os.write(fd, data)
+            data = data[written:]
 
-                # Flush the file to disk
-                f.flush()
-                os.fsync(f.fileno())
+        # Flush the file to disk
+        os.fdatasync(fd)
+
+    def __descriptor(self, file_path):
+        fd = self.descriptors.get(file_path)
+        if fd is None:
+            fd = os.open(file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self.descriptors[file_path] = fd
+        return fd
+
+    def __close_descriptor(self, file_path):
+        fd = self.descriptors.pop(file_path, None)
+        if fd is not None:
+            os.close(fd)
+
+    def __truncate_last_line(self, file_path):
+        # The file is reopened by the next write. With O_APPEND the writes always go to the end of the
+        # file, even if it was truncated by other logger, but the descriptor is not kept across the truncate.
+        with self.lock:
+            self.__close_descriptor(file_path)
+            truncate_last_line_of_file(file_path)
 
     def restore(self):
         """
-        Restores the state of the processor from the log file.
+        Restores the state of the processor from the shards of all the clients, one after the other.
+        Returns the state and the uncommitted messages like `restore_client`.
+        """
+        return merge_restored(
+            self.restore_client(client_id) for client_id in sorted(self.shards)
+        )
+
+    def restore_client(self, client_id):
+        """
+        Restores the state of a client from its shard of the communication log.
+
+        The messages after the last COMMIT did not finish correctly, they may have been processed and not acked.
+        The records of the ones that did not finish saving are deleted from the connection and duplicate catcher logs.
+        A record written partially in a crash is truncated from the communication log.
 
         Returns:
-            A tuple with the restore type, message_id, client_id and state.
-            restore_type: The type of the restore. It can be "COMMIT", "SAVE DONE" or "SENT".
-            message_id: The id of the message.
-            client_id: The id of the client.
-            state: The state to restore.
+            A tuple with the state and the uncommitted messages.
+            state: The state of the client saved by the last message that finished saving, None if there is no state.
+                It is the state of the last checkpoint with the deltas saved after it applied.
+            uncommitted_messages: List of (message_id, client_id) of the messages started after the last COMMIT,
+                from the last one to the first one.
         """
         with self.lock:
+            state = None
+            # The deltas saved after the checkpoint or the last full delta, from the last one to the first one
+            state_deltas = []
+            uncommitted_messages = []
+            saved_messages = set()
+            committed = False
+            for record in self.__read_communication_log(client_id, truncate=True):
+                if record.type == RecordType.CHECKPOINT:
+                    # The checkpoint is the first record of the log, all the messages before it were committed
+                    if not state_deltas or not state_deltas[-1].full:
+                        state = record.state()
+                    break
+                elif record.type == RecordType.COMMIT:
+                    committed = True
+                elif record.type in (RecordType.SAVE, RecordType.STATE):
+                    if not committed and record.type == RecordType.SAVE:
+                        saved_messages.add((record.message_id, record.client_id))
+                    if not state_deltas or not state_deltas[-1].full:
+                        state_deltas.append(record.state_delta())
+                elif record.type == RecordType.START and not committed:
+                    uncommitted_messages.append((record.message_id, record.client_id))
+
+                if committed and state_deltas and state_deltas[-1].full:
+                    break
+
+            state = fold_state(state, state_deltas)
+
+        for message_id, client_id in uncommitted_messages:
+            if (message_id, client_id) in saved_messages:
+                continue
+            logging.debug(
+                f"Message {message_id} of client {client_id} did not finish saving"
+            )
             try:
-                lines = read_file_bottom_to_top_generator(
-                    self.communication_log_file_path
+                self.delete_connection_messages(message_id, client_id)
+            except (FileNotFoundError, StopIteration):
+                logging.debug(
+                    "The connection log file doesn't exist or it is empty, nothing to delete"
                 )
-                line = next(lines)
-                if line.startswith(LoggerToken.COMMIT):
-                    logging.debug("Restoring from COMMIT")
-                    return self.__handle_commit(line, lines)
-                elif line.startswith(LoggerToken.SAVE_DONE):
-                    logging.debug("Restoring from SAVE DONE")
-                    return self.__handle_save_done(line, lines)
-                elif (
-                    line.startswith(LoggerToken.SAVE_BEGIN)
-                    or line.startswith(LoggerToken.SENT)
-                    or line.startswith(LoggerToken.START)
-                ):
-                    logging.debug("Restoring from SENT")
-                    return self.__handle_sent(line, lines)
-            except (StopIteration, FileNotFoundError):
-                # We reached the beggining of the file or the file doesn't exist
-                pass
-            return None, None, None, None
-
-    def __handle_commit(self, line, lines):
-        return self.__get_last_message(RestoreType.COMMIT, line, lines)
-
-    def __handle_save_done(self, line, lines):
-        return self.__get_last_message(RestoreType.SAVE_DONE, line, lines)
-
-    def __handle_sent(self, line, lines):
-        # Go to the START of this message
-        while not line.startswith(LoggerToken.START):
-            line = next(lines)
-        message_id, client_id = line.split(LoggerToken.START)[1].split(" / ")
-        state = None
-        try:
-            # Restore from the last COMMITed message
-            line = next(lines)
-            while not line.startswith(LoggerToken.COMMIT):
-                line = next(lines)
-            # Go to the SAVE DONE of this message
-            while not line.startswith(LoggerToken.SAVE_DONE):
-                line = next(lines)
-            state = next(lines)
-        except StopIteration:
-            # We reached the beggining of the file
-            pass
-        if state:
-            state = json.loads(state)
 
-        try:
-            self.delete_connection_messages(message_id.strip(), client_id.strip())
-        except (FileNotFoundError, StopIteration):
-            logging.debug(
-                "The connection log file doesn't exist or it is empty, nothing to delete"
-            )
-            pass
+            try:
+                self.delete_duplicate_catcher_messages(message_id, client_id)
+            except (FileNotFoundError, StopIteration):
+                logging.debug(
+                    "The duplicate catcher log file doesn't exist or it is empty, nothing to delete"
+                )
 
-        try:
-            self.delete_duplicate_catcher_messages(
-                message_id.strip(), client_id.strip()
-            )
-        except (FileNotFoundError, StopIteration):
-            logging.debug(
-                "The duplicate catcher log file doesn't exist or it is empty, nothing to delete"
-            )
-            pass
-
-        return RestoreType.SENT, int(message_id.strip()), int(client_id.strip()), state
-
-    def __get_last_message(self, restore_type, line, lines):
-        # Go to the START of this message
-        while not line.startswith(LoggerToken.SAVE_DONE):
-            line = next(lines)
-        state = next(lines)
-        while not line.startswith(LoggerToken.START):
-            line = next(lines)
-        message_id, client_id = line.split(LoggerToken.START)[1].split(" / ")
-        return (
-            restore_type,
-            int(message_id.strip()),
-            int(client_id.strip()),
-            json.loads(state),
-        )
+        return state, uncommitted_messages
 
     def delete_connection_messages(self, message_id, client_id):
         """
         Deletes if necessary the messages of a connection from the connection log file.
         """
         file_path = f"{client_id}_{CONNECTION_LOG_FILE_PATH}{self.suffix}"
-        lines = read_file_bottom_to_top_generator(file_path)
-        line_to_search = next(lines)
-        if line_to_search.startswith(str(message_id)):
+        with mapped_file(file_path) as data:
+            line_to_search = next(read_lines_reversed(data))
+        if line_to_search.split(b"/", 1)[0] == str(message_id).encode("utf-8"):
             logging.debug(
                 f"Deleting last connection message {message_id} of client {client_id}"
             )
-            truncate_last_line_of_file(file_path)
+            self.__truncate_last_line(file_path)
 
     def delete_duplicate_catcher_messages(self, message_id, client_id):
         """
         Deletes if necessary the messages of a connection from the duplicate catcher log file.
         """
         file_path = f"{client_id}_{DUPLICATE_CATCHER_LOG_FILE_PATH}{self.suffix}"
-        lines = read_file_bottom_to_top_generator(file_path)
-        line_to_search = next(lines)
-        if line_to_search.startswith(str(message_id)):
+        with mapped_file(file_path) as data:
+            line_to_search = next(read_lines_reversed(data))
+        if line_to_search.strip() == str(message_id).encode("utf-8"):
             logging.debug(
                 f"Deleting last duplicate catcher message {message_id} of client {client_id}"
             )
-            truncate_last_line_of_file(file_path)
+            self.__truncate_last_line(file_path)
 
     def search_processed(self, client_id, ids_to_search):
         """
-        Searches if the given ids were processed and sent.
+        Searches if the given ids were processed and sent, only the shard of the client is read.
         """
-        processed_ids_found = []
         with self.lock:
-            try:
-                lines = read_file_bottom_to_top_generator(
-                    self.communication_log_file_path
+            _, processed = self.__scan_communication_log(client_id, with_state=False)
+
+        ids_to_search = set(ids_to_search)
+        processed_ids, sent_ids = processed.get(client_id, ([], []))
+        return [
+            str(message_id)
+            for message_id in processed_ids
+            if message_id in ids_to_search
+        ] + [f"{message_id}S" for message_id in sent_ids if message_id in ids_to_search]
+
+    def checkpoint(self, snapshot_processor=None):
+        """
+        Compacts the communication and duplicate catcher logs. It must be called when all the messages
+        logged are committed, so the restore does not need the records of any of them.
+
+        Each shard of the communication log written since the last checkpoint is replaced by a CHECKPOINT record
+        with the last state of the client and the ids of its messages saved, which is all the restore
+        and `search_processed` read from it.
+        The duplicate catcher logs are rewritten with a line for each run of consecutive ids.
+
+        If snapshot_processor is given, it is called with each client whose connection log was written
+        since the last checkpoint, and returns the snapshot of its processor or None. The processor
+        has processed all the messages of the connection log, so the log is compacted into the snapshot.
+        """
+        with self.lock:
+            for file_path in list(self.pending):
+                self.__write_pending(file_path)
+
+            for client_id in self.shards_to_checkpoint:
+                state, processed = self.__scan_communication_log(
+                    client_id, with_state=True
                 )
-                for line in lines:
-                    if line.startswith(LoggerToken.SAVE_DONE):
-                        message_id, message_client_id = line.split(
-                            LoggerToken.SAVE_DONE
-                        )[1].split(" / ")
-                        if (
-                            int(message_client_id.strip()) != client_id
-                            or int(message_id.strip()) not in ids_to_search
-                        ):
-                            continue
-                        try:
-                            while not line.startswith(
-                                LoggerToken.START
-                            ) and not line.startswith(LoggerToken.SENT):
-                                line = next(lines)
-                        except StopIteration:
-                            # We reached the beggining of the file
-                            pass
-                        if line.startswith(LoggerToken.SENT):
-                            processed_ids_found.append(message_id.strip() + "S")
-                        elif line.startswith(LoggerToken.START):
-                            processed_ids_found.append(message_id.strip())
-            except FileNotFoundError:
-                # The file doesn't exist
-                logging.debug("The file doesn't exist, nothing to search")
-                return processed_ids_found
-        return processed_ids_found
+                if state is None:
+                    # Nothing was saved yet
+                    continue
+
+                checkpoint = LogRecord(
+                    RecordType.CHECKPOINT,
+                    client_id,
+                    0,
+                    encode_checkpoint(state, processed),
+                )
+                file_path = self.shard_file_path(client_id)
+                self.__close_descriptor(file_path)
+                replace_file(file_path, checkpoint.to_bytes())
+
+            for client_id in self.obtain_all_active_duplicate_catcher_clients():
+                file_path = (
+                    f"{client_id}_{DUPLICATE_CATCHER_LOG_FILE_PATH}{self.suffix}"
+                )
+                with mapped_file(file_path) as data:
+                    message_ids = sorted(
+                        int(message_id)
+                        for line in read_lines(data)
+                        for message_id in parse_duplicate_catcher_line(line)
+                    )
+                self.__close_descriptor(file_path)
+                replace_file(
+                    file_path, encode_duplicate_catcher_ids(message_ids).encode("utf-8")
+                )
+
+            for client_id in self.connections_to_snapshot if snapshot_processor else []:
+                snapshot = snapshot_processor(client_id)
+                if snapshot is not None:
+                    self.__save_snapshot(client_id, snapshot)
+
+        logging.debug(
+            f"Checkpoint of the logs, with the messages of {len(self.shards_to_checkpoint)} clients"
+        )
+        self.shards_to_checkpoint = set()
+        self.connections_to_snapshot = set()
+
+    def __save_snapshot(self, client_id, snapshot):
+        """
+        Saves the snapshot of the processor of the client, and replaces its connection log with a line
+        with the generation of the snapshot. If the logger crashes before replacing the log, the restore finds
+        a line of other generation, and all the messages of the log are already in the snapshot.
+        """
+        file_path = f"{client_id}_{SNAPSHOT_FILE_PATH}{self.suffix}"
+        generation = (self.obtain_snapshot_generation(client_id) or 0) + 1
+        replace_file(
+            file_path,
+            generation.to_bytes(SNAPSHOT_GENERATION_SIZE, byteorder="big") + snapshot,
+        )
+
+        connection_file_path = f"{client_id}_{CONNECTION_LOG_FILE_PATH}{self.suffix}"
+        self.__close_descriptor(connection_file_path)
+        replace_file(
+            connection_file_path,
+            SNAPSHOT_LINE_ID + f"/{generation}\n".encode("utf-8"),
+        )
+        logging.debug(
+            f"Snapshot {generation} of the processor of client {client_id}, {len(snapshot)} bytes"
+        )
+
+    def obtain_snapshot_generation(self, client_id):
+        """
+        Returns the generation of the snapshot of the processor of the client, None if there is no snapshot
+        """
+        try:
+            with open(f"{client_id}_{SNAPSHOT_FILE_PATH}{self.suffix}", "rb") as f:
+                return int.from_bytes(f.read(SNAPSHOT_GENERATION_SIZE), byteorder="big")
+        except FileNotFoundError:
+            return None
+
+    def obtain_processor_snapshot(self, client_id):
+        """
+        Returns the snapshot of the processor of the client, None if there is no snapshot
+        """
+        try:
+            with open(f"{client_id}_{SNAPSHOT_FILE_PATH}{self.suffix}", "rb") as f:
+                return f.read()[SNAPSHOT_GENERATION_SIZE:]
+        except FileNotFoundError:
+            return None
+
+    def obtain_processed_messages(self):
+        """
+        Obtains the ids of the messages saved in the communication log, as {client_id: (processed_ids, sent_ids)},
+        the ids of the messages also logged as SENT are in sent_ids.
+        """
+        processed = {}
+        with self.lock:
+            for client_id in self.shards:
+                _, client_processed = self.__scan_communication_log(
+                    client_id, with_state=False
+                )
+                processed.update(client_processed)
+        return processed
+
+    def __scan_communication_log(self, client_id, with_state):
+        """
+        Reads the shard of the client of the communication log up to the checkpoint.
+
+        Returns a tuple with the state saved, None if there is no state or with_state is False,
+        and the ids of the messages saved as {client_id: (processed_ids, sent_ids)}.
+        """
+        state = None
+        state_deltas = []
+        processed = {}
+        # Messages saved whose START record was not found yet, and the ones of them logged as SENT.
+        # With group commit the START and SENT records of a batch are written before its SAVE records,
+        # so they are matched by id instead of taking the closest ones, counting the ids saved twice in a batch.
+        saved_messages = Counter()
+        sent_messages = Counter()
+        for record in self.__read_communication_log(client_id):
+            if record.type == RecordType.CHECKPOINT:
+                if with_state and (not state_deltas or not state_deltas[-1].full):
+                    state = record.state()
+                for client_id, (processed_ids, sent_ids) in record.processed().items():
+                    client_processed = processed.setdefault(client_id, ([], []))
+                    client_processed[0].extend(processed_ids)
+                    client_processed[1].extend(sent_ids)
+                break
+
+            message = (record.message_id, record.client_id)
+            if record.type in (RecordType.SAVE, RecordType.STATE):
+                if with_state and (not state_deltas or not state_deltas[-1].full):
+                    state_deltas.append(record.state_delta())
+                if record.type == RecordType.SAVE:
+                    saved_messages[message] += 1
+            elif record.type == RecordType.SENT and saved_messages[message] > 0:
+                # The SENT record is after the START record of its message
+                sent_messages[message] += 1
+            elif record.type == RecordType.START and saved_messages[message] > 0:
+                saved_messages[message] -= 1
+                client_processed = processed.setdefault(record.client_id, ([], []))
+                if sent_messages[message] > 0:
+                    sent_messages[message] -= 1
+                    client_processed[1].append(record.message_id)
+                else:
+                    client_processed[0].append(record.message_id)
+
+        return fold_state(state, state_deltas), processed
+
+    def __read_communication_log(self, client_id, truncate=False):
+        """
+        Generator of the records of the shard of the client, from the last one to the first one.
+
+        If the last record is incomplete or corrupted, because the logger crashed while writing it,
+        only the records before it are returned. If truncate is True, its bytes are removed from the file.
+        """
+        file_path = self.shard_file_path(client_id)
+        try:
+            with mapped_file(file_path) as data:
+                valid_size = len(data)
+                try:
+                    # The records are appended, so only the last one may have been written partially
+                    next(read_records_reversed(data), None)
+                except CorruptedRecordError:
+                    _, valid_size = read_records(data)
+                    logging.warning(
+                        f"The communication log of client {client_id} has {len(data) - valid_size} bytes of a record written partially"
+                    )
+
+                if valid_size == len(data) or not truncate:
+                    yield from read_records_reversed(data, valid_size)
+                    return
+        except FileNotFoundError:
+            logging.debug(f"The communication log of client {client_id} doesn't exist")
+            return
+
+        # The file can not be truncated while it is mapped
+        self.__close_descriptor(file_path)
+        truncate_file(file_path, valid_size)
+        with mapped_file(file_path) as data:
+            yield from read_records_reversed(data)
 
     def obtain_all_connection_messages(self, client_id):
         """
         Obtains all connection messages from the connection log file.
+        If the processor of the client has a snapshot, only the messages received after it are returned.
         """
         file_path = f"{client_id}_{CONNECTION_LOG_FILE_PATH}{self.suffix}"
         messages = []
+        generation = self.obtain_snapshot_generation(client_id)
         with self.lock:
             try:
-                lines = read_file_bottom_to_top_generator(file_path)
-                for line in lines:
-                    message_id, message = line.split("/", 1)
-                    messages.append(json.loads(message.strip()))
+                with mapped_file(file_path) as data:
+                    # All the lines are read, so they are split at once and their messages,
+                    # after the id, are decoded as a single JSON array from the last one
+                    lines = data[:].split(b"\n")
+
+                line_id, _, line_generation = lines[0].partition(b"/")
+                if line_id == SNAPSHOT_LINE_ID:
+                    lines = lines[1:]
+                if generation is not None and (
+                    line_id != SNAPSHOT_LINE_ID or int(line_generation) != generation
+                ):
+                    # The logger crashed before compacting the log, the snapshot has all its messages
+                    return messages
+                messages = json.loads(
+                    b"["
+                    + b",".join(
+                        line.partition(b"/")[2] for line in reversed(lines) if line
+                    )
+                    + b"]"
+                )
             except FileNotFoundError:
                 # The file doesn't exist
                 logging.debug("The file doesn't exist, no connection messages found")
@@ -312,10 +630,9 @@ class Logger:
         messages = []
         with self.lock:
             try:
-                lines = read_file_bottom_to_top_generator(file_path)
-                for line in lines:
-                    message_id = line.strip()
-                    messages.append(message_id)
+                with mapped_file(file_path) as data:
+                    for line in read_lines_reversed(data):
+                        messages.extend(parse_duplicate_catcher_line(line))
             except FileNotFoundError:
                 # The file doesn't exist
                 logging.debug(
@@ -340,70 +657,166 @@ class Logger:
         return client_ids
 
 
-def truncate_last_line_of_file(filename):
+def merge_restored(restored):
+    """
+    Merges the states and the uncommitted messages restored from the shards of the clients,
+    each one is a tuple like the ones returned by `Logger.restore_client`.
+    """
+    state = None
+    uncommitted_messages = []
+    for client_state, client_uncommitted_messages in restored:
+        if client_state is not None:
+            state = state if state is not None else {}
+            for key, values in client_state.items():
+                state.setdefault(key, {}).update(values)
+        uncommitted_messages.extend(client_uncommitted_messages)
+    return state, uncommitted_messages
+
+
+def read_manifest(filename):
     """
-    Truncates a file from the nth line from the bottom.
+    Returns the ids of the clients listed in the manifest. A line written partially in a crash is ignored,
+    the shard of its client was not written. The lines that are not a client id are ignored too.
+    """
+    client_ids = set()
+    try:
+        with open(filename, "rb") as f:
+            for line in f:
+                if line.endswith(b"\n") and line.strip().isdigit():
+                    client_ids.add(int(line))
+    except FileNotFoundError:
+        pass
+    return client_ids
 
-    Parameters:
-        filename: The path of the file to truncate.
+
+def encode_manifest(client_ids):
+    return "".join(f"{client_id}\n" for client_id in sorted(client_ids)).encode("utf-8")
+
+
+def fold_state(state, state_deltas):
     """
-    with open(filename, "rb+") as f:
-        # Move the pointer (similar to a cursor in a text editor) to the end of the file
-        f.seek(0, os.SEEK_END)
+    Returns the state with the deltas applied, from the last one of the list to the first one.
+    None if there is no state and no deltas.
+    """
+    if state is None and not state_deltas:
+        return None
+    state = state if state is not None else {}
+    for state_delta in reversed(state_deltas):
+        state_delta.apply(state)
+    return state
 
-        # This code means the following code skips the very last character in the file -
-        # i.e. in the case the last line is null we delete the last line
-        # and the penultimate one
-        pos = f.tell() - 1
 
-        # Read each character in the file one at a time from the penultimate
-        # character going backwards, searching for a newline character
-        # If we find a new line, exit the search
-        while pos > 0 and f.read(1) != b"\n":
-            pos -= 1
-            f.seek(pos, os.SEEK_SET)
+def parse_duplicate_catcher_line(line):
+    """
+    Returns the ids of a line of a duplicate catcher log, as strings. The line is an id,
+    or the first and last ids of a run of consecutive ids like "first-last" if the log was compacted.
+    """
+    line = line.decode("utf-8").strip()
+    if "-" not in line:
+        return [line]
+    first, last = line.split("-")
+    return [str(message_id) for message_id in range(int(first), int(last) + 1)]
+
+
+def encode_duplicate_catcher_ids(message_ids):
+    """
+    Returns the lines of a compacted duplicate catcher log with the sorted ids
+    """
+    lines = []
+    index = 0
+    while index < len(message_ids):
+        last = index
+        while (
+            last + 1 < len(message_ids)
+            and message_ids[last + 1] <= message_ids[last] + 1
+        ):
+            last += 1
+        if last == index:
+            lines.append(f"{message_ids[index]}\n")
+        else:
+            lines.append(f"{message_ids[index]}-{message_ids[last]}\n")
+        index = last + 1
+    return "".join(lines)
+
+
+def replace_file(filename, data):
+    """
+    Replaces the content of a file with the data atomically: the data is written and synced
+    to a temporary file which is renamed to the file.
+    """
+    temporary_filename = f"{filename}.tmp"
+    with open(temporary_filename, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_filename, filename)
 
-        f.seek(pos, os.SEEK_SET)
-        f.truncate()
+    # Sync the directory so the rename is durable
+    directory_fd = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+    try:
+        os.fsync(directory_fd)
+    finally:
+        os.close(directory_fd)
 
-        if pos > 0:
-            # Write the end of file character
-            f.write(b"\n")
 
-        # Flush the file to disk
+def truncate_file(filename, size):
+    """
+    Truncates a file to the size and syncs it to disk.
+    """
+    with open(filename, "rb+") as f:
+        f.truncate(size)
         f.flush()
         os.fsync(f.fileno())
 
 
-def read_file_bottom_to_top_generator(filename, chunk_size=1024):
+def truncate_last_line_of_file(filename):
     """
-    Generator that reads a file from the end to the beginning.
+    Truncates the last line of a file, the file keeps the line break of the previous line.
 
     Parameters:
-        filename: The path of the file to read.
-        chunk_size: The size of the chunks to read.
+        filename: The path of the file to truncate.
     """
-    with open(filename, "rb") as f:
-        f.seek(0, os.SEEK_END)
-        file_size = f.tell()
-        remainder = b""
+    with mapped_file(filename) as data:
+        # The line break of the last line is skipped
+        previous_line_break = data.rfind(b"\n", 0, max(len(data) - 1, 0))
+    truncate_file(filename, previous_line_break + 1 if previous_line_break > 0 else 0)
 
-        while file_size > 0:
-            read_size = min(chunk_size, file_size)
-            f.seek(-read_size, os.SEEK_CUR)
-            chunk = f.read(read_size)
-            f.seek(-read_size, os.SEEK_CUR)
-            file_size -= read_size
 
-            lines = (chunk + remainder).decode("utf-8").splitlines()
+@contextmanager
+def mapped_file(filename):
+    """
+    Maps the file to memory to read it without copying it, the lines and records are only copied
+    when they are read. An empty file can not be mapped, so it is read as empty bytes.
+    """
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
 
-            # Save the last line if it's incomplete
-            remainder = lines[0].encode("utf-8")
-            lines.pop(0)
 
-            for line in reversed(lines):
-                yield line
+def read_lines(data):
+    """
+    Generator of the lines of the data, as bytes without the line break
+    """
+    start = 0
+    while start < len(data):
+        end = data.find(b"\n", start)
+        if end == -1:
+            end = len(data)
+        yield data[start:end]
+        start = end + 1
+
 
-        # Yield the last line if it's incomplete
-        if remainder:
-            yield remainder.decode("utf-8")
+def read_lines_reversed(data):
+    """
+    Generator of the lines of the data from the last one to the first one, as bytes without the line break
+    """
+    end = len(data)
+    if data[end - 1 : end] == b"\n":
+        end -= 1
+    while end > 0:
+        start = data.rfind(b"\n", 0, end) + 1
+        yield data[start:end]
+        end = start - 1
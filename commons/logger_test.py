@@ -0,0 +1,426 @@
+import os
+
+import pytest
+
+from commons.log_record import (
+    CorruptedRecordError,
+    LogRecord,
+    RecordType,
+    StateDelta,
+    encode_checkpoint,
+    read_record,
+    read_records,
+    read_records_reversed,
+)
+from commons.log_storer import LogStorer
+from commons.logger import Logger, read_manifest
+from commons.restorer import Restorer
+
+STATE = {
+    "messages_received": {1: 3, 2: 5},
+    "messages_sent": {1: 2, 2: 4},
+    "possible_duplicates": {1: [7, 8], 2: []},
+}
+
+
+@pytest.fixture(autouse=True)
+def log_directory(tmp_path, monkeypatch):
+    # The logs are written in the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def save_message(logger, message_id, client_id, state_delta):
+    logger.start(message_id, client_id)
+    logger.save_communication(message_id, client_id, state_delta)
+    logger.commit(message_id, client_id)
+
+
+def test_records_round_trip():
+    records = []
+    for client_id in [1, 2]:
+        records += [
+            LogRecord(RecordType.START, client_id, 10),
+            LogRecord(RecordType.SENT, client_id, 10),
+            LogRecord(
+                RecordType.SAVE,
+                client_id,
+                10,
+                StateDelta.between(None, STATE).to_bytes(),
+            ),
+            LogRecord(RecordType.COMMIT, client_id, 10),
+            LogRecord(
+                RecordType.CHECKPOINT,
+                client_id,
+                0,
+                encode_checkpoint(STATE, {client_id: ([1, 2, 3], [10])}),
+            ),
+        ]
+    data = b"".join(record.to_bytes() for record in records)
+
+    read, size = read_records(data)
+    assert size == len(data)
+    assert [(r.type, r.client_id, r.message_id) for r in read] == [
+        (r.type, r.client_id, r.message_id) for r in records
+    ]
+    assert [r.payload for r in read] == [r.payload for r in records]
+    assert [r.payload for r in read_records_reversed(data)] == [
+        r.payload for r in reversed(records)
+    ]
+
+    state_delta = read[2].state_delta()
+    assert state_delta.full
+    assert state_delta.changes == STATE
+    assert read[4].state() == STATE
+    assert read[4].processed() == {1: ([1, 2, 3], [10])}
+    assert read[9].processed() == {2: ([1, 2, 3], [10])}
+
+
+def test_corrupted_record_is_detected():
+    records = [
+        LogRecord(RecordType.START, 1, 1),
+        LogRecord(RecordType.SAVE, 1, 1, b"state"),
+        LogRecord(RecordType.COMMIT, 1, 1),
+    ]
+    data = bytearray(b"".join(record.to_bytes() for record in records))
+    second_record = len(records[0].to_bytes())
+    # A byte of the payload of the SAVE record changed
+    data[second_record + 22] ^= 0xFF
+
+    with pytest.raises(CorruptedRecordError):
+        read_record(data, second_record)
+    read, size = read_records(data)
+    assert [record.type for record in read] == [RecordType.START]
+    assert size == second_record
+    with pytest.raises(CorruptedRecordError):
+        list(read_records_reversed(data))
+
+
+def test_incomplete_record_is_detected():
+    data = LogRecord(RecordType.SAVE, 1, 1, b"state").to_bytes()
+    for size in [0, 5, len(data) - 1]:
+        assert read_records(data[:size]) == ([], 0)
+
+
+def test_restore_truncates_record_written_partially():
+    logger = Logger()
+    save_message(logger, 1, 1, StateDelta.between(None, STATE))
+    logger.close()
+    shard_file_path = logger.shard_file_path(1)
+    valid_size = os.path.getsize(shard_file_path)
+    with open(shard_file_path, "ab") as f:
+        f.write(LogRecord(RecordType.START, 1, 2).to_bytes()[:-3])
+
+    state, uncommitted_messages = Logger().restore_client(1)
+    assert state == STATE
+    assert uncommitted_messages == []
+    assert os.path.getsize(shard_file_path) == valid_size
+
+    restored_state = Restorer(processes=1).restored_state
+    assert restored_state.messages_received == STATE["messages_received"]
+    assert restored_state.possible_duplicates == STATE["possible_duplicates"]
+
+
+def test_restore_uncommitted_message():
+    logger = Logger()
+    save_message(logger, 1, 1, StateDelta.between(None, STATE))
+    logger.start(2, 1)
+    logger.close()
+
+    restored_state = Restorer(processes=1).restored_state
+    assert restored_state.messages_received == STATE["messages_received"]
+    assert restored_state.possible_duplicates[1] == [7, 8, 2]
+
+
+def count_fsyncs(monkeypatch):
+    fsyncs = []
+    fdatasync = os.fdatasync
+
+    def counting_fdatasync(fd):
+        fsyncs.append(fd)
+        fdatasync(fd)
+
+    monkeypatch.setattr(os, "fdatasync", counting_fdatasync)
+    return fsyncs
+
+
+def test_group_commit_writes_records_on_flush(monkeypatch):
+    logger = Logger()
+    # The manifest lists the shards before they are written
+    logger.start(1, 1, sync=False)
+    logger.start(1, 2, sync=False)
+    fsyncs = count_fsyncs(monkeypatch)
+    for client_id in [1, 2]:
+        logger.save_communication(1, client_id, StateDelta({}), sync=False)
+        logger.commit(1, client_id, sync=False)
+    assert not os.path.exists(logger.shard_file_path(1))
+    assert fsyncs == []
+
+    logger.flush()
+    # One write and fsync for each shard
+    assert len(fsyncs) == 2
+    for client_id in [1, 2]:
+        records, _ = read_records(open(logger.shard_file_path(client_id), "rb").read())
+        assert [record.type for record in records] == [
+            RecordType.START,
+            RecordType.SAVE,
+            RecordType.COMMIT,
+        ]
+
+
+def test_sync_writes_each_record(monkeypatch):
+    logger = Logger()
+    logger.start(1, 1)
+    fsyncs = count_fsyncs(monkeypatch)
+    logger.save_communication(1, 1, StateDelta({}))
+    logger.commit(1, 1)
+    assert len(fsyncs) == 2
+
+
+def test_storer_persists_batch(monkeypatch):
+    storer = LogStorer()
+    storer.enable_group_commit()
+    fsyncs = count_fsyncs(monkeypatch)
+    for message_id in [1, 2, 3]:
+        storer.new_message_received(message_id, 1)
+        storer.store_messages_received({1: message_id})
+        storer.store_possible_duplicates({})
+        storer.finish_storing_message()
+    # Only the manifest is synced, to list the shard of the client
+    assert len(fsyncs) == 1
+    assert Logger().restore() == (None, [])
+
+    storer.persist_batch()
+    # The START and SAVE records of the batch share the fsync of the shard
+    assert len(fsyncs) == 2
+    state, uncommitted_messages = Logger().restore()
+    assert state["messages_received"] == {1: 3}
+    assert uncommitted_messages == [(3, 1), (2, 1), (1, 1)]
+
+    storer.commit_message()
+    storer.persist_batch()
+    # The COMMIT is persisted with the next batch
+    assert Logger().restore() == ({"messages_received": {1: 3}}, [])
+
+
+def test_storer_persists_connection_records_first(monkeypatch):
+    storer = LogStorer()
+    storer.enable_group_commit()
+    storer.new_message_received(1, 1)
+    storer.store_messages_received({1: 1})
+    storer.store_new_connection_message([{"legId": "a"}])
+    storer.finish_storing_message()
+    fsyncs = count_fsyncs(monkeypatch)
+
+    storer.persist_batch()
+    # The START records, the connection records and the SAVE records are synced one after the other
+    assert len(fsyncs) == 3
+    assert storer.logger.obtain_all_connection_messages(1) == [[{"legId": "a"}]]
+
+
+def test_restore_after_checkpoint():
+    logger = Logger()
+    save_message(logger, 1, 1, StateDelta.between(None, STATE))
+    logger.checkpoint()
+    state = dict(STATE, messages_received={1: 4, 2: 5})
+    save_message(logger, 3, 1, StateDelta.between(STATE, state))
+    logger.close()
+
+    assert Logger().restore() == (state, [])
+
+
+def test_checkpoint_compacts_logs():
+    logger = Logger()
+    for message_id in [1, 2, 3, 5]:
+        logger.start(message_id, 1)
+        if message_id == 2:
+            logger.sent(message_id, 1)
+        logger.save_communication(message_id, 1, StateDelta.between(None, STATE))
+        logger.save_duplicate_catcher(message_id, 1)
+        logger.commit(message_id, 1)
+    processed = logger.obtain_processed_messages()
+
+    logger.checkpoint()
+    with open(logger.shard_file_path(1), "rb") as f:
+        records, _ = read_records(f.read())
+    assert [record.type for record in records] == [RecordType.CHECKPOINT]
+    assert records[0].state() == STATE
+    # The ids of the messages saved are kept in the checkpoint, the order does not matter
+    for client_processed in [processed, logger.obtain_processed_messages()]:
+        processed_ids, sent_ids = client_processed[1]
+        assert sorted(processed_ids) == [1, 3, 5]
+        assert sent_ids == [2]
+
+    with open("1_duplicate_catcher_log.txt") as f:
+        assert f.read() == "1-3\n5\n"
+    assert sorted(logger.obtain_all_duplicate_catcher_messages(1)) == [
+        "1",
+        "2",
+        "3",
+        "5",
+    ]
+
+
+def test_state_delta_round_trip():
+    state = {
+        "messages_received": {1: 4, 2: 5},
+        "messages_sent": {2: 4},
+        "possible_duplicates": {1: [7, 8], 2: []},
+    }
+    state_delta = StateDelta.from_bytes(StateDelta.between(STATE, state).to_bytes())
+    assert not state_delta.full
+    assert state_delta.changes == {"messages_received": {1: 4}}
+    assert state_delta.removed == {"messages_sent": [1]}
+
+    restored = {key: dict(values) for key, values in STATE.items()}
+    state_delta.apply(restored)
+    assert restored == state
+
+
+def test_state_delta_by_client():
+    state = {
+        "messages_received": {1: 4, 2: 6},
+        "messages_sent": {2: 4},
+        "possible_duplicates": {1: [7, 8], 2: []},
+    }
+    state_deltas = StateDelta.between(STATE, state).by_client()
+    assert state_deltas[1].changes == {"messages_received": {1: 4}}
+    assert state_deltas[1].removed == {"messages_sent": [1]}
+    assert state_deltas[2].changes == {"messages_received": {2: 6}}
+    assert state_deltas[2].removed == {}
+
+
+def test_storer_saves_changes_of_state():
+    storer = LogStorer()
+    for message_id, messages_received in [(1, {1: 1}), (2, {1: 1, 2: 1}), (3, {2: 1})]:
+        storer.new_message_received(message_id, 2 if message_id > 1 else 1)
+        storer.store_messages_received(messages_received)
+        storer.finish_storing_message()
+        storer.commit_message()
+
+    with open(storer.logger.shard_file_path(2), "rb") as f:
+        records, _ = read_records(f.read())
+    saves = [
+        record.state_delta() for record in records if record.type == RecordType.SAVE
+    ]
+    # Only the changes of the state are saved, the whole state was saved by the first message
+    assert [(delta.full, delta.changes) for delta in saves] == [
+        (False, {"messages_received": {2: 1}}),
+        (False, {}),
+    ]
+    # The client removed from the state is saved in its own shard
+    assert Logger().restore() == ({"messages_received": {2: 1}}, [])
+
+
+def test_manifest_reload():
+    logger = Logger()
+    save_message(logger, 1, 1, StateDelta.between(None, STATE))
+    logger.start(1, 2)
+    logger.close()
+    assert Logger().shards == {1, 2}
+
+    # A line that is not a client id, and a line written partially in a crash
+    with open(logger.manifest_file_path, "ab") as f:
+        f.write(b"junk\n3")
+    assert read_manifest(logger.manifest_file_path) == {1, 2}
+    assert Logger().shards == {1, 2}
+
+
+def test_restore_deletes_orphan_shards(log_directory):
+    logger = Logger()
+    save_message(logger, 1, 1, StateDelta.between(None, STATE))
+    logger.close()
+    # The files of a client left by a crash after it was removed from the manifest
+    for file_name in ["3_communication_log.bin", "3_connection_log.txt"]:
+        (log_directory / file_name).write_bytes(b"")
+
+    Restorer(processes=1)
+    assert sorted(os.listdir(log_directory)) == [
+        "1_communication_log.bin",
+        "communication_manifest.txt",
+    ]
+
+
+def save_snapshot_file(client_id, generation, snapshot):
+    # Like the snapshot saved by a checkpoint that crashed before compacting the connection log
+    with open(f"{client_id}_snapshot.bin", "wb") as f:
+        f.write(generation.to_bytes(8, byteorder="big") + snapshot)
+
+
+def test_checkpoint_snapshots_processor():
+    logger = Logger()
+    logger.save_connection(1, 1, [{"legId": "a"}])
+    logger.save_connection(1, 2, [{"legId": "b"}])
+    snapshots = {1: b"processor 1", 2: None}
+    logger.checkpoint(snapshots.get)
+
+    assert logger.obtain_processor_snapshot(1) == b"processor 1"
+    assert logger.obtain_snapshot_generation(1) == 1
+    assert logger.obtain_all_connection_messages(1) == []
+    # Without a snapshot the connection log is kept
+    assert logger.obtain_processor_snapshot(2) is None
+    assert logger.obtain_all_connection_messages(2) == [[{"legId": "b"}]]
+
+    logger.save_connection(2, 1, [{"legId": "c"}])
+    assert logger.obtain_all_connection_messages(1) == [[{"legId": "c"}]]
+    logger.checkpoint(lambda client_id: b"processor 1 again")
+    assert logger.obtain_processor_snapshot(1) == b"processor 1 again"
+    assert logger.obtain_snapshot_generation(1) == 2
+    assert logger.obtain_all_connection_messages(1) == []
+
+
+def test_snapshot_generation_mismatch():
+    logger = Logger()
+    logger.save_connection(1, 1, [{"legId": "a"}])
+    # The first snapshot was saved, but the connection log was not compacted
+    save_snapshot_file(1, 1, b"processor 1")
+    assert logger.obtain_all_connection_messages(1) == []
+
+    logger.checkpoint(lambda client_id: b"processor 1")
+    logger.save_connection(2, 1, [{"legId": "b"}])
+    assert logger.obtain_all_connection_messages(1) == [[{"legId": "b"}]]
+    # The next snapshot was saved, the connection log still has the line of the previous generation
+    save_snapshot_file(1, 3, b"processor 1 with b")
+    assert logger.obtain_all_connection_messages(1) == []
+    assert logger.obtain_processor_snapshot(1) == b"processor 1 with b"
+
+
+def test_delete_client(log_directory):
+    logger = Logger()
+    for client_id in [1, 2]:
+        save_message(logger, 1, client_id, StateDelta.between(None, STATE))
+        logger.save_connection(1, client_id, [{"legId": "a"}])
+        logger.save_duplicate_catcher(1, client_id)
+    save_snapshot_file(1, 1, b"processor 1")
+
+    logger.delete_client(1)
+    logger.close()
+    assert sorted(os.listdir(log_directory)) == [
+        "2_communication_log.bin",
+        "2_connection_log.txt",
+        "2_duplicate_catcher_log.txt",
+        "communication_manifest.txt",
+    ]
+
+    logger = Logger()
+    assert logger.shards == {2}
+    assert logger.obtain_all_active_connection_clients() == [2]
+    assert logger.restore() == (STATE, [])
+
+
+def test_storer_forgets_deleted_client():
+    storer = LogStorer()
+    for client_id in [1, 2]:
+        storer.new_message_received(1, client_id)
+        storer.store_messages_received({1: 1, 2: 1} if client_id == 2 else {1: 1})
+        storer.finish_storing_message()
+        storer.commit_message()
+
+    storer.delete_client(1)
+    storer.new_message_received(2, 2)
+    storer.store_messages_received({2: 2})
+    storer.finish_storing_message()
+    storer.commit_message()
+    # The deleted client is not saved again as removed from the state
+    assert storer.logger.shards == {2}
+    assert Logger().restore() == ({"messages_received": {2: 2}}, [])
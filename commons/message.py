@@ -1,6 +1,12 @@
+import zlib
 from enum import Enum
+from commons.columnar import columnar_rows_count
 from commons.log_searcher import ProcessedMessage
-from commons.message_utils import MessageBytesReader, MessageBytesWriter
+from commons.message_utils import (
+    COMPRESSION_MIN_BYTES,
+    MessageBytesReader,
+    MessageBytesWriter,
+)
 
 
 class MessageType(Enum):
@@ -11,6 +17,13 @@ class MessageType(Enum):
     EOF_AGGREGATION = 4
     EOF_FINISH = 5
     EOF_RESULT = 6
+    BUNDLE = 7
+    COMPRESSED = 8
+
+
+class PayloadFormat(Enum):
+    TEXT = 0
+    COLUMNAR = 1
 
 
 class Message:
@@ -41,6 +54,10 @@ class Message:
             return EOFFinishMessage.from_bytes(client_id, reader)
         elif type == MessageType.EOF_RESULT.value:
             return EOFResultMessage.from_bytes(client_id, reader)
+        elif type == MessageType.BUNDLE.value:
+            return BundleMessage.from_bytes(client_id, reader)
+        elif type == MessageType.COMPRESSED.value:
+            return CompressedMessage.from_bytes(client_id, reader)
         else:
             raise Exception("Unknown message type")
 
@@ -62,29 +79,49 @@ class ProtocolMessage(Message):
     """
     Protocol message structure:
 
-        0      2          10           18         N
-        | type | client_id | message_id | payload |
+        0      2          10           18               19         N
+        | type | client_id | message_id | payload_format | payload |
 
+    The payload is utf-8 text with a row per line, or a payload in the columnar format of commons/columnar.py.
     """
 
-    def __init__(self, client_id, message_id, payload):
+    def __init__(
+        self, client_id, message_id, payload, payload_format=PayloadFormat.TEXT
+    ):
         message_type = MessageType.PROTOCOL
         super().__init__(message_type, client_id)
         self.message_id = message_id
         self.payload = payload
+        self.payload_format = payload_format
 
     def from_bytes(client_id, reader):
         message_id = reader.read_int(8)
-        payload = reader.read_to_end()
-        payload = payload.decode("utf-8")
+        payload_format = PayloadFormat(reader.read_int(1))
+        if payload_format == PayloadFormat.COLUMNAR:
+            # It is decoded by the receiver, only the columns it needs
+            payload = reader.read_to_end()
+        else:
+            payload = reader.read_str_to_end()
 
-        return ProtocolMessage(client_id, message_id, payload)
+        return ProtocolMessage(client_id, message_id, payload, payload_format)
 
     def to_bytes_impl(self, writer):
         writer.write_int(self.message_id, 8)
-        writer.write(self.payload.encode("utf-8"))
+        writer.write_int(self.payload_format.value, 1)
+        if self.payload_format == PayloadFormat.COLUMNAR:
+            writer.write(self.payload)
+        else:
+            writer.write(self.payload.encode("utf-8"))
         return writer.get_bytes()
 
+    def rows_count(self):
+        """
+        Returns the number of rows of the serialized payload
+        """
+        if self.payload_format == PayloadFormat.COLUMNAR:
+            return columnar_rows_count(self.payload)
+        return self.payload.count("\n") + 1
+
 
 class ProtocolResultMessage(Message):
     """
@@ -101,12 +138,13 @@ class ProtocolResultMessage(Message):
         self.tag_id = tag_id
         self.message_id = message_id
         self.payload = payload
+        # The results are always sent as text
+        self.payload_format = PayloadFormat.TEXT
 
     def from_bytes(client_id, reader):
         tag_id = reader.read_int(1)
         message_id = reader.read_int(8)
-        payload = reader.read_to_end()
-        payload = payload.decode("utf-8")
+        payload = reader.read_str_to_end()
 
         return ProtocolResultMessage(client_id, tag_id, message_id, payload)
 
@@ -116,13 +154,21 @@ class ProtocolResultMessage(Message):
         writer.write(self.payload.encode("utf-8"))
         return writer.get_bytes()
 
+    def rows_count(self):
+        """
+        Returns the number of rows of the serialized payload
+        """
+        return self.payload.count("\n") + 1
+
 
 class EOFMessage(Message):
     """
     EOF message structure:
 
-        0      2          10               18                         22                     N
-        | type | client_id | messages_sent | possible_duplicates_count | possible_duplicates |
+        0      2          10               18                    N
+        | type | client_id | messages_sent | possible_duplicates |
+
+        The lists of ids are written as runs of consecutive ids, see MessageBytesWriter.write_id_runs.
 
         A possible duplicate is the id of a message that was sent to the client but the client
 
@@ -136,16 +182,14 @@ class EOFMessage(Message):
 
     def from_bytes(client_id, reader):
         messages_sent = reader.read_int(8)
-        possible_duplicates_count = reader.read_int(4)
-        possible_duplicates = reader.read_multiple_int(8, possible_duplicates_count)
+        possible_duplicates = reader.read_id_runs()
 
         return EOFMessage(client_id, messages_sent, possible_duplicates)
 
     def to_bytes_impl(self, writer):
         writer.write_int(self.messages_sent, 8)
 
-        writer.write_int(len(self.possible_duplicates), 4)
-        writer.write_multiple_int(self.possible_duplicates, 8)
+        writer.write_id_runs(self.possible_duplicates)
 
         return writer.get_bytes()
 
@@ -154,14 +198,14 @@ class EOFDiscoveryMessage(Message):
     """
     EOF discovery message structure:
 
-        0      2          10                       18                                   22                              N
-        | type | client_id | original_messages_sent | original_possible_duplicates_count | original_possible_duplicates |
+        0      2          10                       18                             N
+        | type | client_id | original_messages_sent | original_possible_duplicates |
 
-        N                  N+8             N+16                        N+24                   X
-        | messages_received | messages_sent | possible_duplicates_count | possible_duplicates |
+        N                  N+8             N+16                  X                 Y
+        | messages_received | messages_sent | possible_duplicates | replica_id_seen |
 
-        X                      X+4                Y
-        | replica_id_seen_count | replica_id_seen |
+        The lists of message ids are written as runs of consecutive ids (MessageBytesWriter.write_id_runs)
+        and replica_id_seen as a bitmask (MessageBytesWriter.write_id_set), so they stay small after many requeues.
     """
 
     def __init__(
@@ -190,19 +234,14 @@ class EOFDiscoveryMessage(Message):
     def from_bytes(client_id, reader):
         original_messages_sent = reader.read_int(8)
 
-        original_possible_duplicates_count = reader.read_int(4)
-        original_possible_duplicates = reader.read_multiple_int(
-            8, original_possible_duplicates_count
-        )
+        original_possible_duplicates = reader.read_id_runs()
 
         messages_received = reader.read_int(8)
         messages_sent = reader.read_int(8)
 
-        possible_duplicates_count = reader.read_int(4)
-        possible_duplicates = reader.read_multiple_int(8, possible_duplicates_count)
+        possible_duplicates = reader.read_id_runs()
 
-        replica_id_seen_count = reader.read_int(4)
-        replica_id_seen = reader.read_multiple_int(8, replica_id_seen_count)
+        replica_id_seen = reader.read_id_set()
 
         return EOFDiscoveryMessage(
             client_id,
@@ -217,17 +256,14 @@ class EOFDiscoveryMessage(Message):
     def to_bytes_impl(self, writer):
         writer.write_int(self.original_messages_sent, 8)
 
-        writer.write_int(len(self.original_possible_duplicates), 4)
-        writer.write_multiple_int(self.original_possible_duplicates, 8)
+        writer.write_id_runs(self.original_possible_duplicates)
 
         writer.write_int(self.messages_received, 8)
         writer.write_int(self.messages_sent, 8)
 
-        writer.write_int(len(self.possible_duplicates), 4)
-        writer.write_multiple_int(self.possible_duplicates, 8)
+        writer.write_id_runs(self.possible_duplicates)
 
-        writer.write_int(len(self.replica_id_seen), 4)
-        writer.write_multiple_int(self.replica_id_seen, 8)
+        writer.write_id_set(self.replica_id_seen)
 
         return writer.get_bytes()
 
@@ -236,14 +272,18 @@ class EOFAggregationMessage(Message):
     """
     EOF aggregation message structure:
 
-        0      2          10                       18                                   22                              N
-        | type | client_id | original_messages_sent | original_possible_duplicates_count | original_possible_duplicates |
+        0      2          10                       18                             N
+        | type | client_id | original_messages_sent | original_possible_duplicates |
+
+        N                  N+8             N+16                  X                 Y
+        | messages_received | messages_sent | possible_duplicates | replica_id_seen |
 
-        N                  N+8             N+16                        N+20                   X
-        | messages_received | messages_sent | possible_duplicates_count | possible_duplicates |
+        Y                           Z                             W
+        | possible_duplicates_processed_by_ids | possible_duplicates_processed_by_sent |
 
-        X                      X+4                Y                                      Y+4                                Z
-        | replica_id_seen_count | replica_id_seen | possible_duplicates_processed_by_count | possible_duplicates_processed_by |
+        The lists of message ids are written as runs of consecutive ids (MessageBytesWriter.write_id_runs)
+        and replica_id_seen as a bitmask (MessageBytesWriter.write_id_set). The processed messages are sorted by id
+        and their sent flags are a bitmap in the same order (MessageBytesWriter.write_flags).
 
     """
 
@@ -278,24 +318,21 @@ class EOFAggregationMessage(Message):
     def from_bytes(client_id, reader):
         original_messages_sent = reader.read_int(8)
 
-        original_possible_duplicates_count = reader.read_int(4)
-        original_possible_duplicates = reader.read_multiple_int(
-            8, original_possible_duplicates_count
-        )
+        original_possible_duplicates = reader.read_id_runs()
 
         messages_received = reader.read_int(8)
         messages_sent = reader.read_int(8)
 
-        possible_duplicates_count = reader.read_int(4)
-        possible_duplicates = reader.read_multiple_int(8, possible_duplicates_count)
+        possible_duplicates = reader.read_id_runs()
 
-        replica_id_seen_count = reader.read_int(4)
-        replica_id_seen = reader.read_multiple_int(8, replica_id_seen_count)
+        replica_id_seen = reader.read_id_set()
 
-        possible_duplicates_processed_by_count = reader.read_int(4)
-        possible_duplicates_processed_by = reader.read_multiple_object(
-            9, possible_duplicates_processed_by_count, ProcessedMessage
-        )
+        processed_ids = reader.read_id_runs()
+        processed_sent = reader.read_flags(len(processed_ids))
+        possible_duplicates_processed_by = [
+            ProcessedMessage(message_id, sent)
+            for message_id, sent in zip(processed_ids, processed_sent)
+        ]
 
         return EOFAggregationMessage(
             client_id,
@@ -311,20 +348,26 @@ class EOFAggregationMessage(Message):
     def to_bytes_impl(self, writer):
         writer.write_int(self.original_messages_sent, 8)
 
-        writer.write_int(len(self.original_possible_duplicates), 4)
-        writer.write_multiple_int(self.original_possible_duplicates, 8)
+        writer.write_id_runs(self.original_possible_duplicates)
 
         writer.write_int(self.messages_received, 8)
         writer.write_int(self.messages_sent, 8)
 
-        writer.write_int(len(self.possible_duplicates), 4)
-        writer.write_multiple_int(self.possible_duplicates, 8)
+        writer.write_id_runs(self.possible_duplicates)
 
-        writer.write_int(len(self.replica_id_seen), 4)
-        writer.write_multiple_int(self.replica_id_seen, 8)
+        writer.write_id_set(self.replica_id_seen)
 
-        writer.write_int(len(self.possible_duplicates_processed_by), 4)
-        writer.write_multiple_int(self.possible_duplicates_processed_by, 9)
+        # The sent flags are in the order of the ids, sorted
+        processed_by = sorted(
+            self.possible_duplicates_processed_by,
+            key=lambda processed_message: processed_message.message_id,
+        )
+        writer.write_id_runs(
+            [processed_message.message_id for processed_message in processed_by]
+        )
+        writer.write_flags(
+            [processed_message.sent for processed_message in processed_by]
+        )
 
         return writer.get_bytes()
 
@@ -333,8 +376,10 @@ class EOFFinishMessage(Message):
     """
     EOF finish message structure:
 
-        0      2           10                     14                 N
-        | type | client_id | replica_id_seen_count | replica_id_seen |
+        0      2           10                 N
+        | type | client_id | replica_id_seen |
+
+        replica_id_seen is written as a bitmask, see MessageBytesWriter.write_id_set.
 
     """
 
@@ -344,14 +389,12 @@ class EOFFinishMessage(Message):
         self.replica_id_seen = replica_id_seen
 
     def from_bytes(client_id, reader):
-        replica_id_seen_count = reader.read_int(4)
-        replica_id_seen = reader.read_multiple_int(8, replica_id_seen_count)
+        replica_id_seen = reader.read_id_set()
 
         return EOFFinishMessage(client_id, replica_id_seen)
 
     def to_bytes_impl(self, writer):
-        writer.write_int(len(self.replica_id_seen), 4)
-        writer.write_multiple_int(self.replica_id_seen, 8)
+        writer.write_id_set(self.replica_id_seen)
 
         return writer.get_bytes()
 
@@ -382,3 +425,69 @@ class EOFResultMessage(Message):
         writer.write_int(self.messages_sent, 8)
 
         return writer.get_bytes()
+
+
+class BundleMessage(Message):
+    """
+    Bundle message structure, multiple protocol messages of the same client sent together:
+
+        0      2          10                14       18          N
+        | type | client_id | messages_count | size_1 | message_1 | ... | size_n | message_n |
+
+    """
+
+    def __init__(self, client_id, messages):
+        message_type = MessageType.BUNDLE
+        super().__init__(message_type, client_id)
+        self.messages = messages
+
+    def from_bytes(client_id, reader):
+        messages_count = reader.read_int(4)
+        messages = []
+        for _ in range(messages_count):
+            size = reader.read_int(4)
+            messages.append(Message.from_bytes(reader.read(size)))
+
+        return BundleMessage(client_id, messages)
+
+    def to_bytes_impl(self, writer):
+        writer.write_int(len(self.messages), 4)
+        for message in self.messages:
+            message_bytes = message.to_bytes()
+            writer.write_int(len(message_bytes), 4)
+            writer.write(message_bytes)
+
+        return writer.get_bytes()
+
+
+class CompressedMessage(Message):
+    """
+    Compressed message structure, the bytes of another message compressed with zlib:
+
+        0      2          10                   N
+        | type | client_id | compressed message |
+
+    It is decompressed when parsed, so `Message.from_bytes` returns the original message.
+    """
+
+    def __init__(self, client_id, message_bytes, level):
+        message_type = MessageType.COMPRESSED
+        super().__init__(message_type, client_id)
+        self.message_bytes = message_bytes
+        self.level = level
+
+    def from_bytes(client_id, reader):
+        return Message.from_bytes(zlib.decompress(reader.read_to_end()))
+
+    def to_bytes_impl(self, writer):
+        writer.write(zlib.compress(self.message_bytes, self.level))
+        return writer.get_bytes()
+
+    def compress(message, level):
+        """
+        Returns the bytes of the message, compressed if the level is set and the message is big enough
+        """
+        message_bytes = message.to_bytes()
+        if level is None or len(message_bytes) < COMPRESSION_MIN_BYTES:
+            return message_bytes
+        return CompressedMessage(message.client_id, message_bytes, level).to_bytes()
@@ -0,0 +1,239 @@
+import pytest
+
+from commons.columnar import encode_columns
+from commons.log_searcher import ProcessedMessage
+from commons.message import (
+    BundleMessage,
+    CompressedMessage,
+    EOFAggregationMessage,
+    EOFDiscoveryMessage,
+    EOFFinishMessage,
+    EOFMessage,
+    EOFResultMessage,
+    Message,
+    MessageType,
+    PayloadFormat,
+    ProtocolMessage,
+    ProtocolResultMessage,
+)
+from commons.message_utils import MessageBytesReader, MessageBytesWriter
+
+
+def round_trip(message):
+    parsed = Message.from_bytes(message.to_bytes())
+    assert type(parsed) is type(message)
+    assert parsed.message_type == message.message_type
+    assert parsed.client_id == message.client_id
+    return parsed
+
+
+def fields(message):
+    """
+    Returns the fields of a message comparable with ==, the processed messages as tuples
+    """
+    values = dict(vars(message))
+    if "possible_duplicates_processed_by" in values:
+        values["possible_duplicates_processed_by"] = [
+            (processed.message_id, processed.sent)
+            for processed in values["possible_duplicates_processed_by"]
+        ]
+    return values
+
+
+def test_reader_returns_memoryviews():
+    writer = MessageBytesWriter()
+    writer.write_int(2**40, 8)
+    writer.write_int(7, 3)
+    writer.write(b"field")
+    writer.write(b"rest")
+    reader = MessageBytesReader(writer.get_bytes())
+
+    assert reader.read_int(8) == 2**40
+    assert reader.read_int(3) == 7
+    field = reader.read(5)
+    assert isinstance(field, memoryview)
+    assert bytes(field) == b"field"
+    rest = reader.read_to_end()
+    assert isinstance(rest, memoryview)
+    assert bytes(rest) == b"rest"
+    with pytest.raises(Exception):
+        reader.read(1)
+
+
+def test_reader_reads_from_memoryview():
+    data = b"\x00\x00\x00\x02ab"
+    reader = MessageBytesReader(memoryview(data)[4:])
+    assert reader.read_str_to_end() == "ab"
+
+
+def test_writer_round_trip_of_lists():
+    writer = MessageBytesWriter()
+    writer.write_multiple_int([1, 2**32, 3], 8)
+    writer.write_multiple_int([5, 6], 3)
+    writer.write_multiple_float([1.5, -2.25])
+    writer.write_str_list(["a", "", "árbol"])
+    reader = MessageBytesReader(writer.get_bytes())
+
+    assert reader.read_multiple_int(8, 3) == [1, 2**32, 3]
+    assert reader.read_multiple_int(3, 2) == [5, 6]
+    assert reader.read_multiple_float(2) == [1.5, -2.25]
+    assert reader.read_str_list() == ["a", "", "árbol"]
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        ProtocolMessage(1, 2, "a,b\nc,d"),
+        ProtocolMessage(2**63, 0, ""),
+        ProtocolMessage(3, 4, "ñandú,😀"),
+        ProtocolResultMessage(1, 3, 5, "result\nrows"),
+        EOFMessage(1, 10, [3, 4]),
+        EOFDiscoveryMessage(1, 10, [1], 9, 8, [2, 5], [1, 3]),
+        EOFAggregationMessage(
+            1,
+            10,
+            [1],
+            9,
+            8,
+            [2, 5],
+            [1, 3],
+            [ProcessedMessage(2, True), ProcessedMessage(5, False)],
+        ),
+        EOFFinishMessage(1, [0, 2]),
+        EOFResultMessage(1, 4, 100),
+    ],
+)
+def test_message_round_trip(message):
+    assert fields(round_trip(message)) == fields(message)
+
+
+def test_protocol_message_with_columnar_payload():
+    payload = encode_columns([{"a": "1", "b": "x"}], ["a", "b"])
+    message = ProtocolMessage(1, 2, payload, PayloadFormat.COLUMNAR)
+
+    parsed = round_trip(message)
+    assert parsed.payload_format == PayloadFormat.COLUMNAR
+    # The payload is a memoryview of the message bytes
+    assert isinstance(parsed.payload, memoryview)
+    assert bytes(parsed.payload) == payload
+    assert parsed.rows_count() == 1
+
+
+def test_bundle_message_round_trip():
+    messages = [ProtocolMessage(1, 1, "a"), ProtocolMessage(1, 2, "b\nc")]
+
+    parsed = round_trip(BundleMessage(1, messages))
+    assert [fields(message) for message in parsed.messages] == [
+        fields(message) for message in messages
+    ]
+    assert [message.rows_count() for message in parsed.messages] == [1, 2]
+
+
+def test_compressed_message_round_trip():
+    message = ProtocolMessage(1, 2, "row\n" * 1000)
+
+    compressed = CompressedMessage.compress(message, 6)
+    assert len(compressed) < len(message.to_bytes())
+    parsed = Message.from_bytes(compressed)
+    assert parsed.message_type == MessageType.PROTOCOL
+    assert fields(parsed) == fields(message)
+
+    # The small messages are not compressed
+    small = ProtocolMessage(1, 3, "row")
+    assert CompressedMessage.compress(small, 6) == small.to_bytes()
+    assert CompressedMessage.compress(message, None) == message.to_bytes()
+
+
+ID_LISTS = [
+    [],
+    [0],
+    [0, 0, 1],
+    [5, 3, 4, 4, 1],
+    [1, 2**40, 2**63 - 1],
+    list(range(100, 1100)) + list(range(5000, 5010)),
+]
+
+
+@pytest.mark.parametrize("ids", ID_LISTS)
+def test_id_runs_round_trip(ids):
+    writer = MessageBytesWriter()
+    writer.write_id_runs(ids)
+    writer.write_int(7, 1)
+    reader = MessageBytesReader(writer.get_bytes())
+
+    # The ids are read sorted, with the repeated ones
+    assert reader.read_id_runs() == sorted(ids)
+    assert reader.read_int(1) == 7
+
+
+def test_id_runs_are_compact():
+    writer = MessageBytesWriter()
+    writer.write_id_runs(range(1, 10001))
+    # The count, the size and a single run
+    assert len(writer.get_bytes()) == 4 + 4 + 1 + 2
+
+
+@pytest.mark.parametrize(
+    "ids, expected", [([], []), ([0], [0]), ([7, 0, 3, 3], [0, 3, 7]), ([70], [70])]
+)
+def test_id_set_round_trip(ids, expected):
+    writer = MessageBytesWriter()
+    writer.write_id_set(ids)
+    writer.write_int(7, 1)
+    reader = MessageBytesReader(writer.get_bytes())
+
+    assert reader.read_id_set() == expected
+    assert reader.read_int(1) == 7
+
+
+@pytest.mark.parametrize("count", [0, 1, 7, 8, 9, 17])
+def test_flags_round_trip(count):
+    flags = [index % 3 == 0 for index in range(count)]
+    writer = MessageBytesWriter()
+    writer.write_flags(flags)
+    writer.write_int(7, 1)
+    reader = MessageBytesReader(writer.get_bytes())
+
+    assert reader.read_flags(count) == flags
+    assert reader.read_int(1) == 7
+
+
+@pytest.mark.parametrize("ids", ID_LISTS)
+def test_eof_messages_with_id_lists(ids):
+    assert round_trip(EOFMessage(1, 0, ids)).possible_duplicates == sorted(ids)
+
+    discovery = round_trip(EOFDiscoveryMessage(1, 0, ids, 0, 0, ids[::-1], [0, 5, 63]))
+    assert discovery.original_possible_duplicates == sorted(ids)
+    assert discovery.possible_duplicates == sorted(ids)
+    assert discovery.replica_id_seen == [0, 5, 63]
+
+    aggregation = round_trip(EOFAggregationMessage(1, 3, ids, 2, 1, ids, [], []))
+    assert aggregation.original_possible_duplicates == sorted(ids)
+    assert aggregation.possible_duplicates == sorted(ids)
+    assert aggregation.replica_id_seen == []
+    assert aggregation.possible_duplicates_processed_by == []
+
+
+def test_eof_aggregation_message_processed_by():
+    processed_by = [
+        ProcessedMessage(9, False),
+        ProcessedMessage(0, True),
+        ProcessedMessage(2**40, True),
+        ProcessedMessage(3, False),
+        ProcessedMessage(3, True),
+        ProcessedMessage(4, True),
+    ]
+    message = EOFAggregationMessage(1, 10, [], 9, 8, [], [1, 3], processed_by)
+
+    parsed = round_trip(message)
+    # The processed messages are sorted by id, each one with its sent flag
+    assert [
+        (processed.message_id, processed.sent)
+        for processed in parsed.possible_duplicates_processed_by
+    ] == [(0, True), (3, False), (3, True), (4, True), (9, False), (2**40, True)]
+    assert parsed.replica_id_seen == [1, 3]
+
+
+def test_eof_finish_message_replicas():
+    assert round_trip(EOFFinishMessage(1, [])).replica_id_seen == []
+    assert round_trip(EOFFinishMessage(1, [9, 0, 4, 4])).replica_id_seen == [0, 4, 9]
@@ -1,52 +1,275 @@
+import itertools
+import operator
+import struct
+
+# Big endian unsigned ints of the sizes used by the messages
+INT_STRUCTS = {
+    1: struct.Struct(">B"),
+    2: struct.Struct(">H"),
+    4: struct.Struct(">I"),
+    8: struct.Struct(">Q"),
+}
+INT_FORMATS = {1: "B", 2: "H", 4: "I", 8: "Q"}
+# Messages smaller than this are not compressed, the zlib header and the CPU cost are not worth it
+COMPRESSION_MIN_BYTES = 512
+# The flags of each byte of a bitmap, from the lowest bit
+BYTE_FLAGS = [tuple(bool(byte >> bit & 1) for bit in range(8)) for byte in range(256)]
+
+
+def append_varint(buffer, value):
+    """
+    Appends the value to the buffer as a varint: 7 bits per byte, the high bit is set if more bytes follow
+    """
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def decode_varints(data):
+    """
+    Returns the values of the varints of the data
+    """
+    values = []
+    value = 0
+    shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append(value)
+        value = 0
+        shift = 0
+    return values
+
+
 class MessageBytesReader:
+    """
+    Reads the fields of a message. The reads return memoryviews of the message bytes, so no field is copied.
+
+    `read` and `read_to_end` return memoryviews, not bytes: they support len, slicing and the buffer protocol,
+    but they are not hashable, they are not equal to a str and they keep the whole message alive.
+    Callers needing `bytes`, to keep them or to use them as keys, must copy them with `bytes(...)`.
+    """
+
     def __init__(self, bytes):
-        self.buffer = bytes
+        self.buffer = memoryview(bytes)
         self.offset = 0
 
-    def read(self, size):
+    def ensure_available(self, size):
         if self.offset + size > len(self.buffer):
             raise Exception("Not enough bytes to read")
 
+    def read(self, size):
+        self.ensure_available(size)
+
         bytes = self.buffer[self.offset : self.offset + size]
         self.offset += size
         return bytes
 
     def read_int(self, size):
-        bytes = self.read(size)
-        return int.from_bytes(bytes, byteorder="big")
+        if size not in INT_STRUCTS:
+            return int.from_bytes(self.read(size), byteorder="big")
+
+        self.ensure_available(size)
+        (value,) = INT_STRUCTS[size].unpack_from(self.buffer, self.offset)
+        self.offset += size
+        return value
 
     def read_multiple_int(self, size, count):
-        ints = []
-        for i in range(count):
-            ints.append(self.read_int(size))
+        if size not in INT_FORMATS:
+            return [self.read_int(size) for _ in range(count)]
+
+        self.ensure_available(size * count)
+        ints = list(
+            struct.unpack_from(f">{count}{INT_FORMATS[size]}", self.buffer, self.offset)
+        )
+        self.offset += size * count
         return ints
 
+    def read_multiple_float(self, count):
+        """
+        Reads `count` float64
+        """
+        self.ensure_available(8 * count)
+        floats = list(struct.unpack_from(f">{count}d", self.buffer, self.offset))
+        self.offset += 8 * count
+        return floats
+
     def read_multiple_object(self, size, count, object_class):
         objects = []
         for i in range(count):
             objects.append(object_class.from_bytes(self.read(size)))
         return objects
 
+    def read_id_runs(self):
+        """
+        Reads a list of ids written with `write_id_runs`, sorted
+        """
+        count = self.read_int(4)
+        size = self.read_int(4)
+        runs = decode_varints(self.read(size))
+
+        ids = []
+        last_id = 0
+        for index in range(0, len(runs), 2):
+            start = last_id + runs[index]
+            length = runs[index + 1]
+            ids.extend(range(start, start + length))
+            last_id = start + length - 1
+
+        if len(ids) != count:
+            raise Exception("The ids count does not match the runs")
+        return ids
+
+    def read_id_set(self):
+        """
+        Reads a list of ids written with `write_id_set`, sorted
+        """
+        size = self.read_int(2)
+        mask = int.from_bytes(self.read(size), byteorder="little")
+        return [id for id in range(mask.bit_length()) if mask >> id & 1]
+
+    def read_flags(self, count):
+        """
+        Reads `count` booleans written with `write_flags`
+        """
+        data = self.read((count + 7) // 8)
+        return [flag for byte in data for flag in BYTE_FLAGS[byte]][:count]
+
+    def read_str_list(self):
+        """
+        Reads a list of strings written with `write_str_list`
+        """
+        count = self.read_int(4)
+        sizes = self.read_multiple_int(4, count)
+        data = bytes(self.read(sum(sizes)))
+        strings = []
+        offset = 0
+        for size in sizes:
+            strings.append(data[offset : offset + size].decode("utf-8"))
+            offset += size
+        return strings
+
     def read_to_end(self):
         bytes = self.buffer[self.offset :]
         self.offset = len(self.buffer)
         return bytes
 
+    def read_str_to_end(self, encoding="utf-8"):
+        """
+        Decodes the rest of the message directly from the message bytes
+        """
+        return str(self.read_to_end(), encoding)
+
 
 class MessageBytesWriter:
+    """
+    Writes the fields of a message into a bytearray, which grows in place with amortized constant cost,
+    so writing a message is linear in its size.
+    """
+
     def __init__(self):
-        self.buffer = b""
+        self.buffer = bytearray()
 
     def write(self, bytes):
         self.buffer += bytes
 
     def write_int(self, value, size):
-        bytes = value.to_bytes(size, byteorder="big")
-        self.write(bytes)
+        if size not in INT_STRUCTS:
+            self.buffer += value.to_bytes(size, byteorder="big")
+            return
+
+        self.buffer += INT_STRUCTS[size].pack(value)
 
     def write_multiple_int(self, values, size):
-        for value in values:
-            self.write_int(value, size)
+        if size not in INT_FORMATS:
+            # The values may be objects with a to_bytes method
+            for value in values:
+                self.write_int(value, size)
+            return
+
+        self.buffer += struct.pack(f">{len(values)}{INT_FORMATS[size]}", *values)
+
+    def write_multiple_float(self, values):
+        """
+        Writes the values as float64
+        """
+        self.buffer += struct.pack(f">{len(values)}d", *values)
+
+    def write_id_runs(self, ids):
+        """
+        Writes a list of ids sorted, as runs of consecutive ids:
+
+            0       4      8                                           N
+            | count | size | gap_1 | length_1 | ... | gap_n | length_n |
+
+        The gap is the difference between the first id of the run and the last id of the previous run,
+        0 for a repeated id, and both are varints. So the ids take a few bytes for each run instead of
+        8 bytes each, and the repeated ids are kept.
+        """
+        ids = sorted(ids)
+        # Positions where a run starts, because the id is not the next of the previous one
+        starts = list(
+            itertools.compress(
+                range(1, len(ids)),
+                map(operator.ne, map(operator.sub, ids[1:], ids), itertools.repeat(1)),
+            )
+        )
+
+        runs = bytearray()
+        last_id = 0
+        for start, end in zip([0, *starts], [*starts, len(ids)]):
+            if start == end:
+                # There are no ids
+                break
+            append_varint(runs, ids[start] - last_id)
+            append_varint(runs, end - start)
+            last_id = ids[end - 1]
+
+        self.write_int(len(ids), 4)
+        self.write_int(len(runs), 4)
+        self.write(bytes(runs))
+
+    def write_id_set(self, ids):
+        """
+        Writes a set of small ids, like the replicas ids, as a bitmask:
+
+            0      2      N
+            | size | mask |
+
+        The bit `id` of the little endian mask is set for each id, the repeated ids are written once.
+        """
+        mask = 0
+        for id in ids:
+            mask |= 1 << id
+        self.write_int((mask.bit_length() + 7) // 8, 2)
+        self.write(mask.to_bytes((mask.bit_length() + 7) // 8, byteorder="little"))
+
+    def write_flags(self, values):
+        """
+        Writes the booleans as a bitmap, a bit for each one, the count is not written
+        """
+        flags = bytearray((len(values) + 7) // 8)
+        for index, value in enumerate(values):
+            if value:
+                flags[index >> 3] |= 1 << (index & 7)
+        self.write(bytes(flags))
+
+    def write_str_list(self, values):
+        """
+        Writes a list of strings:
+
+            0       4                       4 + 4 * count
+            | count | size_1 | ... | size_n | string_1 | ... | string_n |
+
+        The sizes are written together before the strings, encoded as utf-8.
+        """
+        encoded = [value.encode("utf-8") for value in values]
+        self.write_int(len(encoded), 4)
+        self.write_multiple_int([len(value) for value in encoded], 4)
+        self.write(b"".join(encoded))
 
     def get_bytes(self):
-        return self.buffer
+        return bytes(self.buffer)
@@ -0,0 +1,94 @@
+import logging
+import math
+import time
+
+# Weight of the last latency measured in the moving average
+LATENCY_SMOOTHING = 0.2
+# Seconds between window adjustments
+ADJUST_INTERVAL = 1
+# If we are processing less than this fraction of the time, the window is too small to keep us busy
+MIN_UTILIZATION = 0.8
+
+
+class PrefetchController:
+    """
+    Adjusts the prefetch window (QoS) of a receiver from the measured processing latency and ack rate.
+
+    The latency of a message is the time the receiver is busy from its delivery to its ack: the processing,
+    the duplicate check, the logs and their fsyncs and the wait for the confirms of the messages sent.
+
+    - If the replica spends less than `MIN_UTILIZATION` of the time processing, it is waiting for the broker to
+    deliver messages, so the window is doubled.
+    - Otherwise the replica is busy, and the window is set to the number of messages it can process in
+    `target_queue_time` seconds, so the work waiting unacked in a slow replica does not pile up.
+
+    The window is always kept between `min_prefetch_count` and `max_prefetch_count`.
+    """
+
+    def __init__(self, min_prefetch_count, max_prefetch_count, target_queue_time=0.5):
+        self.min_prefetch_count = min_prefetch_count
+        self.max_prefetch_count = max_prefetch_count
+        self.target_queue_time = target_queue_time
+
+        self.prefetch_count = min_prefetch_count
+        self.latency = None
+        self.ack_rate = 0
+        self.acks_count = 0
+        # Seconds busy handling the deliveries since the last adjustment
+        self.busy_time = 0
+        self.last_adjust_time = time.time()
+
+    def time_busy(self, seconds):
+        """
+        Registers the time in seconds spent handling deliveries, or persisting and acking them
+        """
+        self.busy_time += seconds
+
+    def messages_acked(self, count=1):
+        """
+        Registers the number of messages acked
+        """
+        self.acks_count += count
+
+    def adjust(self):
+        """
+        Calculates the new prefetch window if it is time to do it.
+
+        Returns the new window if it changed, None otherwise.
+        """
+        now = time.time()
+        elapsed = now - self.last_adjust_time
+        if elapsed < ADJUST_INTERVAL or not self.acks_count or not self.busy_time:
+            return None
+
+        # The time busy is split between the messages acked in the interval
+        latency = self.busy_time / self.acks_count
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = (
+                LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * self.latency
+            )
+        self.ack_rate = self.acks_count / elapsed
+        self.acks_count = 0
+        self.busy_time = 0
+        self.last_adjust_time = now
+
+        utilization = self.ack_rate * self.latency
+        if utilization < MIN_UTILIZATION:
+            new_prefetch_count = self.prefetch_count * 2
+        else:
+            new_prefetch_count = math.ceil(self.target_queue_time / self.latency)
+
+        new_prefetch_count = max(
+            self.min_prefetch_count, min(self.max_prefetch_count, new_prefetch_count)
+        )
+        if new_prefetch_count == self.prefetch_count:
+            return None
+
+        logging.info(
+            f"action: prefetch_update | prefetch_count: {new_prefetch_count} | "
+            f"latency: {self.latency:.6f} | ack_rate: {self.ack_rate:.2f}"
+        )
+        self.prefetch_count = new_prefetch_count
+        return new_prefetch_count
@@ -20,7 +20,40 @@ class Processor:
             "process method is not implemented, subclass must implement it"
         )
 
+    def projected_fields(processor_config):
+        """
+        Returns the output fields if the processor only selects fields of each row received, None otherwise.
+        It is called on the class, with the config of the processor.
+
+        The rows of the projections received in the columnar format are forwarded without being parsed.
+        """
+        return None
+
     def finish_processing(self):
         raise NotImplementedError(
             "finish_processing method is not implemented, subclass must implement it"
         )
+
+    def delete(self):
+        """
+        Deletes the data of the processor kept outside of it, like a state shared with other processors,
+        when its client finished. The processor is not used after it.
+        """
+        pass
+
+    def snapshot(self):
+        """
+        Returns the state of a statefull processor as bytes, or None if it can only be restored by processing
+        all the messages it received again.
+
+        The snapshot is saved periodically, and the messages received before it are deleted from the log.
+        """
+        return None
+
+    def restore(self, snapshot):
+        """
+        Restores the state saved by `snapshot`, before processing the messages received after it.
+        """
+        raise NotImplementedError(
+            "restore method is not implemented, subclass must implement it"
+        )
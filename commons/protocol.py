@@ -1,5 +1,10 @@
+import zlib
 from enum import Enum
-from commons.message_utils import MessageBytesReader, MessageBytesWriter
+from commons.message_utils import (
+    COMPRESSION_MIN_BYTES,
+    MessageBytesReader,
+    MessageBytesWriter,
+)
 
 """
 Messages used by the communication protocol between the client and the server.
@@ -17,6 +22,7 @@ class MessageType(Enum):
     ANNOUNCE_ACK = 7
     RESULT_ACK = 8
     RESULT_EOF = 9
+    COMPRESSED = 10
 
 
 class MessageProtocolType(Enum):
@@ -56,6 +62,8 @@ class Message:
             return ResultACKMessage.from_bytes(reader)
         elif type == MessageType.RESULT_EOF.value:
             return ResultEOFMessage.from_bytes(reader)
+        elif type == MessageType.COMPRESSED.value:
+            return CompressedMessage.from_bytes(reader)
         else:
             raise Exception("Unknown message type")
 
@@ -97,8 +105,7 @@ class ClientProtocolMessage(Message):
         message_id = reader.read_int(8)
         protocol_type_value = reader.read_int(1)
         protocol_type = MessageProtocolType(protocol_type_value)
-        content_bytes = reader.read_to_end()
-        content = content_bytes.decode("utf-8")
+        content = reader.read_str_to_end()
 
         return ClientProtocolMessage(message_id, protocol_type, content)
 
@@ -122,8 +129,7 @@ class ResultMessage(Message):
     def from_bytes(reader):
         tag_id = reader.read_int(1)
         message_id = reader.read_int(8)
-        result_bytes = reader.read_to_end()
-        result = result_bytes.decode("utf-8")
+        result = reader.read_str_to_end()
 
         return ResultMessage(tag_id, message_id, result)
 
@@ -244,3 +250,31 @@ class ResultACKMessage(Message):
 
     def to_bytes_impl(self, writer):
         return writer.get_bytes()
+
+
+class CompressedMessage(Message):
+    """
+    The bytes of another message compressed with zlib, it is decompressed when parsed,
+    so `Message.from_bytes` returns the original message.
+    """
+
+    def __init__(self, message_bytes, level):
+        super().__init__(MessageType.COMPRESSED)
+        self.message_bytes = message_bytes
+        self.level = level
+
+    def from_bytes(reader):
+        return Message.from_bytes(zlib.decompress(reader.read_to_end()))
+
+    def to_bytes_impl(self, writer):
+        writer.write(zlib.compress(self.message_bytes, self.level))
+        return writer.get_bytes()
+
+    def compress(message, level):
+        """
+        Returns the bytes of the message, compressed if the level is set and the message is big enough
+        """
+        message_bytes = message.to_bytes()
+        if level is None or len(message_bytes) < COMPRESSION_MIN_BYTES:
+            return message_bytes
+        return CompressedMessage(message_bytes, level).to_bytes()
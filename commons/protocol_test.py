@@ -0,0 +1,58 @@
+import pytest
+
+from commons.protocol import (
+    ACKMessage,
+    AnnounceACKMessage,
+    AnnounceMessage,
+    ClientProtocolMessage,
+    CompressedMessage,
+    EOFMessage,
+    HealthCheckMessage,
+    HealthOkMessage,
+    Message,
+    MessageProtocolType,
+    ResultACKMessage,
+    ResultEOFMessage,
+    ResultMessage,
+)
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        AnnounceMessage(2**40),
+        ClientProtocolMessage(1, MessageProtocolType.FLIGHT, "a,b\nc,d"),
+        ClientProtocolMessage(2, MessageProtocolType.AIRPORT, "ñandú"),
+        ClientProtocolMessage(3, MessageProtocolType.FLIGHT, ""),
+        ResultMessage(4, 5, "result\nrows"),
+        EOFMessage(MessageProtocolType.FLIGHT, 10, [1, 2**40]),
+        EOFMessage(MessageProtocolType.AIRPORT, 0, []),
+        ResultEOFMessage(4, 100),
+        HealthCheckMessage(),
+        HealthOkMessage(),
+        AnnounceACKMessage(),
+        ACKMessage(6, MessageProtocolType.AIRPORT),
+        ResultACKMessage(),
+    ],
+)
+def test_message_round_trip(message):
+    parsed = Message.from_bytes(message.to_bytes())
+    assert type(parsed) is type(message)
+    assert vars(parsed) == vars(message)
+
+
+def test_compressed_message_round_trip():
+    message = ClientProtocolMessage(1, MessageProtocolType.FLIGHT, "row\n" * 1000)
+
+    compressed = CompressedMessage.compress(message, 6)
+    assert len(compressed) < len(message.to_bytes())
+    assert vars(Message.from_bytes(compressed)) == vars(message)
+
+    # The small messages are not compressed
+    small = ClientProtocolMessage(2, MessageProtocolType.FLIGHT, "row")
+    assert CompressedMessage.compress(small, 6) == small.to_bytes()
+
+
+def test_unknown_message_type():
+    with pytest.raises(Exception):
+        Message.from_bytes(b"\xff")
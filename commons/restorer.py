@@ -1,28 +1,62 @@
 import logging
-from commons.logger import Logger, RestoreType
+import multiprocessing as mp
+import os
+
+from commons.logger import Logger, merge_restored
+
+# Worker processes that restore the shards of the communication log in parallel
+RESTORE_PROCESSES = os.cpu_count() or 1
+# The shards are restored in parallel only if they are bigger than this in total,
+# starting the workers takes longer than reading small shards
+PARALLEL_RESTORE_MIN_BYTES = 4 * 1024 * 1024
 
 
 class RestoreState:
-    def __init__(self, messages_received, messages_sent, possible_duplicates):
+    def __init__(
+        self, messages_received, messages_sent, possible_duplicates, logged_state
+    ):
         self.messages_received = messages_received
         self.messages_sent = messages_sent
         self.possible_duplicates = possible_duplicates
+        # The state as it is saved in the log, without the uncommitted messages
+        self.logged_state = logged_state
 
 
 class Restorer:
     """
     The Restorer fetches the last state of the processors from the log file and restores them.
+    The shards of the clients are restored in parallel by worker processes.
     """
 
-    def __init__(self, suffix=""):
+    def __init__(self, suffix="", processes=RESTORE_PROCESSES):
         logger = Logger(suffix)
-        self.restored_state = Restorer.restore(logger)
+        self.restored_state = Restorer.restore(logger, processes)
 
-    def restore(logger):
+    def restore(logger, processes=1):
         """
         Restore the state of the processors from the log file.
         """
-        restore_type, message_id, client_id, state = logger.restore()
+        logger.delete_orphan_shards()
+        client_ids = sorted(logger.shards)
+        shards_size = sum(
+            os.path.getsize(logger.shard_file_path(client_id))
+            for client_id in client_ids
+            if os.path.exists(logger.shard_file_path(client_id))
+        )
+        if (
+            processes > 1
+            and len(client_ids) > 1
+            and shards_size >= PARALLEL_RESTORE_MIN_BYTES
+        ):
+            # The workers are spawned, the process may have threads with connections open
+            with mp.get_context("spawn").Pool(min(processes, len(client_ids))) as pool:
+                restored = pool.starmap(
+                    restore_client,
+                    [(logger.suffix, client_id) for client_id in client_ids],
+                )
+        else:
+            restored = [logger.restore_client(client_id) for client_id in client_ids]
+        state, uncommitted_messages = merge_restored(restored)
         if not state:
             # The log file has not state
             state = {
@@ -41,8 +75,9 @@ class Restorer:
         state["possible_duplicates"] = {
             int(k): v for k, v in state.get("possible_duplicates", {}).items()
         }
+        logged_state = {key: dict(values) for key, values in state.items()}
 
-        if restore_type == RestoreType.SAVE_DONE or restore_type == RestoreType.SENT:
+        for message_id, client_id in uncommitted_messages:
             logging.debug(
                 f"Restorer: Message: {message_id} did not finish correctly, adding it to the possible duplicates"
             )
@@ -54,6 +89,7 @@ class Restorer:
             state.get("messages_received", {}),
             state.get("messages_sent", {}),
             state.get("possible_duplicates", {}),
+            logged_state,
         )
 
     def get_messages_received(self):
@@ -70,6 +106,9 @@ class Restorer:
         )
         return self.restored_state.messages_sent.copy()
 
+    def get_logged_state(self):
+        return self.restored_state.logged_state
+
     def get_possible_duplicates(self):
         logging.info(
             "restoring possible_duplicates: {}".format(
@@ -77,3 +116,10 @@ class Restorer:
             )
         )
         return self.restored_state.possible_duplicates.copy()
+
+
+def restore_client(suffix, client_id):
+    """
+    Restores the shard of a client in a worker process, with its own Logger
+    """
+    return Logger(suffix).restore_client(client_id)
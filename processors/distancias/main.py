@@ -3,11 +3,34 @@ from multiprocessing import Process
 from commons.health_checker_server import HealthCheckerServer
 from commons.log_initializer import initialize_log
 from commons.config_initializer import initialize_config
-from commons.communication_initializer import CommunicationInitializer
+from commons.communication_initializer import (
+    CommunicationInitializer,
+    DEFAULT_BACKEND,
+)
 from distancias import Distancias
 from commons.connection import ConnectionConfig, Connection
 from commons.log_guardian import LogGuardian
 
+# Number of messages persisted and acked together, and max time waiting for a batch to be completed
+ACK_BATCH_SIZE = 32
+ACK_BATCH_TIMEOUT_MS = 50
+
+# Number of deliveries processed together, and max time waiting for a micro batch to be completed
+MICRO_BATCH_SIZE = 16
+MICRO_BATCH_TIMEOUT_MS = 20
+
+# The output messages are coalesced until one of these limits is reached, or until the batch received is acked
+COALESCE_MAX_ROWS = 256
+COALESCE_MAX_BYTES = 65536
+COALESCE_TIMEOUT_MS = 50
+
+# Bounds of the prefetch window, adjusted at runtime from the processing latency and ack rate
+MIN_PREFETCH_COUNT = 1
+MAX_PREFETCH_COUNT = 256
+
+# Number of processes calculating the distances, the geodesic of each flight is CPU bound
+PROCESSOR_WORKERS = 4
+
 
 def main():
     config_inputs = {
@@ -19,8 +42,11 @@ def main():
         "input_type": str,
         "replicas_count": int,
         "replica_id": int,
+        "communication_backend": str,
     }
-    config_params = initialize_config(config_inputs)
+    config_params = initialize_config(
+        config_inputs, {"communication_backend": DEFAULT_BACKEND}
+    )
 
     logging_level = config_params["logging_level"]
     initialize_log(logging_level)
@@ -32,16 +58,28 @@ def main():
     log_guardian = LogGuardian()
 
     communication_initializer = CommunicationInitializer(
-        config_params["rabbit_host"], log_guardian
+        config_params["rabbit_host"],
+        log_guardian,
+        backend=config_params["communication_backend"],
     )
     receiver = communication_initializer.initialize_receiver(
         config_params["input"],
         config_params["input_type"],
         config_params["replica_id"],
         config_params["replicas_count"],
+        ack_batch_size=ACK_BATCH_SIZE,
+        ack_batch_timeout_ms=ACK_BATCH_TIMEOUT_MS,
+        micro_batch_size=MICRO_BATCH_SIZE,
+        micro_batch_timeout_ms=MICRO_BATCH_TIMEOUT_MS,
+        min_prefetch_count=MIN_PREFETCH_COUNT,
+        max_prefetch_count=MAX_PREFETCH_COUNT,
     )
     sender = communication_initializer.initialize_sender(
-        config_params["output"], config_params["output_type"]
+        config_params["output"],
+        config_params["output_type"],
+        coalesce_max_rows=COALESCE_MAX_ROWS,
+        coalesce_max_bytes=COALESCE_MAX_BYTES,
+        coalesce_timeout_ms=COALESCE_TIMEOUT_MS,
     )
 
     input_fields = [
@@ -62,7 +100,10 @@ def main():
     ]
 
     connection_config = ConnectionConfig(
-        config_params["replica_id"], input_fields, output_fields
+        config_params["replica_id"],
+        input_fields,
+        output_fields,
+        workers=PROCESSOR_WORKERS,
     )
     Connection(connection_config, receiver, sender, log_guardian, Distancias).run()
 
@@ -1,6 +1,7 @@
 import logging
 import re
 
+from commons.message_utils import MessageBytesReader, MessageBytesWriter
 from commons.processor import Processor, Response, ResponseType
 
 STARTING_AIRPORT = "startingAirport"
@@ -11,6 +12,8 @@ TRAVEL_DURATION = "travelDuration"
 class DosMasRapidos(Processor):
     def __init__(self, client_id):
         self.trajectory = {}
+        # {(startingAirport, destinationAirport): trajectory} so each trajectory string is built once
+        self.trajectories_by_airports = {}
 
     def process(self, message):
         """
@@ -37,11 +40,58 @@ class DosMasRapidos(Processor):
                 fastest[1] = message
         fastest.sort(key=self.convert_message_to_travel_duration)
 
+    def snapshot(self):
+        """
+        Snapshot of the fastest messages of each trajectory:
+
+            0        X              Y                                Z        W
+            | fields | trajectories | messages_count of each one(1) | values |
+
+        The fields, trajectories and values are lists of strings, the values of each message are
+        written in the order of the fields, which are the same for all the messages.
+        """
+        messages = [
+            message for fastest in self.trajectory.values() for message in fastest
+        ]
+        fields = list(messages[0]) if messages else []
+        writer = MessageBytesWriter()
+        writer.write_str_list(fields)
+        writer.write_str_list(list(self.trajectory))
+        writer.write_multiple_int(
+            [len(fastest) for fastest in self.trajectory.values()], 1
+        )
+        writer.write_str_list(
+            [message[field] for message in messages for field in fields]
+        )
+        return writer.get_bytes()
+
+    def restore(self, snapshot):
+        reader = MessageBytesReader(snapshot)
+        fields = reader.read_str_list()
+        trajectories = reader.read_str_list()
+        messages_counts = reader.read_multiple_int(1, len(trajectories))
+        values = reader.read_str_list()
+
+        self.trajectory = {}
+        start = 0
+        for trajectory, messages_count in zip(trajectories, messages_counts):
+            self.trajectory[trajectory] = [
+                dict(zip(fields, values[offset : offset + len(fields)]))
+                for offset in range(
+                    start, start + messages_count * len(fields), len(fields)
+                )
+            ]
+            start += messages_count * len(fields)
+
     def convert_message_to_trajectory(self, message):
         """
         Converts a message to a trajectory string
         """
-        return message[STARTING_AIRPORT] + "-" + message[DESTINATION_AIRPORT]
+        airports = (message[STARTING_AIRPORT], message[DESTINATION_AIRPORT])
+        trajectory = self.trajectories_by_airports.get(airports)
+        if trajectory is None:
+            trajectory = self.trajectories_by_airports[airports] = "-".join(airports)
+        return trajectory
 
     def convert_message_to_travel_duration(self, message):
         """
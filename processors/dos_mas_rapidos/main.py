@@ -3,7 +3,10 @@ from multiprocessing import Process
 from commons.health_checker_server import HealthCheckerServer
 from commons.log_initializer import initialize_log
 from commons.config_initializer import initialize_config
-from commons.communication_initializer import CommunicationInitializer
+from commons.communication_initializer import (
+    CommunicationInitializer,
+    DEFAULT_BACKEND,
+)
 from dos_mas_rapidos import DosMasRapidos
 from commons.connection import ConnectionConfig, Connection
 from commons.log_guardian import LogGuardian
@@ -22,8 +25,11 @@ def main():
         "output_type": str,
         "input_type": str,
         "replica_id": int,
+        "communication_backend": str,
     }
-    config_params = initialize_config(config_inputs)
+    config_params = initialize_config(
+        config_inputs, {"communication_backend": DEFAULT_BACKEND}
+    )
 
     logging_level = config_params["logging_level"]
     initialize_log(logging_level)
@@ -35,7 +41,9 @@ def main():
     log_guardian = LogGuardian()
 
     communication_initializer = CommunicationInitializer(
-        config_params["rabbit_host"], log_guardian
+        config_params["rabbit_host"],
+        log_guardian,
+        backend=config_params["communication_backend"],
     )
     receiver = communication_initializer.initialize_receiver(
         config_params["input"],
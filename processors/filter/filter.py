@@ -17,5 +17,8 @@ class Filter(Processor):
             filtered_message[field] = message[field]
         return Response(ResponseType.SINGLE, filtered_message)
 
+    def projected_fields(config):
+        return config.output_fields
+
     def finish_processing(self):
         pass
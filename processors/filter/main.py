@@ -2,11 +2,29 @@ from multiprocessing import Process
 
 from commons.health_checker_server import HealthCheckerServer
 from filter import Filter, FilterConfig
-from commons.communication_initializer import CommunicationInitializer
+from commons.communication_initializer import (
+    CommunicationInitializer,
+    DEFAULT_BACKEND,
+)
 from commons.log_initializer import initialize_log
 from commons.config_initializer import initialize_config
 from commons.connection import ConnectionConfig, Connection
 from commons.log_guardian import LogGuardian
+from commons.message import PayloadFormat
+
+# Max number of publishes waiting for the broker confirm at the same time
+PUBLISHER_CONFIRM_WINDOW = 64
+
+# Number of messages persisted and acked together, and max time waiting for a batch to be completed
+ACK_BATCH_SIZE = 32
+ACK_BATCH_TIMEOUT_MS = 50
+
+# Bounds of the prefetch window, adjusted at runtime from the processing latency and ack rate
+MIN_PREFETCH_COUNT = 1
+MAX_PREFETCH_COUNT = 256
+
+# The rows are sent in the columnar format, so the next stages only decode the columns they use
+PAYLOAD_FORMAT = PayloadFormat.COLUMNAR
 
 
 def main():
@@ -22,8 +40,11 @@ def main():
         "delimiter": str,
         "replicas_count": int,
         "replica_id": int,
+        "communication_backend": str,
     }
-    config_params = initialize_config(config_inputs)
+    config_params = initialize_config(
+        config_inputs, {"communication_backend": DEFAULT_BACKEND}
+    )
 
     logging_level = config_params["logging_level"]
     initialize_log(logging_level)
@@ -35,7 +56,9 @@ def main():
     log_guardian = LogGuardian()
 
     communication_initializer = CommunicationInitializer(
-        config_params["rabbit_host"], log_guardian
+        config_params["rabbit_host"],
+        log_guardian,
+        backend=config_params["communication_backend"],
     )
     receiver = communication_initializer.initialize_receiver(
         config_params["input"],
@@ -44,11 +67,17 @@ def main():
         config_params["replicas_count"],
         input_diff_name=config_params["output"],
         delimiter=config_params["delimiter"],
+        ack_batch_size=ACK_BATCH_SIZE,
+        ack_batch_timeout_ms=ACK_BATCH_TIMEOUT_MS,
+        min_prefetch_count=MIN_PREFETCH_COUNT,
+        max_prefetch_count=MAX_PREFETCH_COUNT,
     )
     sender = communication_initializer.initialize_sender(
         config_params["output"],
         config_params["output_type"],
         config_params["delimiter"],
+        confirm_window=PUBLISHER_CONFIRM_WINDOW,
+        payload_format=PAYLOAD_FORMAT,
     )
 
     input_fields = config_params["input_fields"].split(",")
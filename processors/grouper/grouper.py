@@ -1,6 +1,7 @@
 import logging
 from commons.processor import Processor, Response, ResponseType
 from commons.message import ProtocolMessage
+from commons.message_utils import MessageBytesReader, MessageBytesWriter
 
 STARTING_AIRPORT = "startingAirport"
 DESTINATION_AIRPORT = "destinationAirport"
@@ -69,6 +70,7 @@ class Grouper(Processor):
         self.media_general_output_fields = ["totalFare", "amount"]
         logging.info(f"Starting grouper {self.replica_id}")
 
+        # {(startingAirport, destinationAirport): prices} the route string is only built for the results
         self.routes = {}
         self.vuelos_message_to_send = []
         self.waiting_for_media_general = False
@@ -79,18 +81,53 @@ class Grouper(Processor):
 
     def group_prices_by_route(self, message):
         # message = startingAirport,destinationAirport,totalFare
-        route = self.get_route(message)
+        route = (message[STARTING_AIRPORT], message[DESTINATION_AIRPORT])
         total_fare = self.get_total_fare(message)
         if route in self.routes:
             self.routes[route].append(total_fare)
         else:
             self.routes[route] = [total_fare]
 
-    def get_route(self, message):
-        return "{}-{}".format(
-            message[STARTING_AIRPORT],
-            message[DESTINATION_AIRPORT],
+    def snapshot(self):
+        """
+        Snapshot of the prices grouped by route:
+
+            0              4                                   X                   Y
+            | routes_count | airports | prices_count of each route | prices |
+
+        The airports of each route are written as a list of strings and the prices as float64.
+        """
+        writer = MessageBytesWriter()
+        writer.write_int(len(self.routes), 4)
+        writer.write_str_list([airport for route in self.routes for airport in route])
+        writer.write_multiple_int([len(prices) for prices in self.routes.values()], 4)
+        writer.write_multiple_float(
+            [price for prices in self.routes.values() for price in prices]
         )
+        return writer.get_bytes()
+
+    def restore(self, snapshot):
+        reader = MessageBytesReader(snapshot)
+        routes_count = reader.read_int(4)
+        airports = reader.read_str_list()
+        prices_counts = reader.read_multiple_int(4, routes_count)
+        prices = reader.read_multiple_float(sum(prices_counts))
+
+        self.routes = {}
+        start = 0
+        for index, prices_count in enumerate(prices_counts):
+            route = (airports[2 * index], airports[2 * index + 1])
+            self.routes[route] = prices[start : start + prices_count]
+            start += prices_count
+
+    def delete(self):
+        # The channels of the client are closed, the connection is shared with the other clients
+        self.media_general_receiver.close_channel()
+        self.media_general_sender.close_channel()
+        self.media_general_log_guardian.delete_client(self.client_id)
+
+    def get_route(self, airports):
+        return "{}-{}".format(*airports)
 
     def get_total_fare(self, message):
         return float(message[TOTAL_FARE])
@@ -160,11 +197,11 @@ class Grouper(Processor):
         media_general = float(message[AVERAGE])
         logging.debug(f"Media general received: {media_general}")
         result = []
-        for route, prices in self.routes.items():
+        for airports, prices in self.routes.items():
             prices_filtered = self.filter_prices(prices, media_general)
             if prices_filtered:
                 message = {
-                    "route": route,
+                    "route": self.get_route(airports),
                     "prices": ";".join(map(str, prices_filtered)),
                 }
                 result.append(message)
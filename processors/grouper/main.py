@@ -4,9 +4,20 @@ from commons.health_checker_server import HealthCheckerServer
 from grouper import Grouper, GrouperConfig
 from commons.log_initializer import initialize_log
 from commons.config_initializer import initialize_config
-from commons.communication_initializer import CommunicationInitializer
+from commons.communication_initializer import (
+    CommunicationInitializer,
+    DEFAULT_BACKEND,
+)
 from commons.connection import ConnectionConfig, Connection
 from commons.log_guardian import LogGuardian
+from commons.message import PayloadFormat
+
+# Bounds of the prefetch window, adjusted at runtime from the processing latency and ack rate
+MIN_PREFETCH_COUNT = 1
+MAX_PREFETCH_COUNT = 256
+
+# The rows are sent in the columnar format, so the next stages only decode the columns they use
+PAYLOAD_FORMAT = PayloadFormat.COLUMNAR
 
 
 def main():
@@ -21,8 +32,11 @@ def main():
         "output_type": str,
         "replicas_count": int,
         "replica_id": int,
+        "communication_backend": str,
     }
-    config_params = initialize_config(config_inputs)
+    config_params = initialize_config(
+        config_inputs, {"communication_backend": DEFAULT_BACKEND}
+    )
 
     logging_level = config_params["logging_level"]
     initialize_log(logging_level)
@@ -34,7 +48,9 @@ def main():
     vuelos_log_guardian = LogGuardian("vuelos")
 
     vuelos_communication_initializer = CommunicationInitializer(
-        config_params["rabbit_host"], vuelos_log_guardian
+        config_params["rabbit_host"],
+        vuelos_log_guardian,
+        backend=config_params["communication_backend"],
     )
     vuelos_receiver = vuelos_communication_initializer.initialize_receiver(
         config_params["vuelos_input"],
@@ -43,15 +59,21 @@ def main():
         config_params["replicas_count"],
         routing_key=str(config_params["replica_id"]),
         use_duplicate_catcher=True,
+        min_prefetch_count=MIN_PREFETCH_COUNT,
+        max_prefetch_count=MAX_PREFETCH_COUNT,
     )
     vuelos_sender = vuelos_communication_initializer.initialize_sender(
-        config_params["vuelos_output"], config_params["output_type"]
+        config_params["vuelos_output"],
+        config_params["output_type"],
+        payload_format=PAYLOAD_FORMAT,
     )
 
     media_general_log_guardian = LogGuardian("media_general")
 
     media_general_communication_initializer = CommunicationInitializer(
-        config_params["rabbit_host"], media_general_log_guardian
+        config_params["rabbit_host"],
+        media_general_log_guardian,
+        backend=config_params["communication_backend"],
     )
 
     vuelos_input_fields = ["startingAirport", "destinationAirport", "totalFare"]
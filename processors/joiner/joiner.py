@@ -12,8 +12,10 @@ DESTINATION_LONGITUDE = "destinationLongitude"
 
 
 class JoinerConfig:
-    def __init__(self, state):
+    def __init__(self, state, lat_long_receiver=None):
         self.state = state
+        # The airports of a client are used until the joiner finishes it, so its lat_long data is deleted then
+        self.lat_long_receiver = lat_long_receiver
 
 
 class Joiner(Processor):
@@ -80,5 +82,11 @@ class Joiner(Processor):
         }
         return message
 
+    def delete(self):
+        self.config.state.remove_client(self.client_id)
+        if self.config.lat_long_receiver:
+            # It is deleted from the lat_long thread
+            self.config.lat_long_receiver.delete_client_later(self.client_id)
+
     def finish_processing(self):
         pass
@@ -1,3 +1,4 @@
+from commons.message_utils import MessageBytesReader, MessageBytesWriter
 from commons.processor import Processor
 
 
@@ -20,5 +21,26 @@ class LatLong(Processor):
         )
         self.config.state.add_airport(self.client_id, airport_code, latitude, longitude)
 
+    def snapshot(self):
+        """
+        Snapshot of the airports of the client in the shared state, as a list of strings
+        with the code, latitude and longitude of each airport.
+        """
+        airports = self.config.state.obtain_client_airports(self.client_id)
+        writer = MessageBytesWriter()
+        writer.write_str_list(
+            [
+                value
+                for airport_code, lat_long in airports.items()
+                for value in (airport_code, *lat_long)
+            ]
+        )
+        return writer.get_bytes()
+
+    def restore(self, snapshot):
+        values = MessageBytesReader(snapshot).read_str_list()
+        for index in range(0, len(values), 3):
+            self.config.state.add_airport(self.client_id, *values[index : index + 3])
+
     def finish_processing(self):
         pass
@@ -5,7 +5,10 @@ from joiner import Joiner, JoinerConfig
 from lat_long import LatLong, LatLongConfig
 from commons.log_initializer import initialize_log
 from commons.config_initializer import initialize_config
-from commons.communication_initializer import CommunicationInitializer
+from commons.communication_initializer import (
+    CommunicationInitializer,
+    DEFAULT_BACKEND,
+)
 from commons.connection import ConnectionConfig, Connection
 from state import State
 from commons.log_guardian import LogGuardian
@@ -30,8 +33,11 @@ def main():
         "input_type_vuelos": str,
         "replicas_count": int,
         "replica_id": int,
+        "communication_backend": str,
     }
-    config_params = initialize_config(config_inputs)
+    config_params = initialize_config(
+        config_inputs, {"communication_backend": DEFAULT_BACKEND}
+    )
 
     logging_level = config_params["logging_level"]
     initialize_log(logging_level)
@@ -47,7 +53,9 @@ def main():
     state = State()
 
     lat_long_communication_initializer = CommunicationInitializer(
-        config_params["rabbit_host"], lat_long_log_guardian
+        config_params["rabbit_host"],
+        lat_long_log_guardian,
+        backend=config_params["communication_backend"],
     )
     lat_long_receiver = lat_long_communication_initializer.initialize_receiver(
         config_params["lat_long_input"],
@@ -56,6 +64,8 @@ def main():
         JOINER_REPLICA_COUNT,
         input_diff_name=str(config_params["replica_id"]),
         use_duplicate_catcher=True,
+        # The airports are needed until the joiner finishes the client, it deletes them
+        delete_finished_clients=False,
     )
 
     lat_long_input_fields = ["AirportCode", "Latitude", "Longitude"]
@@ -84,7 +94,9 @@ def main():
     joiner_log_guardian = LogGuardian(JOINER_LOG_STORER_SUFFIX)
 
     vuelos_communication_initializer = CommunicationInitializer(
-        config_params["rabbit_host"], joiner_log_guardian
+        config_params["rabbit_host"],
+        joiner_log_guardian,
+        backend=config_params["communication_backend"],
     )
     vuelos_receiver = vuelos_communication_initializer.initialize_receiver(
         config_params["vuelos_input"],
@@ -113,7 +125,7 @@ def main():
         "destinationLongitude",
     ]
 
-    joiner_config = JoinerConfig(state)
+    joiner_config = JoinerConfig(state, lat_long_receiver)
 
     connection_config = ConnectionConfig(
         config_params["replica_id"], vuelos_input_fields, vuelos_output_fields
@@ -16,6 +16,15 @@ class State:
 
         self.lock.release()
 
+    def obtain_client_airports(self, client_id):
+        """
+        Returns a copy of the airports of the given client, {airport_code: (latitude, longitude)}
+        """
+        self.lock.acquire()
+        client_airports = dict(self.airports_by_client.get(client_id, {}))
+        self.lock.release()
+        return client_airports
+
     def obtain_client_airport(self, client_id, airport_code):
         """
         Returns the airport with the given code for the given client.
@@ -29,6 +38,5 @@ class State:
 
     def remove_client(self, client_id):
         self.lock.acquire()
-        del self.airports_by_client[client_id]
-        del self.state_by_client[client_id]
+        self.airports_by_client.pop(client_id, None)
         self.lock.release()
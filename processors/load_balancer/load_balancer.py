@@ -11,15 +11,23 @@ class LoadBalancerConfig:
 class LoadBalancer(Processor):
     def __init__(self, config, client_id):
         self.config = config
+        # {(startingAirport, destinationAirport): queue_id} the routes repeat a lot, so the hash is calculated once
+        self.queue_ids = {}
 
     def process(self, message):
         """
         Calculates the hash of the message and the queue id to send it to
         """
+        airports = (message["startingAirport"], message["destinationAirport"])
+        queue_id = self.queue_ids.get(airports)
+        if queue_id is None:
+            queue_id = self.queue_ids[airports] = self.get_queue_id(message)
+        return Response(ResponseType.SINGLE, (queue_id, message))
+
+    def get_queue_id(self, message):
         route = self.get_route(message)
         message_hash = hashlib.md5(route.encode()).hexdigest()
-        queue_id = (int(message_hash, 16) % self.config.grouper_replicas_count) + 1
-        return Response(ResponseType.SINGLE, (queue_id, message))
+        return (int(message_hash, 16) % self.config.grouper_replicas_count) + 1
 
     def get_route(self, message):
         starting_airport = message["startingAirport"]
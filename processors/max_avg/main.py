@@ -3,7 +3,10 @@ from multiprocessing import Process
 from commons.health_checker_server import HealthCheckerServer
 from commons.log_initializer import initialize_log
 from commons.config_initializer import initialize_config
-from commons.communication_initializer import CommunicationInitializer
+from commons.communication_initializer import (
+    CommunicationInitializer,
+    DEFAULT_BACKEND,
+)
 from max_avg import MaxAvg
 from commons.connection import ConnectionConfig, Connection
 from commons.restorer import Restorer
@@ -21,8 +24,11 @@ def main():
         "replicas_count": int,
         "replica_id": int,
         "grouper_replicas_count": int,
+        "communication_backend": str,
     }
-    config_params = initialize_config(config_inputs)
+    config_params = initialize_config(
+        config_inputs, {"communication_backend": DEFAULT_BACKEND}
+    )
 
     logging_level = config_params["logging_level"]
     initialize_log(logging_level)
@@ -34,7 +40,9 @@ def main():
     log_guardian = LogGuardian()
 
     communication_initializer = CommunicationInitializer(
-        config_params["rabbit_host"], log_guardian
+        config_params["rabbit_host"],
+        log_guardian,
+        backend=config_params["communication_backend"],
     )
     receiver = communication_initializer.initialize_receiver(
         config_params["input"],
@@ -1,4 +1,5 @@
 import logging
+from commons.message_utils import MessageBytesReader, MessageBytesWriter
 from commons.processor import Processor, Response, ResponseType
 
 
@@ -28,5 +29,23 @@ class MediaGeneral(Processor):
             message = {"media_general": str(media_general)}
             return Response(ResponseType.SINGLE, message)
 
+    def snapshot(self):
+        """
+        | price_sum(8) | amount(8) | amount_received(4) |
+
+        The price_sum is a float64.
+        """
+        writer = MessageBytesWriter()
+        writer.write_multiple_float([self.price_sum])
+        writer.write_int(self.amount, 8)
+        writer.write_int(self.amount_received, 4)
+        return writer.get_bytes()
+
+    def restore(self, snapshot):
+        reader = MessageBytesReader(snapshot)
+        (self.price_sum,) = reader.read_multiple_float(1)
+        self.amount = reader.read_int(8)
+        self.amount_received = reader.read_int(4)
+
     def finish_processing(self):
         pass
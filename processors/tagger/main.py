@@ -3,11 +3,18 @@ from multiprocessing import Process
 from commons.health_checker_server import HealthCheckerServer
 from commons.log_initializer import initialize_log
 from commons.config_initializer import initialize_config
-from commons.communication_initializer import CommunicationInitializer
+from commons.communication_initializer import (
+    CommunicationInitializer,
+    DEFAULT_BACKEND,
+)
 from tagger import Tagger, TaggerConfig
 from commons.connection import ConnectionConfig, Connection
 from commons.log_guardian import LogGuardian
 
+# Bounds of the prefetch window, adjusted at runtime from the processing latency and ack rate
+MIN_PREFETCH_COUNT = 1
+MAX_PREFETCH_COUNT = 256
+
 
 def main():
     config_inputs = {
@@ -21,8 +28,11 @@ def main():
         "tag_name": str,
         "tag_id": int,
         "replica_id": int,
+        "communication_backend": str,
     }
-    config_params = initialize_config(config_inputs)
+    config_params = initialize_config(
+        config_inputs, {"communication_backend": DEFAULT_BACKEND}
+    )
 
     logging_level = config_params["logging_level"]
     initialize_log(logging_level)
@@ -34,7 +44,9 @@ def main():
     log_guardian = LogGuardian()
 
     communication_initializer = CommunicationInitializer(
-        config_params["rabbit_host"], log_guardian
+        config_params["rabbit_host"],
+        log_guardian,
+        backend=config_params["communication_backend"],
     )
     receiver = communication_initializer.initialize_receiver(
         config_params["input"],
@@ -42,6 +54,8 @@ def main():
         config_params["replica_id"],
         config_params["replicas_count"],
         use_duplicate_catcher=True,
+        min_prefetch_count=MIN_PREFETCH_COUNT,
+        max_prefetch_count=MAX_PREFETCH_COUNT,
     )
     sender = communication_initializer.initialize_sender(
         config_params["output"],
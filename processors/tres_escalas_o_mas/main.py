@@ -3,12 +3,28 @@ from multiprocessing import Process
 from commons.health_checker_server import HealthCheckerServer
 from commons.log_initializer import initialize_log
 from commons.config_initializer import initialize_config
-from commons.communication_initializer import CommunicationInitializer
+from commons.communication_initializer import (
+    CommunicationInitializer,
+    DEFAULT_BACKEND,
+)
 from tres_escalas_o_mas import TresEscalasOMas
 from commons.connection import Connection, ConnectionConfig
 from commons.restorer import Restorer
 from commons.log_guardian import LogGuardian
 
+# Number of messages persisted and acked together, and max time waiting for a batch to be completed
+ACK_BATCH_SIZE = 32
+ACK_BATCH_TIMEOUT_MS = 50
+
+# Number of deliveries processed together, and max time waiting for a micro batch to be completed
+MICRO_BATCH_SIZE = 16
+MICRO_BATCH_TIMEOUT_MS = 20
+
+# The output messages are coalesced until one of these limits is reached, or until the batch received is acked
+COALESCE_MAX_ROWS = 256
+COALESCE_MAX_BYTES = 65536
+COALESCE_TIMEOUT_MS = 50
+
 
 def main():
     config_inputs = {
@@ -20,8 +36,11 @@ def main():
         "input_type": str,
         "replicas_count": int,
         "replica_id": int,
+        "communication_backend": str,
     }
-    config_params = initialize_config(config_inputs)
+    config_params = initialize_config(
+        config_inputs, {"communication_backend": DEFAULT_BACKEND}
+    )
 
     logging_level = config_params["logging_level"]
     initialize_log(logging_level)
@@ -33,16 +52,26 @@ def main():
     log_guardian = LogGuardian()
 
     communication_initializer = CommunicationInitializer(
-        config_params["rabbit_host"], log_guardian
+        config_params["rabbit_host"],
+        log_guardian,
+        backend=config_params["communication_backend"],
     )
     receiver = communication_initializer.initialize_receiver(
         config_params["input"],
         config_params["input_type"],
         config_params["replica_id"],
         config_params["replicas_count"],
+        ack_batch_size=ACK_BATCH_SIZE,
+        ack_batch_timeout_ms=ACK_BATCH_TIMEOUT_MS,
+        micro_batch_size=MICRO_BATCH_SIZE,
+        micro_batch_timeout_ms=MICRO_BATCH_TIMEOUT_MS,
     )
     sender = communication_initializer.initialize_sender(
-        config_params["output"], config_params["output_type"]
+        config_params["output"],
+        config_params["output_type"],
+        coalesce_max_rows=COALESCE_MAX_ROWS,
+        coalesce_max_bytes=COALESCE_MAX_BYTES,
+        coalesce_timeout_ms=COALESCE_TIMEOUT_MS,
     )
 
     input_fields = [
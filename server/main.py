@@ -5,11 +5,17 @@ from commons.health_checker_server import HealthCheckerServer
 from server import Server, ServerConfig
 from commons.log_initializer import initialize_log
 from commons.config_initializer import initialize_config
-from commons.communication_initializer import CommunicationInitializer
+from commons.communication_initializer import (
+    CommunicationInitializer,
+    DEFAULT_BACKEND,
+)
 from commons.log_guardian import LogGuardian
 
 SERVER_REPLICAS_COUNT = 1
 
+# zlib level of the flights sent to the filters, they have all the columns of the dataset and compress ~70%
+FLIGHTS_COMPRESSION_LEVEL = 1
+
 
 def main():
     config_inputs = {
@@ -23,8 +29,11 @@ def main():
         "output_type": str,
         "input_type": str,
         "max_clients": int,
+        "communication_backend": str,
     }
-    config_params = initialize_config(config_inputs)
+    config_params = initialize_config(
+        config_inputs, {"communication_backend": DEFAULT_BACKEND}
+    )
 
     logging_level = config_params["logging_level"]
     initialize_log(logging_level)
@@ -37,22 +46,30 @@ def main():
     vuelos_log_guardian = LogGuardian(no_log=True)
 
     vuelos_initializer = CommunicationInitializer(
-        config_params["rabbit_host"], vuelos_log_guardian
+        config_params["rabbit_host"],
+        vuelos_log_guardian,
+        backend=config_params["communication_backend"],
     )
 
     resultados_log_guardian = LogGuardian(no_log=True)
 
     resultados_initializer = CommunicationInitializer(
-        config_params["rabbit_host"], resultados_log_guardian
+        config_params["rabbit_host"],
+        resultados_log_guardian,
+        backend=config_params["communication_backend"],
     )
     resultados_sender = resultados_initializer.initialize_sender(
-        config_params["vuelos_output"], config_params["output_type"]
+        config_params["vuelos_output"],
+        config_params["output_type"],
+        compression_level=FLIGHTS_COMPRESSION_LEVEL,
     )
 
     lat_long_log_guardian = LogGuardian(no_log=True)
 
     lat_long_initializer = CommunicationInitializer(
-        config_params["rabbit_host"], lat_long_log_guardian
+        config_params["rabbit_host"],
+        lat_long_log_guardian,
+        backend=config_params["communication_backend"],
     )
     lat_long_sender = lat_long_initializer.initialize_sender(
         config_params["lat_long_output"], config_params["output_type"]
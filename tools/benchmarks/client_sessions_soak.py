@@ -0,0 +1,155 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, ".")
+sys.path.insert(0, "processors/dos_mas_rapidos")
+
+from commons.communication_initializer import CommunicationInitializer
+from commons.connection import Connection, ConnectionConfig
+from commons.log_guardian import LogGuardian
+from commons.message import ProtocolMessage
+from dos_mas_rapidos import DosMasRapidos
+
+"""
+Soak test of the data kept for each client. A DosMasRapidos stage, with its logs, receives the sessions
+of many clients one after the other through the in memory broker, and after each group of sessions it
+reports the memory allocated, the clients in the state of the stage and the log files. The data of each
+client is deleted when its EOF finished propagating, so they must stay flat. With --keep-clients the data
+is not deleted, to compare.
+The logs are written in a temporary directory.
+Meant to be run from the root directory.
+Usage:
+    python tools/benchmarks/client_sessions_soak.py [sessions_count] [messages_per_session] [--keep-clients]
+"""
+
+BROKER = "client_sessions_soak"
+INPUT = "soak_input"
+OUTPUT = "soak_output"
+ROWS_PER_MESSAGE = 20
+REPORT_EVERY = 50
+SESSION_TIMEOUT_S = 30
+FIELDS = [
+    "legId",
+    "startingAirport",
+    "destinationAirport",
+    "travelDuration",
+    "segmentsArrivalAirportCode",
+]
+
+
+def generate_message(client_id, message_id):
+    rows = []
+    for index in range(ROWS_PER_MESSAGE):
+        row = message_id * ROWS_PER_MESSAGE + index
+        rows.append(
+            f"{client_id:08x}{row:024x},A{row % 30:02d},B{row % 7},"
+            f"PT{row % 23 + 1}H{row % 59}M,B{row % 7}"
+        )
+    return ProtocolMessage(client_id, message_id, rows)
+
+
+def start_stage(delete_finished_clients):
+    log_guardian = LogGuardian()
+    initializer = CommunicationInitializer(BROKER, log_guardian, backend="MEMORY")
+    receiver = initializer.initialize_receiver(
+        INPUT,
+        "QUEUE",
+        1,
+        1,
+        use_duplicate_catcher=True,
+        delete_finished_clients=delete_finished_clients,
+    )
+    sender = initializer.initialize_sender(OUTPUT, "QUEUE")
+    connection = Connection(
+        ConnectionConfig(1, FIELDS, FIELDS, has_statefull_processor=True),
+        receiver,
+        sender,
+        log_guardian,
+        DosMasRapidos,
+    )
+    threading.Thread(target=connection.run, daemon=True).start()
+    return connection
+
+
+def start_results_receiver(finished):
+    initializer = CommunicationInitializer(
+        BROKER, LogGuardian(no_log=True), backend="MEMORY"
+    )
+    receiver = initializer.initialize_receiver(OUTPUT, "QUEUE", 1, 1)
+    receiver.bind(
+        input_callback=lambda messages: None,
+        eof_callback=lambda client_id: finished.release(),
+    )
+    threading.Thread(target=receiver.start, daemon=True).start()
+
+
+def report(session, connection, started):
+    receiver = connection.communication_receiver
+    current, _ = tracemalloc.get_traced_memory()
+    logged_state = receiver.log_guardian.storer.logged_state or {}
+    print(
+        f"{session:>9}{current / 2**20:>10.2f} MB"
+        f"{len(connection.processors):>12}"
+        f"{len(receiver.messages_received):>10}"
+        f"{len(receiver.duplicate_catchers):>12}"
+        f"{sum(len(values) for values in logged_state.values()):>14}"
+        f"{len(os.listdir()):>11}"
+        f"{time.perf_counter() - started:>10.1f} s"
+    )
+
+
+def main():
+    arguments = [argument for argument in sys.argv[1:] if not argument.startswith("--")]
+    sessions_count = int(arguments[0]) if len(arguments) > 0 else 500
+    messages_per_session = int(arguments[1]) if len(arguments) > 1 else 10
+    delete_finished_clients = "--keep-clients" not in sys.argv
+
+    with tempfile.TemporaryDirectory() as directory:
+        working_directory = os.getcwd()
+        os.chdir(directory)
+        try:
+            # DosMasRapidos prints the durations it compares
+            with contextlib.redirect_stdout(io.StringIO()):
+                connection = start_stage(delete_finished_clients)
+                finished = threading.Semaphore(0)
+                start_results_receiver(finished)
+                source = CommunicationInitializer(
+                    BROKER, LogGuardian(no_log=True), backend="MEMORY"
+                ).initialize_sender(INPUT, "QUEUE")
+
+            print(
+                f"sessions: {sessions_count}, messages per session: {messages_per_session}, "
+                f"delete finished clients: {delete_finished_clients}"
+            )
+            print(
+                f"{'sessions':>9}{'memory':>13}{'processors':>12}{'received':>10}"
+                f"{'duplicates':>12}{'logged state':>14}{'log files':>11}{'time':>12}"
+            )
+            tracemalloc.start()
+            started = time.perf_counter()
+            for client_id in range(1, sessions_count + 1):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    for message_id in range(messages_per_session):
+                        source.send_all(generate_message(client_id, message_id))
+                    source.send_eof(client_id)
+                    # The source is a client too, its count of messages sent is not needed anymore
+                    source.delete_client(client_id)
+                    if not finished.acquire(timeout=SESSION_TIMEOUT_S):
+                        raise TimeoutError(
+                            f"The session of client {client_id} did not finish"
+                        )
+                if client_id % REPORT_EVERY == 0 or client_id == sessions_count:
+                    report(client_id, connection, started)
+            tracemalloc.stop()
+        finally:
+            os.chdir(working_directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import random
+import sys
+import timeit
+import zlib
+
+sys.path.insert(0, ".")
+
+from commons.columnar import encode_columns
+from commons.flight_parser import FlightParser
+from commons.message import PayloadFormat, ProtocolMessage, ProtocolResultMessage
+from commons.protocol import ClientProtocolMessage, MessageProtocolType
+
+"""
+Benchmark of the zlib compression of the messages of each stage, reporting the bytes saved
+against the CPU cost of compressing and decompressing them, for each compression level.
+The rows are generated with the columns of the flights dataset.
+Meant to be run from the root directory.
+Usage:
+    python tools/benchmarks/compression_benchmark.py [rows_count]
+"""
+
+FLIGHT_FIELDS = [
+    "legId",
+    "searchDate",
+    "flightDate",
+    "startingAirport",
+    "destinationAirport",
+    "fareBasisCode",
+    "travelDuration",
+    "elapsedDays",
+    "isBasicEconomy",
+    "isRefundable",
+    "isNonStop",
+    "baseFare",
+    "totalFare",
+    "seatsRemaining",
+    "totalTravelDistance",
+    "segmentsDepartureTimeEpochSeconds",
+    "segmentsDepartureTimeRaw",
+    "segmentsArrivalTimeEpochSeconds",
+    "segmentsArrivalTimeRaw",
+    "segmentsArrivalAirportCode",
+    "segmentsDepartureAirportCode",
+    "segmentsAirlineName",
+    "segmentsAirlineCode",
+    "segmentsEquipmentDescription",
+    "segmentsDurationInSeconds",
+    "segmentsDistance",
+    "segmentsCabinCode",
+]
+FILTER_OUTPUT_FIELDS = [
+    "legId",
+    "startingAirport",
+    "destinationAirport",
+    "totalFare",
+    "totalTravelDistance",
+    "travelDuration",
+    "segmentsArrivalAirportCode",
+]
+AIRPORTS = ["ATL", "BOS", "CLT", "DEN", "DFW", "DTW", "EWR", "IAD", "JFK", "LAX"]
+AIRLINES = [("Delta", "DL"), ("American Airlines", "AA"), ("United", "UA")]
+LEVELS = [1, 6, 9]
+
+
+def generate_flight(random_generator):
+    starting_airport, destination_airport = random_generator.sample(AIRPORTS, 2)
+    airline_name, airline_code = random_generator.choice(AIRLINES)
+    departure = 1650000000 + random_generator.randrange(0, 5000000, 300)
+    duration = random_generator.randrange(3600, 30000, 60)
+    base_fare = round(random_generator.uniform(50, 900), 2)
+    return {
+        "legId": "%032x" % random_generator.getrandbits(128),
+        "searchDate": "2022-04-16",
+        "flightDate": "2022-04-%02d" % random_generator.randint(17, 30),
+        "startingAirport": starting_airport,
+        "destinationAirport": destination_airport,
+        "fareBasisCode": "LA0NX0MC",
+        "travelDuration": "PT%dH%dM" % (duration // 3600, duration % 3600 // 60),
+        "elapsedDays": "0",
+        "isBasicEconomy": "False",
+        "isRefundable": "False",
+        "isNonStop": "True",
+        "baseFare": str(base_fare),
+        "totalFare": str(round(base_fare * 1.1, 2)),
+        "seatsRemaining": str(random_generator.randint(1, 9)),
+        "totalTravelDistance": str(random_generator.randint(100, 2800)),
+        "segmentsDepartureTimeEpochSeconds": str(departure),
+        "segmentsDepartureTimeRaw": "2022-04-17T12:57:00.000-04:00",
+        "segmentsArrivalTimeEpochSeconds": str(departure + duration),
+        "segmentsArrivalTimeRaw": "2022-04-17T15:26:00.000-04:00",
+        "segmentsArrivalAirportCode": destination_airport,
+        "segmentsDepartureAirportCode": starting_airport,
+        "segmentsAirlineName": airline_name,
+        "segmentsAirlineCode": airline_code,
+        "segmentsEquipmentDescription": "Airbus A321",
+        "segmentsDurationInSeconds": str(duration),
+        "segmentsDistance": str(random_generator.randint(100, 2800)),
+        "segmentsCabinCode": "coach",
+    }
+
+
+def build_stages(rows_count):
+    random_generator = random.Random(0)
+    flights = [generate_flight(random_generator) for _ in range(rows_count)]
+    parser = FlightParser(",")
+    flights_lines = [parser.serialize(flight, FLIGHT_FIELDS) for flight in flights]
+    filtered_lines = [
+        parser.serialize(flight, FILTER_OUTPUT_FIELDS) for flight in flights
+    ]
+    results = "\n".join(
+        "{},{}-{}".format(
+            flight["legId"], flight["startingAirport"], flight["destinationAirport"]
+        )
+        for flight in flights
+    )
+    return {
+        "client -> server": ClientProtocolMessage(
+            1, MessageProtocolType.FLIGHT, "\n".join(flights_lines)
+        ),
+        "server -> filter": ProtocolMessage(1, 1, "\n".join(flights_lines)),
+        "filter (text)": ProtocolMessage(1, 1, "\n".join(filtered_lines)),
+        "filter (columnar)": ProtocolMessage(
+            1,
+            1,
+            encode_columns(flights, FILTER_OUTPUT_FIELDS),
+            PayloadFormat.COLUMNAR,
+        ),
+        "results": ProtocolResultMessage(1, 1, 1, results),
+    }
+
+
+def measure(function):
+    # The number of calls is adjusted so each repetition takes at least 0.2 seconds,
+    # and the best of the repetitions is the least disturbed by the rest of the system
+    number, _ = timeit.Timer(function).autorange()
+    return min(timeit.repeat(function, number=number, repeat=5)) / number
+
+
+def main():
+    rows_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    stages = build_stages(rows_count)
+
+    print(f"rows: {rows_count}")
+    print(
+        f"{'stage':<20}{'level':>6}{'bytes':>10}{'compressed':>12}{'saved':>8}"
+        f"{'compress':>14}{'decompress':>14}{'us / KB saved':>16}"
+    )
+    for name, message in stages.items():
+        message_bytes = message.to_bytes()
+        for level in LEVELS:
+            compressed = zlib.compress(message_bytes, level)
+            compress_time = measure(lambda: zlib.compress(message_bytes, level))
+            decompress_time = measure(lambda: zlib.decompress(compressed))
+            saved = len(message_bytes) - len(compressed)
+            print(
+                f"{name:<20}{level:>6}{len(message_bytes):>10}{len(compressed):>12}"
+                f"{saved / len(message_bytes):>8.0%}"
+                f"{compress_time * 1e6:>11.1f} us{decompress_time * 1e6:>11.1f} us"
+                f"{(compress_time + decompress_time) * 1e6 / (saved / 1024):>16.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
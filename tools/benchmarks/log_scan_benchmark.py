@@ -0,0 +1,169 @@
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, ".")
+
+from commons.log_storer import LogStorer
+from commons.logger import (
+    CONNECTION_LOG_FILE_PATH,
+    Logger,
+    mapped_file,
+    read_lines_reversed,
+)
+from commons.restorer import RESTORE_PROCESSES, Restorer
+
+"""
+Benchmark of the scan of large logs, like the restore after a crash does. It compares reading the
+connection log from the last line with the previous chunked reader, which decodes and splits each
+chunk, against the scan over mmap, and reports the time to restore the state of the communication
+log and to search the messages processed in it. Then the same messages are logged for several clients,
+and the restore of their shards of the communication log in the process is compared with the restore
+in parallel worker processes.
+The logs are written in a temporary directory.
+Meant to be run from the root directory.
+Usage:
+    python tools/benchmarks/log_scan_benchmark.py [messages_count]
+"""
+
+CLIENT_ID = 1
+CLIENTS_COUNT = 8
+BATCH_SIZE = 64
+
+
+def read_file_bottom_to_top_generator(filename, chunk_size=1024):
+    """
+    The previous reader of the text logs, from the end to the beginning
+    """
+    with open(filename, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        file_size = f.tell()
+        remainder = b""
+
+        while file_size > 0:
+            read_size = min(chunk_size, file_size)
+            f.seek(-read_size, os.SEEK_CUR)
+            chunk = f.read(read_size)
+            f.seek(-read_size, os.SEEK_CUR)
+            file_size -= read_size
+
+            lines = (chunk + remainder).decode("utf-8").splitlines()
+            remainder = lines[0].encode("utf-8")
+            lines.pop(0)
+
+            for line in reversed(lines):
+                yield line
+
+        if remainder:
+            yield remainder.decode("utf-8")
+
+
+def write_logs(messages_count, clients_count=1):
+    # The checkpoints are disabled, so the whole log is scanned
+    storer = LogStorer(checkpoint_interval=messages_count + 1)
+    storer.enable_group_commit()
+    messages_received = {}
+    for message_id in range(messages_count):
+        client_id = CLIENT_ID + message_id % clients_count
+        messages_received[client_id] = messages_received.get(client_id, 0) + 1
+        storer.new_message_received(message_id, client_id)
+        storer.message_sent()
+        storer.store_new_connection_message(
+            [{"legId": "%032x" % message_id, "totalFare": "245.6"}]
+        )
+        storer.store_messages_received(dict(messages_received))
+        storer.store_possible_duplicates({})
+        storer.store_messages_sent(dict(messages_received))
+        storer.finish_storing_message()
+        if (message_id + 1) % BATCH_SIZE == 0:
+            storer.persist_batch()
+            storer.commit_message()
+    storer.persist_batch()
+    storer.commit_message()
+    storer.logger.flush()
+    storer.logger.close()
+
+
+def read_connection_log_chunked(file_path):
+    return [
+        json.loads(line.split("/", 1)[1].strip())
+        for line in read_file_bottom_to_top_generator(file_path)
+    ]
+
+
+def read_last_line_chunked(file_path):
+    return next(read_file_bottom_to_top_generator(file_path))
+
+
+def read_last_line_mapped(file_path):
+    with mapped_file(file_path) as data:
+        return next(read_lines_reversed(data))
+
+
+def measure(function, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    messages_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with tempfile.TemporaryDirectory() as directory:
+        working_directory = os.getcwd()
+        os.chdir(directory)
+        try:
+            write_logs(messages_count)
+            connection_log = f"{CLIENT_ID}_{CONNECTION_LOG_FILE_PATH}"
+            logger = Logger()
+            scans = {
+                "connection log (chunked)": lambda: read_connection_log_chunked(
+                    connection_log
+                ),
+                "connection log (mmap)": lambda: logger.obtain_all_connection_messages(
+                    CLIENT_ID
+                ),
+                "last line (chunked)": lambda: read_last_line_chunked(connection_log),
+                "last line (mmap)": lambda: read_last_line_mapped(connection_log),
+                "restore": logger.restore,
+                "search processed": lambda: logger.search_processed(
+                    CLIENT_ID, [0, messages_count // 2, messages_count - 1]
+                ),
+            }
+
+            print(
+                f"messages: {messages_count}, connection log: "
+                f"{os.path.getsize(connection_log) / 2**20:.1f} MB, communication log: "
+                f"{os.path.getsize(logger.shard_file_path(CLIENT_ID)) / 2**20:.1f} MB"
+            )
+            print(f"{'scan':<28}{'time':>12}")
+            for name, function in scans.items():
+                print(f"{name:<28}{measure(function) * 1000:>9.2f} ms")
+        finally:
+            os.chdir(working_directory)
+
+    with tempfile.TemporaryDirectory() as directory:
+        working_directory = os.getcwd()
+        os.chdir(directory)
+        try:
+            write_logs(messages_count, CLIENTS_COUNT)
+            logger = Logger()
+            print(f"\nclients: {CLIENTS_COUNT}, processes: {RESTORE_PROCESSES}")
+            print(f"{'restore':<28}{'time':>12}")
+            for name, processes in [
+                ("in the process", 1),
+                ("parallel", RESTORE_PROCESSES),
+            ]:
+                elapsed = measure(lambda: Restorer.restore(logger, processes))
+                print(f"{name:<28}{elapsed * 1000:>9.2f} ms")
+        finally:
+            os.chdir(working_directory)
+
+
+if __name__ == "__main__":
+    main()
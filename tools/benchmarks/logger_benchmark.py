@@ -0,0 +1,139 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, ".")
+
+from commons.log_storer import LogStorer
+
+"""
+Benchmark of the fsync policies of the log of the messages received, reporting the messages per second
+and the fsyncs per message of each one. Each message is logged like a stateless stage does: START, SENT,
+the state of the communication and COMMIT, and it is acked after the fsync that covers its records.
+The logs are written in a temporary directory, so the results depend on the disk it is in.
+Meant to be run from the root directory.
+Usage:
+    python tools/benchmarks/logger_benchmark.py [messages_count]
+"""
+
+BATCH_SIZES = [8, 32, 128]
+INTERVALS_MS = [5, 20]
+CLIENT_ID = 1
+
+
+class FsyncCounter:
+    """
+    Counts the calls to os.fdatasync, used by the logger to sync the records, while it is active
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.fdatasync = os.fdatasync
+
+    def __enter__(self):
+        def fdatasync(fd):
+            self.count += 1
+            self.fdatasync(fd)
+
+        os.fdatasync = fdatasync
+        return self
+
+    def __exit__(self, *args):
+        os.fdatasync = self.fdatasync
+
+
+def log_message(storer, message_id):
+    storer.new_message_received(message_id, CLIENT_ID)
+    storer.message_sent()
+    storer.store_messages_received({CLIENT_ID: message_id + 1})
+    storer.store_possible_duplicates({})
+    storer.store_messages_sent({CLIENT_ID: message_id + 1})
+    storer.finish_storing_message()
+
+
+def run_always(messages_count):
+    storer = LogStorer()
+    for message_id in range(messages_count):
+        log_message(storer, message_id)
+        storer.commit_message()
+    storer.logger.close()
+    return messages_count
+
+
+def run_batch(messages_count, batch_size):
+    storer = LogStorer()
+    storer.enable_group_commit()
+    for message_id in range(messages_count):
+        log_message(storer, message_id)
+        if (message_id + 1) % batch_size == 0:
+            storer.persist_batch()
+            storer.commit_message()
+    storer.persist_batch()
+    storer.commit_message()
+    storer.logger.flush()
+    storer.logger.close()
+    return messages_count // batch_size + 1
+
+
+def run_interval(messages_count, interval_ms):
+    storer = LogStorer()
+    storer.enable_group_commit()
+    batches = 0
+    batch_start = None
+    for message_id in range(messages_count):
+        log_message(storer, message_id)
+        now = time.monotonic()
+        if batch_start is None:
+            batch_start = now
+        elif now - batch_start >= interval_ms / 1000:
+            storer.persist_batch()
+            storer.commit_message()
+            batches += 1
+            batch_start = None
+    storer.persist_batch()
+    storer.commit_message()
+    storer.logger.flush()
+    storer.logger.close()
+    return batches + 1
+
+
+def measure(function):
+    # Each policy writes new log files, so the size of the files is the same for all of them
+    with tempfile.TemporaryDirectory() as directory:
+        working_directory = os.getcwd()
+        os.chdir(directory)
+        try:
+            with FsyncCounter() as counter:
+                start = time.perf_counter()
+                acks = function()
+                elapsed = time.perf_counter() - start
+        finally:
+            os.chdir(working_directory)
+    return elapsed, acks, counter.count
+
+
+def main():
+    messages_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    policies = {"always": lambda: run_always(messages_count)}
+    for batch_size in BATCH_SIZES:
+        policies[f"batch({batch_size})"] = lambda batch_size=batch_size: run_batch(
+            messages_count, batch_size
+        )
+    for interval_ms in INTERVALS_MS:
+        policies[f"interval({interval_ms} ms)"] = (
+            lambda interval_ms=interval_ms: run_interval(messages_count, interval_ms)
+        )
+
+    print(f"messages: {messages_count}")
+    print(f"{'policy':<18}{'messages / s':>14}{'fsyncs / message':>18}{'acks':>8}")
+    for name, function in policies.items():
+        elapsed, acks, fsyncs = measure(function)
+        print(
+            f"{name:<18}{messages_count / elapsed:>14.0f}"
+            f"{fsyncs / messages_count:>18.3f}{acks:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import sys
+import timeit
+
+sys.path.insert(0, ".")
+
+import commons.message as message_module
+from commons.log_searcher import ProcessedMessage
+from commons.message import (
+    BundleMessage,
+    EOFAggregationMessage,
+    EOFDiscoveryMessage,
+    EOFFinishMessage,
+    EOFMessage,
+    EOFResultMessage,
+    Message,
+    ProtocolMessage,
+    ProtocolResultMessage,
+)
+from commons.message_utils import MessageBytesReader, MessageBytesWriter
+
+"""
+Microbenchmark of the serialization of the messages of commons/message.py, comparing the current
+MessageBytesReader/MessageBytesWriter with the previous implementation (copied below).
+The previous implementation inherits the methods added later, like the ones of the compact id lists.
+Meant to be run from the root directory.
+Usage:
+    python tools/benchmarks/message_benchmark.py [ids_count] [rows_count]
+"""
+
+
+class PreviousMessageBytesReader(MessageBytesReader):
+    def __init__(self, bytes):
+        self.buffer = bytes
+        self.offset = 0
+
+    def read(self, size):
+        if self.offset + size > len(self.buffer):
+            raise Exception("Not enough bytes to read")
+
+        bytes = self.buffer[self.offset : self.offset + size]
+        self.offset += size
+        return bytes
+
+    def read_int(self, size):
+        bytes = self.read(size)
+        return int.from_bytes(bytes, byteorder="big")
+
+    def read_multiple_int(self, size, count):
+        ints = []
+        for i in range(count):
+            ints.append(self.read_int(size))
+        return ints
+
+    def read_multiple_object(self, size, count, object_class):
+        objects = []
+        for i in range(count):
+            objects.append(object_class.from_bytes(self.read(size)))
+        return objects
+
+    def read_to_end(self):
+        bytes = self.buffer[self.offset :]
+        self.offset = len(self.buffer)
+        return bytes
+
+    def read_str_to_end(self, encoding="utf-8"):
+        return self.read_to_end().decode(encoding)
+
+
+class PreviousMessageBytesWriter(MessageBytesWriter):
+    def __init__(self):
+        self.buffer = b""
+
+    def write(self, bytes):
+        self.buffer += bytes
+
+    def write_int(self, value, size):
+        bytes = value.to_bytes(size, byteorder="big")
+        self.write(bytes)
+
+    def write_multiple_int(self, values, size):
+        for value in values:
+            self.write_int(value, size)
+
+    def get_bytes(self):
+        return self.buffer
+
+
+IMPLEMENTATIONS = {
+    "previous": (PreviousMessageBytesReader, PreviousMessageBytesWriter),
+    "current": (MessageBytesReader, MessageBytesWriter),
+}
+
+
+def use_implementation(name):
+    reader_class, writer_class = IMPLEMENTATIONS[name]
+    message_module.MessageBytesReader = reader_class
+    message_module.MessageBytesWriter = writer_class
+
+
+def build_messages(ids_count, rows_count):
+    ids = list(range(1_000_000, 1_000_000 + ids_count))
+    replicas_ids = list(range(1, 11))
+    payload = "\n".join(
+        f"{i},ATL,JFK,{i % 1000}.5,2022-04-{i % 28 + 1:02d}" for i in range(rows_count)
+    )
+    processed = [
+        ProcessedMessage(message_id, i % 2 == 0) for i, message_id in enumerate(ids)
+    ]
+    return {
+        "ProtocolMessage": ProtocolMessage(1, 10, payload),
+        "ProtocolResultMessage": ProtocolResultMessage(1, 2, 10, payload),
+        "EOFMessage": EOFMessage(1, 500, ids),
+        "EOFDiscoveryMessage": EOFDiscoveryMessage(
+            1, 500, ids, 400, 300, ids, replicas_ids
+        ),
+        "EOFAggregationMessage": EOFAggregationMessage(
+            1, 500, ids, 400, 300, ids, replicas_ids, processed
+        ),
+        "EOFFinishMessage": EOFFinishMessage(1, replicas_ids),
+        "EOFResultMessage": EOFResultMessage(1, 2, 500),
+        "BundleMessage": BundleMessage(
+            1, [ProtocolMessage(1, i, payload) for i in range(16)]
+        ),
+    }
+
+
+def measure(function):
+    # The number of calls is adjusted so each repetition takes at least 0.2 seconds,
+    # and the best of the repetitions is the least disturbed by the rest of the system
+    number, _ = timeit.Timer(function).autorange()
+    return min(timeit.repeat(function, number=number, repeat=5)) / number
+
+
+def main():
+    ids_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rows_count = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000
+    messages = build_messages(ids_count, rows_count)
+
+    print(f"ids: {ids_count}, payload rows: {rows_count}")
+    print(
+        f"{'message':<24}{'previous to_bytes':>20}{'current to_bytes':>20}"
+        f"{'previous from_bytes':>22}{'current from_bytes':>22}"
+    )
+    for name, message in messages.items():
+        results = []
+        encoded = []
+        for implementation in IMPLEMENTATIONS:
+            use_implementation(implementation)
+            message_bytes = message.to_bytes()
+            encoded.append(message_bytes)
+            results.append(
+                (
+                    measure(message.to_bytes),
+                    measure(lambda: Message.from_bytes(message_bytes)),
+                )
+            )
+        if encoded[0] != encoded[1]:
+            raise Exception(f"The implementations encode {name} differently")
+
+        (previous_to, previous_from), (current_to, current_from) = results
+        print(
+            f"{name:<24}{previous_to * 1e6:>17.1f} us{current_to * 1e6:>17.1f} us"
+            f"{previous_from * 1e6:>19.1f} us{current_from * 1e6:>19.1f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
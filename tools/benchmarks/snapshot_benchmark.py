@@ -0,0 +1,116 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, ".")
+sys.path.insert(0, "processors/dos_mas_rapidos")
+
+from commons.log_storer import LogStorer
+from commons.logger import Logger
+from dos_mas_rapidos import DosMasRapidos
+
+"""
+Benchmark of the restore of a statefull processor. It logs the batches received by a DosMasRapidos,
+like the Connection does, and compares the restore replaying all the batches of the connection log
+with the restore from the snapshot of the last checkpoint and the batches received after it.
+The logs are written in a temporary directory.
+Meant to be run from the root directory.
+Usage:
+    python tools/benchmarks/snapshot_benchmark.py [rows_count]
+"""
+
+CLIENT_ID = 1
+BATCH_SIZE = 100
+AIRPORTS_COUNT = 50
+# Batches received after the last snapshot
+TAIL_BATCHES = 10
+
+
+def generate_batch(start):
+    return [
+        {
+            "legId": "%032x" % row,
+            "startingAirport": "A%02d" % (row % AIRPORTS_COUNT),
+            "destinationAirport": "B%02d" % (row // AIRPORTS_COUNT % AIRPORTS_COUNT),
+            "travelDuration": "PT%dH%dM" % (row % 23 + 1, row % 59),
+        }
+        for row in range(start, start + BATCH_SIZE)
+    ]
+
+
+def write_logs(rows_count, snapshot):
+    """
+    Logs the batches of the rows, with a checkpoint before the last TAIL_BATCHES batches.
+    The checkpoint only takes the snapshot of the processor if snapshot is True.
+    """
+    batches_count = rows_count // BATCH_SIZE
+    processor = DosMasRapidos(CLIENT_ID)
+    storer = LogStorer(checkpoint_interval=max(batches_count - TAIL_BATCHES, 1))
+    if snapshot:
+        storer.set_snapshot_processor(lambda client_id: processor.snapshot())
+    for message_id in range(batches_count):
+        batch = generate_batch(message_id * BATCH_SIZE)
+        storer.new_message_received(message_id, CLIENT_ID)
+        storer.store_new_connection_message(batch)
+        for message in batch:
+            processor.process(message)
+        storer.store_messages_received({CLIENT_ID: message_id + 1})
+        storer.store_possible_duplicates({})
+        storer.store_messages_sent({})
+        storer.finish_storing_message()
+        storer.commit_message()
+    storer.logger.close()
+    return processor
+
+
+def restore(logger):
+    processor = DosMasRapidos(CLIENT_ID)
+    snapshot = logger.obtain_processor_snapshot(CLIENT_ID)
+    if snapshot is not None:
+        processor.restore(snapshot)
+    for batch in logger.obtain_all_connection_messages(CLIENT_ID):
+        for message in batch:
+            processor.process(message)
+    return processor
+
+
+def measure(function, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    rows_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    results = []
+    for name, snapshot in [("replay", False), ("snapshot + tail", True)]:
+        with tempfile.TemporaryDirectory() as directory:
+            working_directory = os.getcwd()
+            os.chdir(directory)
+            try:
+                # DosMasRapidos prints the durations it compares
+                with contextlib.redirect_stdout(io.StringIO()):
+                    processor = write_logs(rows_count, snapshot)
+                    logger = Logger()
+                    assert restore(logger).trajectory == processor.trajectory
+                    elapsed = measure(lambda: restore(logger))
+                size = sum(os.path.getsize(file) for file in os.listdir())
+                results.append((name, size, elapsed))
+            finally:
+                os.chdir(working_directory)
+
+    print(f"rows: {rows_count}, rows after the snapshot: {TAIL_BATCHES * BATCH_SIZE}")
+    print(f"{'restore':<28}{'logs':>12}{'time':>12}")
+    for name, size, elapsed in results:
+        print(f"{name:<28}{size / 2**20:>9.1f} MB{elapsed * 1000:>9.2f} ms")
+
+
+if __name__ == "__main__":
+    main()